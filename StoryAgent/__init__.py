@@ -3,16 +3,38 @@
 
 """
 StoryAgent package for multi-agent story generation.
+
+The names below are imported on first access, so that importing the package
+does not load LangChain, LangGraph or the LLM clients.
 """
 
-from .agents import ActorAgent, ControllerAgent, WriterAgent, AgentState
-from .config import WorldInfo, ActorInfo
-
-__all__ = [
-    'ActorAgent',
-    'ControllerAgent',
-    'WriterAgent',
-    'AgentState',
-    'WorldInfo',
-    'ActorInfo'
-]
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .agents import ActorAgent, ControllerAgent, WriterAgent, AgentState
+    from .config import WorldInfo, ActorInfo
+    from .workflow import create_workflow, create_initial_state
+
+_exports = {
+    'ActorAgent': '.agents',
+    'ControllerAgent': '.agents',
+    'WriterAgent': '.agents',
+    'AgentState': '.agents',
+    'WorldInfo': '.config',
+    'ActorInfo': '.config',
+    'create_workflow': '.workflow',
+    'create_initial_state': '.workflow'
+}
+
+__all__ = list(_exports)
+
+def __getattr__(name: str) -> Any:
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
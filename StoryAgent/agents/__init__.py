@@ -1,15 +1,36 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .agent import AgentState
-from .actor import ActorAgent
-from .controller import ControllerAgent
-from .writer import WriterAgent
-
-__all__ = [
-    "AgentState",
-    "ActorAgent",
-    "ControllerAgent",
-    "WriterAgent"
-]
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
+if TYPE_CHECKING:
+    from .agent import AgentState
+    from .message import Message, MessageLog
+    from .parser import TagParser
+    from .actor import ActorAgent
+    from .controller import ControllerAgent
+    from .writer import WriterAgent
+
+# Imported on first access, see StoryAgent/__init__.py
+_exports = {
+    "AgentState": ".agent",
+    "Message": ".message",
+    "MessageLog": ".message",
+    "TagParser": ".parser",
+    "ActorAgent": ".actor",
+    "ControllerAgent": ".controller",
+    "WriterAgent": ".writer"
+}
+
+__all__ = list(_exports)
+
+def __getattr__(name: str) -> Any:
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -6,38 +6,52 @@ Actor agent implementation for story generation.
 """
 
 import logging
-import re
-from typing import List, Tuple
+from typing import Dict, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
 from .agent import BaseAgent, AgentState
+from .history import render_history
 from .llm import get_llm
+from .message import Message
+from .parser import ParsedOutput, TagParser, parse_metrics
+from .prompt import PromptBuilder, check_layout, render_round
+from .stream import StreamSink
+from .trace import timed
 from ..config import ActorInfo
 
+_TASK = """Please respond as your character, maintaining your personality traits and staying in character. Your response should be natural and engaging, reflecting your character's unique personality. Your response should also advance the overall story. In your response, you are allowed to do the following:
+
+1. Thinking. You can simulate the development of the event in your mind, or conjecture other characters' internal activities, etc. You must place your thoughts (i.e., what is going on in your own mind) in between <think> and </think> tags.
+2. Speaking. You need to speak in first person. The words you speak must be placed between <speak> and </speak> tags.
+3. Action. Besides physical actions, you can also take actions such as gestures, expressions, etc. The action you take must be placed between <action> and </action> tags.
+
+There are some IMPORTANT NOTES for you:
+1. Your thoughts are only visible to yourself, and so do other characters. Specifically, in the role-playing history, you are the only one who can see your own thoughts, and for other characters, they can only see your words and actions.
+2. Your words and actions must be consistent with your character's personality and your thoughts.
+"""
+
 class ActorAgent(BaseAgent):
     """Actor agent that plays a character in the story."""
     
-    def __init__(self, actor_id: str, actor_info: ActorInfo, model: str = "deepseek-chat"):
-        """Initialize actor agent with character configuration."""
+    def __init__(self, actor_id: str, actor_info: ActorInfo, model: str = "deepseek-chat",
+                 sinks: Sequence[StreamSink] = (), layout: str = "classic"):
+        """Initialize actor agent with character configuration, `layout` is one of PROMPT_LAYOUTS."""
         super().__init__()
         self.actor_id = actor_id
         self.actor_info = actor_info
         self.logger = logging.getLogger(f"Actor.{self.actor_id}")
         self.llm = get_llm(model=model)
+        self.sinks = sinks
+        self.prompt = PromptBuilder(self._render_message)
+        self.layout = check_layout(layout)
         self.logger.info(f"Actor.{self.actor_id} initialized with {model}")
 
-    def _filter_thoughts(self, messages: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
-        """Filter out the thoughts from the messages."""
-        filtered_messages = []
-        for sender, content in messages:
-            if sender == self.actor_info.name:
-                filtered_messages.append((sender, content))
-            else:
-                filtered_content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
-                filtered_messages.append((sender, filtered_content))
-        return filtered_messages
+    def _render_message(self, message: Message) -> str:
+        """Render a round of the history with the thoughts of other actors filtered out."""
+        return render_round(message.sender, message.view(self.actor_info.name))
 
-    def _gen_prompt(self, state: AgentState) -> str:
-        """Generate prompt for the actor agent."""
-        prompt = f"""You are participating a role-playing game. You will be playing a character in a fictional world. You should act according to your character settings and respond to the world and other characters. Your input contains the detailed description of your character, the brief descriptions of other characters, the world state, and the conversation history. The input texts are listed below.
+    def _render_cast(self, actors: Dict[str, ActorInfo]) -> str:
+        """Render the instructions and the characters, up to the world."""
+        return f"""You are participating a role-playing game. You will be playing a character in a fictional world. You should act according to your character settings and respond to the world and other characters. Your input contains the detailed description of your character, the brief descriptions of other characters, the world state, and the conversation history. The input texts are listed below.
         
 ## Character Description
 
@@ -45,38 +59,84 @@ class ActorAgent(BaseAgent):
 
 ## Other Characters
 
-{"\n".join(f"### {actor_info.name}\n{actor_info.brief()}\n" for actor_id, actor_info in state["actors"].items() if actor_id != self.actor_id)}
+{"\n".join(f"### {actor_info.name}\n{actor_info.brief()}\n" for actor_id, actor_info in actors.items() if actor_id != self.actor_id)}
 
-## World State
+"""
 
-{state["world_state"]}
+    def _render_static(self, actors: Dict[str, ActorInfo]) -> str:
+        """Render the sections of the prompt that are fixed for a session."""
+        return f"""{self._render_cast(actors)}## World State
 
-## Role Play History
+"""
 
-{"\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in self._filter_thoughts(state["messages"]))}
+    def _render_prefix_static(self, actors: Dict[str, ActorInfo], world: str) -> str:
+        """Render everything that is fixed for a session, the task included, for the prefix layout."""
+        return f"""{self._render_cast(actors)}## World
 
-Please respond as your character, maintaining your personality traits and staying in character. Your response should be natural and engaging, reflecting your character's unique personality. Your response should also advance the overall story. In your response, you are allowed to do the following:
+{world}
 
-1. Thinking. You can simulate the development of the event in your mind, or conjecture other characters' internal activities, etc. You must place your thoughts (i.e., what is going on in your own mind) in between <think> and </think> tags.
-2. Speaking. You need to speak in first person. The words you speak must be placed between <speak> and </speak> tags.
-3. Action. Besides physical actions, you can also take actions such as gestures, expressions, etc. The action you take must be placed between <action> and </action> tags.
+## Task
+
+{_TASK}
+## Role Play History
 
-There are some IMPORTANT NOTES for you:
-1. Your thoughts are only visible to yourself, and so do other characters. Specifically, in the role-playing history, you are the only one who can see your own thoughts, and for other characters, they can only see your words and actions.
-2. Your words and actions must be consistent with your character's personality and your thoughts.
 """
+
+    def _gen_prompt(self, state: AgentState) -> str:
+        """Generate prompt for the actor agent."""
+        if self.layout == "prefix":
+            return self._gen_prefix_prompt(state)
+        prompt = f"""{self.prompt.static(state["actors"], self._render_static)}{state["world_state"]}
+
+## Role Play History
+
+{render_history(self.prompt, state)}
+
+{_TASK}"""
         return prompt
 
-    def __call__(self, state: AgentState) -> AgentState:
+    def _gen_prefix_prompt(self, state: AgentState) -> str:
+        """Generate a prompt in the prefix layout: the static sections and the task,
+        then the history, and the current state last."""
+        world = state["world_state"]
+        return f"""{self.prompt.static(state["actors"], self._render_prefix_static, world.setting())}{render_history(self.prompt, state)}
+
+## Current State
+
+{world.state}
+
+Please respond as {self.actor_info.name} now."""
+
+    def _next_state(self, state: AgentState, output: ParsedOutput) -> AgentState:
+        """State update appending the response of the actor to the history."""
+        if not self.sinks:
+            self.logger.info(output.text)
+        parse_metrics.count("actor_outputs")
+        if output.recovered:
+            parse_metrics.count("actor_recovered")
+        if not any(segment.tag in ("speak", "action") for segment in output.segments):
+            parse_metrics.count("actor_untagged")
+            self.logger.warning("Response without <speak> or <action> tags")
+        update = AgentState(messages=[Message.from_output(self.actor_info.name, output)])
+        if len(state.get("current_actors") or ()) <= 1:
+            # Actors acting at the same time leave the current actor to the controller
+            update["current_actor"] = self.actor_id
+        return update
+
+    def __call__(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
         """Process the current state and return the next state."""
         self.logger.info(f"Actor.{self.actor_id} is acting...")
-        prompt = self._gen_prompt(state)
-        response = self.llm.invoke([{"role": "user", "content": prompt}])
-        new_message = response.content
-        self.logger.info(new_message)
-        return AgentState(
-            messages=state["messages"] + [(self.actor_info.name, new_message)],
-            actors=state["actors"],
-            current_actor=self.actor_id,
-            world_state=state["world_state"]
-        )
\ No newline at end of file
+        with timed("prompt_build"):
+            prompt = self._gen_prompt(state)
+        parser = TagParser()
+        self._complete(prompt, config, parser)
+        return self._next_state(state, parser.close())
+
+    async def acall(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+        """Process the current state and return the next state asynchronously."""
+        self.logger.info(f"Actor.{self.actor_id} is acting...")
+        with timed("prompt_build"):
+            prompt = self._gen_prompt(state)
+        parser = TagParser()
+        await self._acomplete(prompt, config, parser)
+        return self._next_state(state, parser.close())
\ No newline at end of file
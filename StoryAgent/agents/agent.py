@@ -1,22 +1,130 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
 import logging
-from typing import TypedDict, Annotated, Sequence, NamedTuple, Dict, List, Tuple
+from typing import TypedDict, Annotated, Sequence, Dict, List, Any, Optional
 from abc import ABC, abstractmethod
+from langchain_core.runnables import RunnableConfig
 from ..config.config import WorldInfo, ActorInfo
+from .message import MessageLog, append_messages
+from .parser import TagParser
+from .prompt import estimate_tokens
+from .stream import StreamSink
+from .trace import record_llm_call, response_usage
 
 class AgentState(TypedDict):
-    messages: Annotated[List[Tuple[str, str]], "Message history (id -> content)"]
+    messages: Annotated[MessageLog, "Message history (sender -> parsed content)", append_messages]
     actors: Annotated[Dict[str, ActorInfo], "Actor list (id -> info)"]
     current_actor: Annotated[str, "Current acting actor"] 
+    current_actors: Annotated[List[str], "Actors authorized to act at the same time in the next round"]
     world_state: Annotated[WorldInfo, "Current world state"]
+    summary: Annotated[str, "Summary of the rounds folded out of the prompts"]
+    summarized: Annotated[int, "Number of leading rounds covered by the summary"]
+    rounds: Annotated[int, "Number of rounds the controller has completed"]
+
+def llm_options(config: Optional[RunnableConfig]) -> Dict[str, Any]:
+    """Extra options of the LLM calls taken from the run configuration."""
+    seed = ((config or {}).get("configurable") or {}).get("seed")
+    return {} if seed is None else {"seed": seed}
 
 class BaseAgent(ABC):
+    # Subclasses set the logger and the LLM, and the sinks to stream the responses to
+    logger: logging.Logger
+    llm: Any
+    sinks: Sequence[StreamSink] = ()
+
     @abstractmethod
     def __init__(self):
         pass
 
+    def _stream_start(self) -> str:
+        for sink in self.sinks:
+            sink.start(self.logger.name)
+        return self.logger.name
+
+    def _stream_end(self, name: str, chunks: List[str], start: float, first: Optional[float]) -> str:
+        for sink in self.sinks:
+            sink.end(name)
+        if first is not None:
+            self.logger.info(f"Time to first token: {first - start:.3f}s, "
+                             f"full response: {time.perf_counter() - start:.3f}s")
+        return "".join(chunks)
+
+    @staticmethod
+    def _record(prompt: str, response: Any, start: float) -> str:
+        """Add the call to the trace of the node, if traced, and return the response text."""
+        record_llm_call(prompt, response.content, time.perf_counter() - start,
+                        response_usage(response))
+        return response.content
+
+    @staticmethod
+    def _feed(parser: Optional[TagParser], text: str) -> str:
+        if parser is not None:
+            parser.feed(text)
+        return text
+
+    def _complete(self, prompt: str, config: Optional[RunnableConfig] = None,
+                  parser: Optional[TagParser] = None) -> str:
+        """Send the prompt to the LLM and return the response text.
+
+        With sinks the response is streamed to them as it arrives and joined
+        only once at the end. The response is also fed to the parser, if given,
+        chunk by chunk when streamed.
+        """
+        self.logger.info(f"Prompt: ~{estimate_tokens(prompt)} tokens")
+        messages = [{"role": "user", "content": prompt}]
+        start = time.perf_counter()
+        if not self.sinks:
+            response = self.llm.invoke(messages, **llm_options(config))
+            return self._feed(parser, self._record(prompt, response, start))
+        name = self._stream_start()
+        chunks, first, usage = [], None, None
+        for chunk in self.llm.stream(messages, **llm_options(config)):
+            usage = response_usage(chunk) or usage
+            if not chunk.content:
+                continue
+            if first is None:
+                first = time.perf_counter()
+            chunks.append(chunk.content)
+            if parser is not None:
+                parser.feed(chunk.content)
+            for sink in self.sinks:
+                sink.write(name, chunk.content)
+        text = self._stream_end(name, chunks, start, first)
+        record_llm_call(prompt, text, time.perf_counter() - start, usage)
+        return text
+
+    async def _acomplete(self, prompt: str, config: Optional[RunnableConfig] = None,
+                         parser: Optional[TagParser] = None) -> str:
+        """Asynchronous version of _complete."""
+        self.logger.info(f"Prompt: ~{estimate_tokens(prompt)} tokens")
+        messages = [{"role": "user", "content": prompt}]
+        start = time.perf_counter()
+        if not self.sinks:
+            response = await self.llm.ainvoke(messages, **llm_options(config))
+            return self._feed(parser, self._record(prompt, response, start))
+        name = self._stream_start()
+        chunks, first, usage = [], None, None
+        async for chunk in self.llm.astream(messages, **llm_options(config)):
+            usage = response_usage(chunk) or usage
+            if not chunk.content:
+                continue
+            if first is None:
+                first = time.perf_counter()
+            chunks.append(chunk.content)
+            if parser is not None:
+                parser.feed(chunk.content)
+            for sink in self.sinks:
+                sink.write(name, chunk.content)
+        text = self._stream_end(name, chunks, start, first)
+        record_llm_call(prompt, text, time.perf_counter() - start, usage)
+        return text
+
+    @abstractmethod
+    def __call__(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+        pass
+
     @abstractmethod
-    def __call__(self, state: AgentState) -> AgentState:
+    async def acall(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
         pass
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Response cache for the chat models, keyed by model, temperature and prompt.
+"""
+
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+def cache_key(model: str, temperature: float, messages: Sequence[Any], **options: Any) -> str:
+    """Hash of everything that determines the response of a call."""
+    normalized = [
+        (message.type, message.content) if isinstance(message, BaseMessage)
+        else (message["role"], message["content"])
+        for message in messages
+    ]
+    payload = json.dumps([model, temperature, normalized, sorted(options.items())],
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache(ABC):
+    """Cache of response texts with hit/miss counters.
+
+    aget and aput are the versions for event loops. They run get and put
+    directly, caches that block on I/O run them in a thread instead.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_age: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._counts_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get(key)
+        with self._counts_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        self._put(key, value)
+
+    async def aget(self, key: str) -> Optional[str]:
+        return self.get(key)
+
+    async def aput(self, key: str, value: str):
+        self.put(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counts_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def _put(self, key: str, value: str):
+        pass
+
+class MemoryCache(ResponseCache):
+    """In-memory LRU cache."""
+
+    def __init__(self, max_entries: int = 10000, max_age: Optional[float] = None):
+        super().__init__(max_entries, max_age)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self.max_age is not None and time.time() - created > self.max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteCache(ResponseCache):
+    """On-disk cache in a SQLite file, least recently used entries are evicted first.
+
+    Hits only read: their access times are kept in memory and written with the
+    next put, or after `flush_every` hits. Entries over the limit or too old are
+    evicted every `evict_every` puts, so the file may briefly hold up to that
+    many entries more than `max_entries`. Asynchronous calls run in a thread.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, max_age: Optional[float] = None,
+                 flush_every: int = 64, evict_every: int = 100):
+        super().__init__(max_entries, max_age)
+        self.path = path
+        self.flush_every = flush_every
+        self.evict_every = evict_every
+        self._accessed: Dict[str, float] = {}
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.max_age is not None and now - created > self.max_age:
+                return None  # Deleted by the next eviction
+            self._accessed[key] = now
+            if len(self._accessed) >= self.flush_every:
+                self._flush()
+                self._conn.commit()
+            return value
+
+    def _flush(self):
+        """Write the pending access times, the lock held."""
+        if self._accessed:
+            self._conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def _evict(self, now: float):
+        """Delete the entries too old or over the limit, the lock held."""
+        if self.max_age is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def _put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._flush()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now))
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value: str):
+        await asyncio.to_thread(self.put, key, value)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._evict(time.time())
+            self._conn.commit()
+            self._conn.close()
+
+class TieredCache(ResponseCache):
+    """In-memory LRU in front of an on-disk cache. Disk hits are promoted to memory."""
+
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache):
+        super().__init__(disk.max_entries, disk.max_age)
+        self.memory = memory
+        self.disk = disk
+
+    def _get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def _put(self, key: str, value: str):
+        self.memory.put(key, value)
+        self.disk.put(key, value)
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None:
+            value = await self.disk.aget(key)
+            if value is not None:
+                self.memory.put(key, value)
+        with self._counts_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    async def aput(self, key: str, value: str):
+        self.memory.put(key, value)
+        await self.disk.aput(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "memory": self.memory.stats(), "disk": self.disk.stats()}
+
+    def close(self):
+        self.disk.close()
+
+def create_cache(kind: str, path: str = ".story_cache.sqlite", max_entries: int = 10000,
+                 max_age: Optional[float] = None) -> Optional[ResponseCache]:
+    """Create a response cache by name: "none", "memory", "sqlite" or "tiered"."""
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return MemoryCache(max_entries, max_age)
+    if kind == "sqlite":
+        return SQLiteCache(path, max_entries, max_age)
+    if kind == "tiered":
+        return TieredCache(MemoryCache(max_entries, max_age), SQLiteCache(path, max_entries, max_age))
+    raise ValueError(f"Unknown cache - {kind}. Use one of: none, memory, sqlite, tiered")
+
+class CachedChatModel:
+    """Chat model wrapper that answers repeated calls from a response cache."""
+
+    def __init__(self, llm: Any, cache: ResponseCache, model: str, temperature: float):
+        self.llm = llm
+        self.cache = cache
+        self.model = model
+        self.temperature = temperature
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _key(self, messages: Sequence[Any], **kwargs: Any) -> str:
+        return cache_key(self.model, self.temperature, messages, **kwargs)
+
+    def invoke(self, messages: Sequence[Any], **kwargs: Any) -> BaseMessage:
+        key = self._key(messages, **kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return AIMessage(content=cached, response_metadata={"cache_hit": True})
+        response = self.llm.invoke(messages, **kwargs)
+        if isinstance(response.content, str):
+            self.cache.put(key, response.content)
+        return response
+
+    async def ainvoke(self, messages: Sequence[Any], **kwargs: Any) -> BaseMessage:
+        key = self._key(messages, **kwargs)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return AIMessage(content=cached, response_metadata={"cache_hit": True})
+        response = await self.llm.ainvoke(messages, **kwargs)
+        if isinstance(response.content, str):
+            await self.cache.aput(key, response.content)
+        return response
+
+    def stream(self, messages: Sequence[Any], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        key = self._key(messages, **kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached, response_metadata={"cache_hit": True})
+            return
+        chunks = []
+        for chunk in self.llm.stream(messages, **kwargs):
+            if isinstance(chunk.content, str):
+                chunks.append(chunk.content)
+            yield chunk
+        self.cache.put(key, "".join(chunks))
+
+    async def astream(self, messages: Sequence[Any], **kwargs: Any) -> AsyncIterator[AIMessageChunk]:
+        key = self._key(messages, **kwargs)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached, response_metadata={"cache_hit": True})
+            return
+        chunks = []
+        async for chunk in self.llm.astream(messages, **kwargs):
+            if isinstance(chunk.content, str):
+                chunks.append(chunk.content)
+            yield chunk
+        await self.cache.aput(key, "".join(chunks))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Chunked writing of long stories: the transcript is split into chapters on a
+token budget, preferably at scene boundaries, the chapters are drafted
+concurrently, each with a synopsis of the latest chapters before it, and the seams
+between them are smoothed by a light continuity pass. Every LLM result is
+cached by its prompt, so a rerun only regenerates the chapters that changed.
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from .agent import AgentState
+from .cache import MemoryCache, ResponseCache, SQLiteCache, cache_key
+from .message import Message
+from .prompt import PromptBuilder, estimate_tokens, render_message, render_round
+from .trace import record_llm_call, response_usage
+from ..config import ActorInfo, WorldInfo
+
+# Rounds looked at on each side of a possible chapter break
+_SCENE_WINDOW = 3
+# Paragraphs on each side of a seam given to the continuity pass
+_SEAM_PARAGRAPHS = 2
+_CHAPTER_BREAK = "\n\n* * *\n\n"
+
+@dataclass
+class ChapterPlan:
+    """Split the transcript into chapters of about `token_budget` estimated
+    tokens, and run at most `concurrency` LLM calls at a time. The synopsis of
+    a chapter holds the summaries of the chapters before it, the latest ones
+    within `synopsis_tokens`. Results are cached in the SQLite file
+    `cache_path`, or in memory if None."""
+    token_budget: int = 6000
+    concurrency: int = 4
+    cache_path: Optional[str] = None
+    synopsis_tokens: int = 1500
+
+# Process-wide chapter caches by path, shared by the writers of all workflows
+_caches: Dict[str, SQLiteCache] = {}
+_caches_lock = threading.Lock()
+
+def chapter_cache(path: str) -> SQLiteCache:
+    """The chapter cache in the SQLite file `path`, opened on first use."""
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = SQLiteCache(path)
+        return cache
+
+def close_chapter_caches():
+    """Close the chapter caches opened by chapter_cache."""
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
+
+def _speakers(messages: Sequence[Message]) -> Set[str]:
+    return {msg.sender for msg in messages}
+
+def _scene_break(messages: Sequence[Message], start: int, end: int, earliest: int) -> int:
+    """Best place to end the chapter messages[start:end], between `earliest` and
+    `end`: the break after which the fewest of the characters of the preceding
+    rounds go on acting, i.e. where the cast of the scene changes the most,
+    the earliest of equally good ones. Only rounds of the chapter are looked
+    at, so that the break does not move when the transcript grows. Returns
+    `end` if no break changes the cast."""
+    best, best_shared = end, None
+    for cut in range(max(earliest, start + 1), end):
+        before = _speakers(messages[max(start, cut - _SCENE_WINDOW):cut])
+        shared = len(before & _speakers(messages[cut:min(end, cut + _SCENE_WINDOW)]))
+        if shared < len(before) and (best_shared is None or shared < best_shared):
+            best, best_shared = cut, shared
+    return best
+
+def split_chapters(messages: Sequence[Message], token_budget: int) -> List[Tuple[int, int]]:
+    """Split the rounds into chapters, returned as (start, end) index ranges.
+
+    A chapter is closed once its rounds reach the token budget, at the scene
+    boundary found in its last quarter, if any. Closed chapters depend only on
+    their own rounds, so the chapters of a transcript stay the same when more
+    rounds are added and only the last one grows.
+    """
+    tokens = [estimate_tokens(render_message(msg)) for msg in messages]
+    chapters, start, total = [], 0, 0
+    for i, count in enumerate(tokens):
+        total += count
+        if total < token_budget:
+            continue
+        earliest, filled = start, 0
+        while filled + tokens[earliest] <= token_budget * 3 // 4:
+            filled += tokens[earliest]
+            earliest += 1
+        end = _scene_break(messages, start, i + 1, earliest)
+        chapters.append((start, end))
+        start, total = end, sum(tokens[end:i + 1])
+    if start < len(messages):
+        chapters.append((start, len(messages)))
+    return chapters
+
+def _paragraphs(text: str) -> List[str]:
+    return [part.strip() for part in re.split(r"\n\s*\n", text) if part.strip()]
+
+def _seam(chapter: str) -> Tuple[List[str], int]:
+    """The paragraphs of a chapter and how many of them open it, for the continuity pass."""
+    paragraphs = _paragraphs(chapter)
+    return paragraphs, min(_SEAM_PARAGRAPHS, max(1, len(paragraphs) // 2))
+
+class ChapterWriter:
+    """Writes a story chapter by chapter: summaries of the chapters, then the
+    drafts, then the seams, every stage running its LLM calls concurrently."""
+
+    def __init__(self, plan: ChapterPlan, llm: Any, model: str, lang: str):
+        self.plan = plan
+        self.llm = llm
+        self.model = model
+        self.lang = lang
+        self.prompt = PromptBuilder()
+        self.logger = logging.getLogger("Story.Chapters")
+        self._lock = threading.Lock()
+        self._cache: Optional[ResponseCache] = None
+
+    @property
+    def cache(self) -> ResponseCache:
+        """The cache of the results, opened when the first chapters are written."""
+        with self._lock:
+            if self._cache is None:
+                self._cache = chapter_cache(self.plan.cache_path) if self.plan.cache_path else MemoryCache()
+            return self._cache
+
+    def split(self, state: AgentState) -> List[Tuple[int, int]]:
+        return split_chapters(state["messages"], self.plan.token_budget)
+
+    def _render_static(self, actors: Dict[str, ActorInfo], world: WorldInfo) -> str:
+        return f"""You are a story writer. You are writing a novel chapter by chapter, based on the transcript of a role-playing game. In the role-playing game, there are several characters interacting with each other in a fictional world. You are supposed to read the rounds of one chapter of the game, and write that chapter of the story. Your input includes the detailed description of the world, the detailed descriptions of the characters, a synopsis of the story so far, and the rounds of the chapter. The input texts are listed below.
+
+## Characters
+
+{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in actors.items())}
+
+## World
+
+{world.setting()}
+
+"""
+
+    def _gen_summary_prompt(self, number: int, rounds: Sequence[Message]) -> str:
+        return f"""You are keeping the summary of a novel written from the transcript of a role-playing game. Below are the rounds of one chapter. Only the words and actions of the characters are shown.
+
+## Rounds of Chapter {number}
+
+{"\n".join(render_round(msg.sender, msg.public) for msg in rounds)}
+
+Please summarize the chapter in a few sentences: who did and said what, and what changed for the characters, their conflicts and the items that matter. Be brief, and output the summary only."""
+
+    def _gen_chapter_prompt(self, state: AgentState, number: int, rounds: Sequence[Message],
+                            synopsis: str, last: bool) -> str:
+        ending = ("This is the last chapter, bring the story to its end." if last
+                  else "Do not end the story, it goes on in the next chapter.")
+        return f"""{self.prompt.static(state["actors"], self._render_static, state["world_state"])}## Story So Far
+
+{synopsis or "(This is the first chapter.)"}
+
+## Rounds of This Chapter
+
+{"\n".join(render_message(msg) for msg in rounds)}
+
+Please write chapter {number} of the story based on the above rounds. You should maintain the characters' personalities. You should make the story not only interesting and vivid, but also conforming to the script.
+
+There are some IMPORTANT NOTES for you:
+1. You need to write the story in {self.lang}.
+2. You must follow the rounds strictly. You are not supposed to add or remove any plots into or out of the script. If you find the script not smooth enough, you can slightly modify the script to make the story smoother.
+3. Continue from the story so far without retelling it. {ending}
+4. Output the text of the chapter only, without a title."""
+
+    def _gen_seam_prompt(self, number: int, tail: Sequence[str], head: Sequence[str]) -> str:
+        return f"""You are a story writer, polishing the seam between two chapters of a novel that were written separately. Below are the end of chapter {number} and the beginning of chapter {number + 1}.
+
+## End of Chapter {number}
+
+{"\n\n".join(tail)}
+
+## Beginning of Chapter {number + 1}
+
+{"\n\n".join(head)}
+
+Please rewrite the beginning of chapter {number + 1} so that it follows on smoothly from the end of chapter {number}: no repeated events or descriptions, no contradictions, and consistent names and tone. Keep its events and about its length. Write in {self.lang}, and output the rewritten beginning only."""
+
+    def _synopses(self, summaries: Sequence[str]) -> List[str]:
+        """The synopsis given to every chapter: the summaries of the latest chapters
+        before it within the synopsis budget, and at least the one of the previous chapter."""
+        tokens = [estimate_tokens(summary) for summary in summaries]
+        synopses, first, total = [""], 0, 0
+        for number in range(1, len(summaries) + 1):
+            total += tokens[number - 1]
+            while first < number - 1 and total > self.plan.synopsis_tokens:
+                total -= tokens[first]
+                first += 1
+            synopses.append("\n\n".join(summaries[first:number]))
+        return synopses
+
+    def _stitch(self, drafts: Sequence[str], heads: Sequence[str]) -> str:
+        """Join the drafts, the beginnings of all chapters but the first replaced by the rewritten ones."""
+        chapters = [drafts[0].strip()]
+        for draft, head in zip(drafts[1:], heads):
+            paragraphs, opening = _seam(draft)
+            chapters.append("\n\n".join([head.strip(), *paragraphs[opening:]]))
+        return _CHAPTER_BREAK.join(chapters)
+
+    def _seam_prompts(self, drafts: Sequence[str]) -> List[str]:
+        prompts = []
+        for number in range(1, len(drafts)):
+            previous, opening = _seam(drafts[number - 1])
+            tail = previous[max(opening, len(previous) - _SEAM_PARAGRAPHS):] or previous[-1:]
+            paragraphs, opening = _seam(drafts[number])
+            prompts.append(self._gen_seam_prompt(number, tail, paragraphs[:opening]))
+        return prompts
+
+    def _key(self, prompt: str, options: Dict[str, Any]) -> str:
+        return cache_key(self.model, 0.0, [{"role": "user", "content": prompt}], **options)
+
+    def _record(self, prompt: str, response: Any, start: float) -> str:
+        with self._lock:
+            record_llm_call(prompt, response.content, time.perf_counter() - start,
+                            response_usage(response))
+        return response.content.strip()
+
+    def _invoke(self, prompt: str, options: Dict[str, Any]) -> Tuple[str, bool]:
+        """Return the result of the prompt and whether it was cached."""
+        key = self._key(prompt, options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+        start = time.perf_counter()
+        text = self._record(prompt, self.llm.invoke([{"role": "user", "content": prompt}], **options), start)
+        self.cache.put(key, text)
+        return text, False
+
+    async def _ainvoke(self, prompt: str, options: Dict[str, Any],
+                       semaphore: asyncio.Semaphore) -> Tuple[str, bool]:
+        key = self._key(prompt, options)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return cached, True
+        async with semaphore:
+            start = time.perf_counter()
+            response = await self.llm.ainvoke([{"role": "user", "content": prompt}], **options)
+        text = self._record(prompt, response, start)
+        await self.cache.aput(key, text)
+        return text, False
+
+    def _log(self, chapters: Sequence[Tuple[int, int]], start: float, results: Sequence[Tuple[str, bool]]):
+        # Counted from the results, the cache may be shared with other stories
+        self.logger.info(f"Wrote {len(chapters)} chapters of "
+                         f"{', '.join(str(end - begin) for begin, end in chapters)} rounds "
+                         f"in {time.perf_counter() - start:.2f}s, "
+                         f"{sum(cached for _, cached in results)} results cached")
+
+    def write(self, state: AgentState, chapters: Sequence[Tuple[int, int]],
+              options: Dict[str, Any]) -> str:
+        """Write the story of the given chapters, the LLM calls of a stage running in threads."""
+        start, results = time.perf_counter(), []
+        messages = state["messages"]
+        with ThreadPoolExecutor(max_workers=self.plan.concurrency) as pool:
+            def run(prompts: Sequence[str]) -> List[str]:
+                # Every call in a copy of the context, so that it is traced in the record of the writer
+                futures = [pool.submit(copy_context().run, self._invoke, prompt, options) for prompt in prompts]
+                stage = [future.result() for future in futures]
+                results.extend(stage)
+                return [text for text, _ in stage]
+            summaries = run([self._gen_summary_prompt(number, messages[begin:end])
+                             for number, (begin, end) in enumerate(chapters[:-1], 1)])
+            drafts = run([self._gen_chapter_prompt(state, number, messages[begin:end], synopsis,
+                                                   number == len(chapters))
+                          for number, ((begin, end), synopsis)
+                          in enumerate(zip(chapters, self._synopses(summaries)), 1)])
+            heads = run(self._seam_prompts(drafts))
+        self._log(chapters, start, results)
+        return self._stitch(drafts, heads)
+
+    async def awrite(self, state: AgentState, chapters: Sequence[Tuple[int, int]],
+                     options: Dict[str, Any]) -> str:
+        """Asynchronous version of write, the LLM calls of a stage running as tasks."""
+        start, results = time.perf_counter(), []
+        messages = state["messages"]
+        semaphore = asyncio.Semaphore(self.plan.concurrency)
+
+        async def run(prompts: Sequence[str]) -> List[str]:
+            stage = await asyncio.gather(*(self._ainvoke(prompt, options, semaphore) for prompt in prompts))
+            results.extend(stage)
+            return [text for text, _ in stage]
+        summaries = await run([self._gen_summary_prompt(number, messages[begin:end])
+                               for number, (begin, end) in enumerate(chapters[:-1], 1)])
+        drafts = await run([self._gen_chapter_prompt(state, number, messages[begin:end], synopsis,
+                                                     number == len(chapters))
+                            for number, ((begin, end), synopsis)
+                            in enumerate(zip(chapters, self._synopses(summaries)), 1)])
+        heads = await run(self._seam_prompts(drafts))
+        self._log(chapters, start, results)
+        return self._stitch(drafts, heads)
@@ -6,68 +6,296 @@ Controller agent implementation for story generation.
 """
 
 import logging
-import re
+from typing import Any, Dict, List, Optional
+from langchain_core.runnables import RunnableConfig
 from .agent import BaseAgent, AgentState
+from .history import HistoryCompactor, HistoryWindow, render_history
 from .llm import get_llm
-from ..config import WorldInfo
+from .parser import match_actor_id, parse_metrics, parse_tags
+from .prompt import PromptBuilder, check_layout
+from .scheduler import LeastRecentPolicy, get_policy
+from .trace import record_retry, timed
+from ..config import ActorInfo
+
+_TASK = """Please update the world state and select the character ID to authorize next. You can only update the \"current state\" field in the world state. You should place the updated current state in between <state> and </state> tags. You can only select the character ID from the list of characters. You should place the selected character ID in between <actor> and </actor> tags. Your output should be in the following format:
+
+<state> UPDATED_CURRENT_WORLD_STATE </state>
+<actor> CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>
+
+There are some IMPORTANT NOTES for you:
+1. The \"description\" and the \"rules\" fields in the world state cannot be violated or changed. Your should only output the updated current state in the <state> tags. The state should be a complete and brief description of the current situation.
+2. You should choose the most appropriate character to respond according to the current situation. You need to ensure the coherence and interactivity of the role-playing game. You should also promote multi-party dialogue."""
+
+_STATE_TASK = """Please update the world state. You can only update the \"current state\" field in the world state. You should place the updated current state in between <state> and </state> tags. Your output should be in the following format:
+
+<state> UPDATED_CURRENT_WORLD_STATE </state>
+
+There are some IMPORTANT NOTES for you:
+1. The \"description\" and the \"rules\" fields in the world state cannot be violated or changed. Your should only output the updated current state in the <state> tags. The state should be a complete and brief description of the current situation."""
+
+def _group_task(max_parallel: int) -> str:
+    """The task of the controller when it may authorize several characters at once."""
+    return f"""Please update the world state and select the IDs of the characters to authorize next. You can only update the \"current state\" field in the world state. You should place the updated current state in between <state> and </state> tags. You can only select character IDs from the list of characters, and you can select up to {max_parallel} characters, who will act at the same time in the next round. You should place every selected character ID in between its own <actor> and </actor> tags. Your output should be in the following format:
+
+<state> UPDATED_CURRENT_WORLD_STATE </state>
+<actor> CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>
+<actor> ANOTHER_CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>
+
+There are some IMPORTANT NOTES for you:
+1. The \"description\" and the \"rules\" fields in the world state cannot be violated or changed. Your should only output the updated current state in the <state> tags. The state should be a complete and brief description of the current situation.
+2. You should choose the most appropriate characters to respond according to the current situation. You need to ensure the coherence and interactivity of the role-playing game. You should also promote multi-party dialogue.
+3. Characters acting at the same time do not see each other's responses of that round. Select several characters only when they would naturally act at the same time, e.g. when they all react to the same event, and a single character otherwise."""
 
 class ControllerAgent(BaseAgent):
     """Controller agent that manages the story flow."""
     
-    def __init__(self, model: str = "deepseek-chat"):
-        """Initialize controller agent with model configuration."""
+    def __init__(self, model: str = "deepseek-chat", history_window: Optional[HistoryWindow] = None,
+                 schedule: str = "llm", state_update_every: int = 1, parse_retries: int = 2,
+                 layout: str = "classic", max_parallel: int = 1):
+        """Initialize controller agent with model configuration.
+
+        With a schedule other than "llm" the next actor is picked by a local policy,
+        and the world state is updated by the LLM only every `state_update_every`
+        rounds (never if 0). An output missing a tag is retried with a short prompt
+        asking only for that tag, at most `parse_retries` times per round.
+        `layout` is one of PROMPT_LAYOUTS. With `max_parallel` > 1 up to that many
+        actors may be authorized to act at the same time in a round.
+        """
         super().__init__()
         self.logger = logging.getLogger(f"Story.Controller")
         self.llm = get_llm(model=model)
-        self.logger.info(f"Story.Controller initialized with {model}")
+        self.prompt = PromptBuilder()
+        self.compactor = HistoryCompactor(history_window, self.llm) if history_window else None
+        self.policy = None if schedule == "llm" else get_policy(schedule)
+        self.state_update_every = state_update_every
+        self.parse_retries = parse_retries
+        self.fallback = LeastRecentPolicy()
+        self.layout = check_layout(layout)
+        self.max_parallel = max_parallel
+        self.task = _TASK if max_parallel == 1 else _group_task(max_parallel)
+        self.logger.info(f"Story.Controller initialized with {model}, schedule: {schedule}")
     
-    def _gen_prompt(self, state: AgentState) -> str:
-        """Generate prompt for the controller agent."""
-        prompt = f"""You are the host of a role-playing game, and you are responsible for managing the flow of the story. In this game you have a set of characters, and they are interacting with each other in a fictional world round by round. In each round, you will authorize one character depending on the situation of the story, and only this authorized character is allowed to speak or act at this round. Additionally, you also need to update the world state based on the conversation history. Your input includes the detailed description of the world, the detailed descriptions of the characters, the world state, and the role-playing history. The input texts are listed below.
+    def _render_cast(self, actors: Dict[str, ActorInfo]) -> str:
+        """Render the instructions and the characters, up to the world."""
+        if self.max_parallel == 1:
+            rounds = "In each round, you will authorize one character depending on the situation of the story, and only this authorized character is allowed to speak or act at this round."
+        else:
+            rounds = f"In each round, you will authorize up to {self.max_parallel} characters depending on the situation of the story, and only these authorized characters are allowed to speak or act at this round. Characters authorized in the same round act at the same time."
+        return f"""You are the host of a role-playing game, and you are responsible for managing the flow of the story. In this game you have a set of characters, and they are interacting with each other in a fictional world round by round. {rounds} Additionally, you also need to update the world state based on the conversation history. Your input includes the detailed description of the world, the detailed descriptions of the characters, the world state, and the role-playing history. The input texts are listed below.
 
 ## Characters
 
-{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in state["actors"].items())}
+{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in actors.items())}
+
+"""
 
-## World State
+    def _render_static(self, actors: Dict[str, ActorInfo]) -> str:
+        """Render the sections of the prompt that are fixed for a session."""
+        return f"""{self._render_cast(actors)}## World State
 
-{state["world_state"]}
+"""
+
+    def _render_prefix_static(self, actors: Dict[str, ActorInfo], world: str, task: str) -> str:
+        """Render everything that is fixed for a session, the task included, for the prefix layout."""
+        return f"""{self._render_cast(actors)}## World
+
+{world}
+
+## Task
+
+{task}
 
 ## Role Play History
 
-{"\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in state["messages"])}
+"""
 
-Please update the world state and select the character ID to authorize next. You can only update the \"current state\" field in the world state. You should place the updated current state in between <state> and </state> tags. You can only select the character ID from the list of characters. You should place the selected character ID in between <actor> and </actor> tags. Your output should be in the following format:
+    def _gen_prompt(self, state: AgentState) -> str:
+        """Generate prompt for the controller agent."""
+        if self.layout == "prefix":
+            return self._gen_prefix_prompt(state, self.task)
+        prompt = f"""{self._render_input(state)}
 
-<state> UPDATED_CURRENT_WORLD_STATE </state>
-<actor> CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>
+{self.task}"""
+        return prompt
 
-There are some IMPORTANT NOTES for you:
-1. The \"description\" and the \"rules\" fields in the world state cannot be violated or changed. Your should only output the updated current state in the <state> tags. The state should be a complete and brief description of the current situation.
-2. You should choose the most appropriate character to respond according to the current situation. You need to ensure the coherence and interactivity of the role-playing game. You should also promote multi-party dialogue."""
+    def _gen_state_prompt(self, state: AgentState) -> str:
+        """Generate prompt that only updates the world state, the next actor being picked locally."""
+        if self.layout == "prefix":
+            return self._gen_prefix_prompt(state, _STATE_TASK)
+        prompt = f"""{self._render_input(state)}
+
+{_STATE_TASK}"""
+        return prompt
+
+    def _gen_prefix_prompt(self, state: AgentState, task: str) -> str:
+        """Generate a prompt in the prefix layout: the static sections and the task,
+        then the history, and the current state last."""
+        world = state["world_state"]
+        return f"""{self.prompt.static(state["actors"], self._render_prefix_static, world.setting(), task)}{render_history(self.prompt, state)}
+
+## Current State
+
+{world.state}
+
+Please give your output for this round now, in the format described in the task."""
+
+    def _gen_repair_prompt(self, state: AgentState, msg: str, missing: List[str]) -> str:
+        """Generate a short prompt asking again only for the tags missing in an output."""
+        formats = {
+            "state": "<state> UPDATED_CURRENT_WORLD_STATE </state>",
+            "actor": "<actor> CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>"
+        }
+        prompt = f"""Your previous output could not be parsed. It is listed below.
+
+{msg}
+
+Please rewrite it in the following format, keeping its content:
+
+{"\n".join(formats[tag] for tag in missing)}"""
+        if "actor" in missing:
+            prompt += f"""
+
+You can only select the character ID from the list below.
+
+{"\n".join(f"### ID: {actor_id}" for actor_id in state["actors"])}"""
         return prompt
+
+    def _render_input(self, state: AgentState) -> str:
+        """Render the input texts of the prompt, up to the role play history."""
+        return f"""{self.prompt.static(state["actors"], self._render_static)}{state["world_state"]}
+
+## Role Play History
+
+{render_history(self.prompt, state)}"""
+
+    def _updates_state(self, state: AgentState) -> bool:
+        """Whether the world state is updated at this round when scheduling locally.
+        Rounds of actors acting at the same time count once. States checkpointed
+        before the round counter existed count their messages."""
+        rounds = state.get("rounds", len(state["messages"]))
+        return self.state_update_every > 0 and rounds > 0 and rounds % self.state_update_every == 0
     
-    def __call__(self, state: AgentState) -> AgentState:
+    def _read(self, state: AgentState, msg: str, wants_actor: bool) -> Dict[str, Any]:
+        """Read the updated current state and the next actors from an output, if found."""
+        parsed = parse_tags(msg)
+        fields = {}
+        if parsed.recovered:
+            parse_metrics.count("recovered")
+        if parsed.first("state") is not None:
+            fields["state"] = parsed.first("state")
+        if wants_actor:
+            actor_ids = []
+            for chosen in parsed.texts("actor"):
+                actor_id = match_actor_id(chosen, state["actors"])
+                if actor_id is None or actor_id in actor_ids:
+                    continue
+                if actor_id != chosen:
+                    parse_metrics.count("fuzzy_actor")
+                    self.logger.info(f"Actor {chosen!r} matched to {actor_id}")
+                actor_ids.append(actor_id)
+            if actor_ids:
+                fields["actor"] = actor_ids[:self.max_parallel]
+        return fields
+
+    @staticmethod
+    def _missing(fields: Dict[str, Any], wants_actor: bool) -> List[str]:
+        return [tag for tag in ("state", "actor") if tag not in fields and (tag == "state" or wants_actor)]
+
+    def _retry(self, state: AgentState, msg: str, fields: Dict[str, Any], attempt: int,
+               wants_actor: bool) -> Optional[str]:
+        """The repair prompt for the output, None if nothing is missing or the retries are used up."""
+        missing = self._missing(fields, wants_actor)
+        if not missing or attempt >= self.parse_retries:
+            return None
+        if attempt == 0:
+            parse_metrics.count("failures")
+        parse_metrics.count("retries")
+        record_retry()
+        self.logger.warning(f"Output without a valid {' or '.join(missing)}, "
+                            f"retrying ({attempt + 1}/{self.parse_retries})")
+        with timed("prompt_build"):
+            return self._gen_repair_prompt(state, msg, missing)
+
+    def _next_state(self, state: AgentState, fields: Optional[Dict[str, Any]],
+                    next_actor_ids: Optional[List[str]] = None) -> AgentState:
+        """Update the world state and authorize the next actors.
+
+        The world state is kept as is if there is no LLM output (`fields` is None)
+        or no state could be read from it, and the next actors are taken from the
+        output if not given, or picked by the least-recent policy if the output
+        has none.
+        """
+        new_world_state = state["world_state"]
+        if fields is not None:
+            parse_metrics.count("outputs")
+            if self._missing(fields, next_actor_ids is None):
+                parse_metrics.count("fallbacks")
+            if "state" in fields:
+                new_world_state = state["world_state"].with_state(fields["state"])
+                self.logger.info(fields["state"])
+            else:
+                self.logger.warning("No world state in the output, keeping the current one")
+        if next_actor_ids is None:
+            next_actor_ids = (fields or {}).get("actor")
+            if next_actor_ids is None:
+                next_actor_ids = [self.fallback.choose(state)]
+                self.logger.warning(f"No valid actor in the output, authorizing {next_actor_ids[0]}")
+        self.logger.info(", ".join(next_actor_ids))
+        return AgentState(
+            current_actor=next_actor_ids[0],
+            current_actors=next_actor_ids,
+            world_state=new_world_state,
+            summary=state.get("summary", ""),
+            summarized=state.get("summarized", 0),
+            rounds=state.get("rounds", len(state["messages"])) + 1
+        )
+
+    def __call__(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
         """Process the current state and return the next state."""
         self.logger.info(f"Story.Controller is acting...")
-        response = self.llm.invoke([{"role": "user", "content": self._gen_prompt(state)}])
-
-        msg = response.content
-        new_current_state = re.search(r"<state>(.*?)</state>", msg, re.DOTALL)
-        new_current_state = new_current_state.group(1).strip()
-        next_actor_id = re.search(r"<actor>(.*?)</actor>", msg, re.DOTALL)
-        next_actor_id = next_actor_id.group(1).strip()
-
-        new_world_state = WorldInfo(
-            description=state["world_state"].description,
-            state=new_current_state,
-            rules=state["world_state"].rules
-        )
-        self.logger.info(new_current_state)
-        self.logger.info(next_actor_id)
-        return AgentState(
-            messages=state["messages"],
-            actors=state["actors"],
-            current_actor=next_actor_id,
-            world_state=new_world_state
-        )
\ No newline at end of file
+        if self.compactor is not None:
+            state = AgentState({**state, **self.compactor.fold(state, config)})
+        next_actor_ids = None
+        if self.policy is None:
+            with timed("prompt_build"):
+                prompt = self._gen_prompt(state)
+        else:
+            next_actor_ids = self.policy.choose_many(state, self.max_parallel)
+            if not self._updates_state(state):
+                return self._next_state(state, None, next_actor_ids)
+            with timed("prompt_build"):
+                prompt = self._gen_state_prompt(state)
+        wants_actor = next_actor_ids is None
+        msg = self._complete(prompt, config)
+        fields = self._read(state, msg, wants_actor)
+        attempt = 0
+        while (prompt := self._retry(state, msg, fields, attempt, wants_actor)) is not None:
+            msg = self._complete(prompt, config)
+            fields = {**self._read(state, msg, wants_actor), **fields}
+            attempt += 1
+        return self._next_state(state, fields, next_actor_ids)
+
+    async def acall(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+        """Process the current state and return the next state asynchronously."""
+        self.logger.info(f"Story.Controller is acting...")
+        if self.compactor is not None:
+            state = AgentState({**state, **await self.compactor.afold(state, config)})
+        next_actor_ids = None
+        if self.policy is None:
+            with timed("prompt_build"):
+                prompt = self._gen_prompt(state)
+        else:
+            next_actor_ids = self.policy.choose_many(state, self.max_parallel)
+            if not self._updates_state(state):
+                return self._next_state(state, None, next_actor_ids)
+            with timed("prompt_build"):
+                prompt = self._gen_state_prompt(state)
+        wants_actor = next_actor_ids is None
+        msg = await self._acomplete(prompt, config)
+        fields = self._read(state, msg, wants_actor)
+        attempt = 0
+        while (prompt := self._retry(state, msg, fields, attempt, wants_actor)) is not None:
+            msg = await self._acomplete(prompt, config)
+            fields = {**self._read(state, msg, wants_actor), **fields}
+            attempt += 1
+        return self._next_state(state, fields, next_actor_ids)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic fake chat model for offline runs and benchmarks.
+"""
+
+import re
+import time
+import zlib
+import random
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Iterator, List, Optional, Set, Tuple
+from pydantic import PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Prompts are cached in blocks of 64 tokens, like the context cache of DeepSeek
+_CACHE_BLOCK = 256
+
+_WORDS = ("the", "forest", "kingdom", "tribe", "magic", "item", "balance", "power",
+          "ancient", "whispers", "border", "shadow", "light", "oath", "stone", "river")
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers the story prompts without calling any API.
+
+    Answers are derived from the prompt and the seed only, so identical prompts
+    get identical answers. The controller gets well-formed <state>/<actor>
+    tags with actor IDs taken from the prompt, one or several if the prompt
+    allows authorizing several characters at once, actors get <think>, <speak>
+    and <action> tags, and the writer gets plain prose, a paragraph for every
+    four rounds of the transcript and at least three. Every call sleeps for
+    `latency` seconds to simulate the round-trip to a provider, plus
+    `token_latency` seconds per output token to simulate the generation. When
+    streamed, the first token arrives after half of the latency and the other
+    tokens are spread over the rest. With `malformed` > 0, that fraction of the
+    tagged answers is damaged like real outputs sometimes are: unclosed or
+    mangled tags, misspelled actor IDs, missing tags.
+
+    The prompt cache of a provider is emulated too: the usage of every answer
+    reports as cached the leading blocks of the prompt seen in earlier prompts.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    response_length: int = 60
+    seed: int = 0
+    malformed: float = 0.0
+    _prefix_blocks: Set[Tuple[int, int]] = PrivateAttr(default_factory=set)
+    _prefix_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def from_spec(cls, spec: str, **extra: Any) -> "FakeChatModel":
+        """Create a fake model from a spec like "fake:latency=0.5,length=100,seed=1",
+        extra keyword arguments are passed to the model, e.g. a rate limiter."""
+        _, _, options = spec.partition(":")
+        fields = {"latency": "latency", "token_latency": "token_latency", "length": "response_length",
+                  "seed": "seed", "malformed": "malformed"}
+        kwargs = {}
+        for option in filter(None, options.split(",")):
+            key, _, value = option.partition("=")
+            if key.strip() not in fields:
+                raise ValueError(f"Unknown fake LLM option - {key}. Use: {', '.join(fields)}")
+            kwargs[fields[key.strip()]] = float(value) if key.strip() in ("latency", "token_latency", "malformed") else int(value)
+        return cls(**kwargs, **extra)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _words(self, rng: random.Random, n: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(max(n, 1)))
+
+    def respond(self, prompt: str, seed: Optional[int] = None) -> str:
+        """Return the answer to the given prompt."""
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")) ^ (self.seed if seed is None else seed))
+        n = self.response_length
+        if "You are a story writer" in prompt:
+            paragraphs = max(3, prompt.count("'s Round\n") // 4)
+            return "\n\n".join(self._words(rng, n) + "." for _ in range(paragraphs))
+        if "You are keeping the summary" in prompt:
+            return "\n\n".join(self._words(rng, n) + "." for _ in range(3))
+        if "<actor> CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>" in prompt:
+            actor_ids = re.findall(r"^### ID: (.+)$", prompt, re.MULTILINE)
+            group = re.search(r"you can select up to (\d+) characters", prompt)
+            state = f"<state> {self._words(rng, n // 2)} </state>"
+            if group is None:
+                return self._damage(rng, f"{state}\n<actor> {rng.choice(actor_ids)} </actor>")
+            chosen = rng.sample(actor_ids, rng.randint(1, min(int(group.group(1)), len(actor_ids))))
+            return self._damage(rng, state + "".join(f"\n<actor> {actor_id} </actor>" for actor_id in chosen))
+        if "<state> UPDATED_CURRENT_WORLD_STATE </state>" in prompt:
+            return self._damage(rng, f"<state> {self._words(rng, n // 2)} </state>")
+        name = re.search(r"## Character Description\s+Name: (.+)", prompt)
+        name = name.group(1) if name else "Someone"
+        return self._damage(rng, f"<think> {self._words(rng, n // 3)} </think>\n\n"
+                                 f"<speak> I am {name}. {self._words(rng, n // 3)} </speak>\n\n"
+                                 f"<action> {name} {self._words(rng, n // 3)} </action>")
+
+    def _damage(self, rng: random.Random, answer: str) -> str:
+        """Damage a fraction `malformed` of the tagged answers."""
+        if not self.malformed or rng.random() >= self.malformed:
+            return answer
+        damage = rng.choice((
+            lambda text: re.sub(r"</\w+>\s*$", "", text),  # Last tag unclosed
+            lambda text: re.sub(r"<(/?)(\w+)>", lambda m: f"< {m.group(1)}{m.group(2).upper()} >", text),
+            lambda text: re.sub(r"<actor> (\w+) </actor>",
+                                lambda m: f"<actor> {m.group(1).replace('_', ' ').title()}. </actor>", text),
+            lambda text: re.sub(r"<actor>.*?</actor>", "", text),  # Tag missing
+            lambda text: re.sub(r"</?\w+>", "", text),  # No tags at all
+        ))
+        return damage(answer).strip()
+
+    def cached_tokens(self, prompt: str) -> int:
+        """Tokens of the prompt read from the emulated prompt cache, which then
+        holds the blocks of the prompt."""
+        data = prompt.encode("utf-8")
+        blocks, chain, cached = [], 0, 0
+        for i in range(0, len(data) - len(data) % _CACHE_BLOCK, _CACHE_BLOCK):
+            chain = zlib.crc32(data[i:i + _CACHE_BLOCK], chain)  # Chained, so a block stands for its prefix
+            blocks.append((i, chain))
+        with self._prefix_lock:
+            for block in blocks:
+                if block not in self._prefix_blocks:
+                    break
+                cached = block[0] + _CACHE_BLOCK
+            self._prefix_blocks.update(blocks)
+        return min(cached // 4, len(prompt) // 4)
+
+    def _result(self, messages: List[BaseMessage], seed: Optional[int] = None) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = self.respond(prompt, seed)
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": len(prompt) // 4 + len(content) // 4,
+            "input_token_details": {"cache_read": self.cached_tokens(prompt)}
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _delay(self, content: str) -> float:
+        return self.latency + self.token_latency * (len(content) // 4)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        result = self._result(messages, kwargs.get("seed"))
+        if self.latency or self.token_latency:
+            time.sleep(self._delay(result.generations[0].message.content))
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        result = self._result(messages, kwargs.get("seed"))
+        if self.latency or self.token_latency:
+            await asyncio.sleep(self._delay(result.generations[0].message.content))
+        return result
+
+    def _chunks(self, messages: List[BaseMessage], seed: Optional[int]) -> Tuple[List[str], float]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = self.respond(prompt, seed)
+        return re.findall(r"\S+\s*|\s+", content), self._delay(content) - self.latency / 2
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks, rest = self._chunks(messages, kwargs.get("seed"))
+        for i, token in enumerate(chunks):
+            if self.latency or self.token_latency:
+                time.sleep(self.latency / 2 if i == 0 else rest / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        chunks, rest = self._chunks(messages, kwargs.get("seed"))
+        for i, token in enumerate(chunks):
+            if self.latency or self.token_latency:
+                await asyncio.sleep(self.latency / 2 if i == 0 else rest / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+History compaction: older rounds are folded into a rolling summary so that the
+prompts of the actors and the controller stay within a token budget.
+"""
+
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from .agent import AgentState, llm_options
+from .message import Message
+from .prompt import PromptBuilder, estimate_tokens, render_round
+from .trace import record_llm_call, response_usage
+
+def render_history(prompt: PromptBuilder, state: AgentState) -> str:
+    """Render the role play history with the summary of the folded rounds, if any."""
+    summarized = state.get("summarized", 0)
+    if not summarized:
+        return prompt.history(state["messages"])
+    summary = f"### Summary of the Earlier Rounds\n{state['summary']}\n"
+    recent = prompt.history(state["messages"][summarized:])
+    return f"{summary}\n{recent}" if recent else summary
+
+@dataclass
+class HistoryWindow:
+    """Keep the last `keep_rounds` rounds verbatim, and fold older rounds into
+    the summary once the verbatim history exceeds `token_budget` tokens, down
+    to half the budget, so that a fold is not needed again on the next round."""
+    keep_rounds: int = 10
+    token_budget: int = 4000
+
+class HistoryCompactor:
+    """Folds older rounds of the history into a rolling summary, incrementally."""
+
+    def __init__(self, window: HistoryWindow, llm: Any):
+        self.window = window
+        self.llm = llm
+        self.logger = logging.getLogger("Story.History")
+        self._warned = False
+
+    def _foldable(self, state: AgentState) -> Optional[Sequence[Message]]:
+        """Return the rounds to fold into the summary, None if within the budget.
+
+        The oldest rounds are folded until the verbatim history is within half
+        the budget, or only the kept rounds are left."""
+        messages = state["messages"]
+        summarized = state.get("summarized", 0)
+        tokens = [estimate_tokens(render_round(msg.sender, msg.public)) for msg in messages[summarized:]]
+        verbatim = sum(tokens)
+        if verbatim <= self.window.token_budget:
+            return None
+        fold = max(0, len(tokens) - self.window.keep_rounds)
+        if verbatim - sum(tokens[:fold]) > self.window.token_budget:
+            if not self._warned:
+                self.logger.warning(f"The last {self.window.keep_rounds} rounds alone exceed the history "
+                                    f"budget of {self.window.token_budget} tokens, not folding; "
+                                    f"raise the budget or keep fewer rounds")
+                self._warned = True
+            return None
+        count = 0
+        while count < fold and verbatim > self.window.token_budget // 2:
+            verbatim -= tokens[count]
+            count += 1
+        return messages[summarized:summarized + count]
+
+    def _gen_prompt(self, summary: str, rounds: Sequence[Message]) -> str:
+        return f"""You are keeping the summary of a role-playing game up to date. Below are the summary of the game so far and the rounds that happened after it. Only the words and actions of the characters are shown.
+
+## Summary So Far
+
+{summary or "(The game has just started.)"}
+
+## New Rounds
+
+{"\n".join(render_round(msg.sender, msg.public) for msg in rounds)}
+
+Please rewrite the summary so that it also covers the new rounds. Keep every fact that matters for the rest of the story: who did and said what, promises, conflicts, and the whereabouts of characters and items. Be brief, and output the updated summary only."""
+
+    def _update(self, state: AgentState, rounds: Sequence[Message], summary: str) -> Dict[str, Any]:
+        summarized = state.get("summarized", 0) + len(rounds)
+        self.logger.info(f"Folded rounds {state.get('summarized', 0) + 1}-{summarized} into the summary "
+                         f"({estimate_tokens(summary)} tokens)")
+        return {"summary": summary, "summarized": summarized}
+
+    def fold(self, state: AgentState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        """Fold the rounds out of the window into the summary, return the state update."""
+        rounds = self._foldable(state)
+        if rounds is None:
+            return {}
+        prompt = self._gen_prompt(state.get("summary", ""), rounds)
+        start = time.perf_counter()
+        response = self.llm.invoke([{"role": "user", "content": prompt}], **llm_options(config))
+        record_llm_call(prompt, response.content, time.perf_counter() - start,
+                        response_usage(response))
+        return self._update(state, rounds, response.content.strip())
+
+    async def afold(self, state: AgentState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        """Asynchronous version of fold."""
+        rounds = self._foldable(state)
+        if rounds is None:
+            return {}
+        prompt = self._gen_prompt(state.get("summary", ""), rounds)
+        start = time.perf_counter()
+        response = await self.llm.ainvoke([{"role": "user", "content": prompt}], **llm_options(config))
+        record_llm_call(prompt, response.content, time.perf_counter() - start,
+                        response_usage(response))
+        return self._update(state, rounds, response.content.strip())
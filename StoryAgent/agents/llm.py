@@ -1,17 +1,115 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from langchain.chat_models import init_chat_model
-from langchain.chat_models.base import BaseChatModel
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+from .cache import CachedChatModel, ResponseCache
+
+if TYPE_CHECKING:
+    from langchain.chat_models.base import BaseChatModel
 
 supported_models = [
     "deepseek-chat",
-    "deepseek-chat:deepseek-chat"
+    "deepseek-chat:deepseek-chat",
+    "fake"  # Offline model, also accepts options, e.g. "fake:latency=0.5,length=100,seed=1"
 ]
 
-def get_llm(model: str = "deepseek-chat", temperature: float = 0.0) -> BaseChatModel:
+@dataclass(frozen=True)
+class ClientOptions:
+    """Options of the clients shared by all the models of get_llm.
+
+    `max_connections` bounds the requests in flight to the provider at once, later
+    requests wait for a free connection of the pool. `requests_per_second` limits
+    the rate of the LLM calls of the whole process, None for no limit.
+    """
+    base_url: Optional[str] = None
+    max_connections: int = 64
+    max_keepalive_connections: int = 32
+    requests_per_second: Optional[float] = None
+    shared: bool = True  # False builds a model with its own clients on every call
+
+_response_cache: Optional[ResponseCache] = None
+_client_options = ClientOptions()
+
+# Process-wide models by (model, temperature, base URL), and the HTTP clients and
+# the rate limiter they share
+_models: Dict[Tuple[str, float, Optional[str]], Any] = {}
+_shared: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+def set_response_cache(cache: Optional[ResponseCache]):
+    """Set the response cache used by the models of get_llm, None to disable caching."""
+    global _response_cache
+    _response_cache = cache
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _response_cache
+
+def set_client_options(options: ClientOptions):
+    """Set the client options of get_llm. Models built with the previous options
+    are dropped from the registry, agents holding them keep working."""
+    global _client_options
+    with _lock:
+        _client_options = options
+        _models.clear()
+        _shared.clear()
+
+def get_client_options() -> ClientOptions:
+    return _client_options
+
+def _is_fake(model: str) -> bool:
+    return model == "fake" or model.startswith("fake:")
+
+def _rate_limiter() -> Any:
+    if not _client_options.requests_per_second:
+        return None
+    from langchain_core.rate_limiters import InMemoryRateLimiter
+    return InMemoryRateLimiter(requests_per_second=_client_options.requests_per_second,
+                               max_bucket_size=max(1.0, _client_options.requests_per_second))
+
+def _http_clients() -> Dict[str, Any]:
+    import httpx
+    import openai
+    limits = httpx.Limits(max_connections=_client_options.max_connections,
+                          max_keepalive_connections=_client_options.max_keepalive_connections)
+    return {"http_client": openai.DefaultHttpxClient(limits=limits),
+            "http_async_client": openai.DefaultAsyncHttpxClient(limits=limits)}
+
+def _shared_resource(name: str) -> Any:
+    """The rate limiter or the HTTP clients of the registry, created on first use."""
+    if name not in _shared:
+        _shared[name] = _rate_limiter() if name == "rate_limiter" else _http_clients()
+    return _shared[name]
+
+def _build(model: str, temperature: float, shared: bool) -> "BaseChatModel":
+    rate_limiter = _shared_resource("rate_limiter") if shared else _rate_limiter()
+    extra = {} if rate_limiter is None else {"rate_limiter": rate_limiter}
+    if _is_fake(model):
+        from .fake_llm import FakeChatModel
+        return FakeChatModel.from_spec(model, **extra)
     if model not in supported_models:
         raise ValueError(
             f"Unsupported LLM - {model}. Use the following LLMs: {', '.join(supported_models)}"
         )
-    return init_chat_model(model=model, temperature=temperature)
\ No newline at end of file
+    if _client_options.base_url is not None:
+        extra["api_base"] = _client_options.base_url
+    extra.update(_shared_resource("http_clients") if shared else _http_clients())
+    # LangChain and the provider clients are loaded on the first model only
+    from langchain.chat_models import init_chat_model
+    return init_chat_model(model=model, temperature=temperature, **extra)
+
+def get_llm(model: str = "deepseek-chat", temperature: float = 0.0) -> "BaseChatModel":
+    """Return the chat model, shared by all callers with the same model, temperature
+    and base URL, so that they use the same connection pool and rate limiter."""
+    if not _client_options.shared:
+        llm = _build(model, temperature, shared=False)
+    else:
+        key = (model, temperature, _client_options.base_url)
+        with _lock:
+            llm = _models.get(key)
+            if llm is None:
+                llm = _models[key] = _build(model, temperature, shared=True)
+    if _response_cache is not None:
+        return CachedChatModel(llm, _response_cache, model, temperature)
+    return llm
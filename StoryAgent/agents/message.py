@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parsed messages of the role play history, and the append-only log holding them.
+"""
+
+import threading
+from itertools import islice
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, overload
+from .parser import ParsedOutput, parse_tags
+
+SEGMENT_TAGS = ("think", "speak", "action")
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    """A round of the role play history, parsed once when it enters the state.
+
+    `segments` holds the (tag, text) pairs of the <think>, <speak> and <action>
+    tags in order of appearance, and `public` is the content with the thoughts
+    stripped, i.e. what the other actors are allowed to see. Unclosed tags are
+    tolerated, an unclosed thought is hidden up to the next tag.
+    """
+    sender: str
+    content: str
+    segments: Optional[Tuple[Tuple[str, str], ...]] = None
+    public: Optional[str] = None
+
+    def __post_init__(self):
+        if self.segments is None or self.public is None:
+            parsed = parse_tags(self.content)
+            if self.segments is None:
+                object.__setattr__(self, "segments", _segments(parsed))
+            if self.public is None:
+                object.__setattr__(self, "public", parsed.without("think"))
+
+    @classmethod
+    def from_output(cls, sender: str, parsed: ParsedOutput) -> "Message":
+        """Create the message from an output already parsed, e.g. while it was streamed."""
+        return cls(sender, parsed.text, _segments(parsed), parsed.without("think"))
+
+    def _asdict(self) -> Dict[str, str]:
+        """The fields the message is rebuilt from. Checkpoint serializers use this
+        in place of all the dataclass fields, so the derived fields are not stored."""
+        return {"sender": self.sender, "content": self.content}
+
+    def texts(self, tag: str) -> List[str]:
+        """Return the texts of all segments with the given tag."""
+        return [text for segment_tag, text in self.segments if segment_tag == tag]
+
+    def view(self, viewer: str) -> str:
+        """Return the content as seen by the given viewer (sender name)."""
+        return self.content if viewer == self.sender else self.public
+
+def _segments(parsed: ParsedOutput) -> Tuple[Tuple[str, str], ...]:
+    return tuple((segment.tag, segment.text) for segment in parsed.segments if segment.tag in SEGMENT_TAGS)
+
+class MessageLog(Sequence[Message]):
+    """Immutable, append-only history of messages.
+
+    A log is a view of the first `len(log)` messages of a storage list. Appending
+    to the newest view extends the shared storage in place and returns a longer
+    view, so a round costs O(1) instead of a copy of the whole history; older
+    views are unaffected. Appending to an older view (a branch of the history)
+    copies its messages into new storage.
+    """
+    __slots__ = ("_items", "_length")
+
+    _lock = threading.Lock()
+
+    def __init__(self, messages: Iterable[Message] = ()):
+        self._items: List[Message] = list(messages)
+        self._length = len(self._items)
+
+    @classmethod
+    def _view(cls, items: List[Message], length: int) -> "MessageLog":
+        log = cls.__new__(cls)
+        log._items = items
+        log._length = length
+        return log
+
+    def extend(self, messages: Iterable[Message]) -> "MessageLog":
+        """Return the log with the messages appended."""
+        new = list(messages)
+        if not new:
+            return self
+        end = self._length + len(new)
+        with self._lock:
+            if len(self._items) == self._length:
+                self._items.extend(new)
+                return self._view(self._items, end)
+            # The same messages appended again, e.g. when the graph replays the
+            # writes of a node to evaluate its edges, share the storage too
+            if len(self._items) >= end and all(
+                    a is b for a, b in zip(self._items[self._length:end], new)):
+                return self._view(self._items, end)
+        return self._view(self._items[:self._length] + new, end)
+
+    def __add__(self, messages: Iterable[Message]) -> "MessageLog":
+        return self.extend(messages)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> Message: ...
+    @overload
+    def __getitem__(self, index: slice) -> List[Message]: ...
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step == 1:
+                return self._items[start:stop]
+            return [self._items[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("message log index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[Message]:
+        return islice(self._items, self._length)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (MessageLog, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"MessageLog({list(self)!r})"
+
+    def _asdict(self) -> Dict[str, List[Message]]:
+        """The messages the log is rebuilt from by checkpoint serializers."""
+        return {"messages": list(self)}
+
+def append_messages(log: Sequence[Message], messages: Union[Message, Iterable[Message]]) -> MessageLog:
+    """State reducer of the history: append the messages returned by a node."""
+    if not isinstance(log, MessageLog):
+        log = MessageLog(log)
+    if isinstance(messages, Message):
+        messages = (messages,)
+    return log.extend(messages)
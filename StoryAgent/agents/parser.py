@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tolerant, incremental parser of the tagged outputs of the agents, and matching
+of the actor IDs chosen by the controller against the cast.
+"""
+
+import re
+import difflib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple
+
+TAGS = ("state", "actor", "think", "speak", "action")
+
+# Opening or closing tag, with any whitespace and case, e.g. "< State >" or "</ACTOR >"
+_TAG_PATTERN = re.compile(r"<\s*(/?)\s*(" + "|".join(TAGS) + r")\s*>", re.IGNORECASE)
+# Longest tail of the buffer that may still become a tag once more chunks arrive
+_PARTIAL_TAG = re.compile(r"<[\s/a-zA-Z]{0,16}$")
+
+@dataclass
+class Segment:
+    """A tagged part of an output. `start` and `end` delimit it in the output,
+    tags included, and `closed` is False if the closing tag was missing."""
+    tag: str
+    text: str
+    start: int
+    end: int
+    closed: bool = True
+
+@dataclass
+class ParsedOutput:
+    text: str
+    segments: List[Segment] = field(default_factory=list)
+
+    def texts(self, tag: str) -> List[str]:
+        return [segment.text for segment in self.segments if segment.tag == tag]
+
+    def first(self, tag: str) -> Optional[str]:
+        """Text of the first segment with the tag that is not empty, None if none."""
+        return next((text for text in self.texts(tag) if text), None)
+
+    @property
+    def recovered(self) -> bool:
+        """True if some segment needed recovery, i.e. it was not closed properly."""
+        return any(not segment.closed for segment in self.segments)
+
+    def without(self, tag: str) -> str:
+        """The output with the segments of the tag cut out, tags included."""
+        parts, position = [], 0
+        for segment in self.segments:
+            if segment.tag == tag:
+                parts.append(self.text[position:segment.start])
+                position = segment.end
+        parts.append(self.text[position:])
+        return "".join(parts)
+
+class TagParser:
+    """Incremental parser of <state>, <actor>, <think>, <speak> and <action> tags.
+
+    Chunks of a streamed output are passed to `feed` as they arrive, and `close`
+    returns the parsed output. Tags may have extra whitespace and any case. An
+    opening tag closes the segment still open, an unclosed segment at the end
+    runs to the end of the output, and a closing tag without its opening tag
+    takes the untagged text before it.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._pending = ""  # Unscanned tail, which may be the start of a tag
+        self._offset = 0  # Position of the pending tail in the output
+        self._open: Optional[Tuple[str, int, int]] = None  # tag, tag start, text start
+        self._last_end = 0  # End of the last segment
+        self.segments: List[Segment] = []
+
+    def feed(self, chunk: str):
+        self._chunks.append(chunk)
+        text = self._pending + chunk
+        scanned = self._scan(text, final=False)
+        self._pending = text[scanned:]
+        self._offset += scanned
+
+    def close(self) -> ParsedOutput:
+        text = "".join(self._chunks)
+        self._scan(self._pending, final=True)
+        self._pending = ""
+        if self._open is not None:
+            tag, start, text_start = self._open
+            # A tag cut off at the end, e.g. "</actor", is not part of the text
+            partial = _PARTIAL_TAG.search(text, text_start)
+            text_end = partial.start() if partial else len(text)
+            self._emit(text, tag, start, text_start, text_end, len(text), closed=False)
+        return ParsedOutput(text, self.segments)
+
+    def _scan(self, text: str, final: bool) -> int:
+        """Handle the complete tags of the text, return the length that was scanned."""
+        position = 0
+        output = None
+        for match in _TAG_PATTERN.finditer(text):
+            if output is None:
+                output = "".join(self._chunks)
+            start, end = self._offset + match.start(), self._offset + match.end()
+            closing, tag = bool(match.group(1)), match.group(2).lower()
+            if not closing:
+                if self._open is not None:
+                    open_tag, open_start, text_start = self._open
+                    self._emit(output, open_tag, open_start, text_start, start, start, closed=False)
+                self._open = (tag, start, end)
+            elif self._open is not None and self._open[0] == tag:
+                open_tag, open_start, text_start = self._open
+                self._emit(output, open_tag, open_start, text_start, start, end)
+                self._open = None
+            elif self._open is None:
+                # Closing tag without its opening tag, the untagged text is its content
+                self._emit(output, tag, self._last_end, self._last_end, start, end, closed=False)
+            position = match.end()
+        if final:
+            return len(text)
+        partial = _PARTIAL_TAG.search(text, position)
+        return partial.start() if partial else len(text)
+
+    def _emit(self, output: str, tag: str, start: int, text_start: int, text_end: int, end: int,
+              closed: bool = True):
+        self.segments.append(Segment(tag, output[text_start:text_end].strip(), start, end, closed))
+        self._last_end = end
+
+def parse_tags(text: str) -> ParsedOutput:
+    """Parse a complete output."""
+    parser = TagParser()
+    parser.feed(text)
+    return parser.close()
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[\s\-]+", "_", name.strip().strip("\"'`[](){}.,:;").lower())
+
+def match_actor_id(text: Optional[str], actors: Mapping[str, object]) -> Optional[str]:
+    """Resolve the actor chosen in an output to an actor ID of the cast.
+
+    Accepts the ID or the name of the actor with any case, whitespace, quotes or
+    an "ID:" prefix, and near misses of either; None if nothing is close enough.
+    """
+    if not text:
+        return None
+    if text in actors:
+        return text
+    candidate = _normalize(re.sub(r"^\s*(id|actor)\s*:\s*", "", text.strip(), flags=re.IGNORECASE))
+    keys: Dict[str, str] = {}
+    for actor_id, actor_info in actors.items():
+        keys[_normalize(actor_id)] = actor_id
+        name = getattr(actor_info, "name", None)
+        if name:
+            keys.setdefault(_normalize(name), actor_id)
+    if candidate in keys:
+        return keys[candidate]
+    close = difflib.get_close_matches(candidate, list(keys), n=1, cutoff=0.75)
+    return keys[close[0]] if close else None
+
+class ParseMetrics:
+    """Process-wide counters of the parsing of the agent outputs."""
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, *names: str):
+        with self._lock:
+            for name in names:
+                self._counts[name] = self._counts.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, float]:
+        """The counters, and the failure and retry rates per parsed output."""
+        with self._lock:
+            counts = dict(self._counts)
+        outputs = counts.get("outputs", 0)
+        if outputs:
+            counts["failure_rate"] = counts.get("failures", 0) / outputs
+            counts["retry_rate"] = counts.get("retries", 0) / outputs
+        return counts
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+parse_metrics = ParseMetrics()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental prompt assembly shared by the story agents.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Sequence, Tuple
+from .message import Message
+
+# "classic" puts the world state before the history. "prefix" puts everything
+# fixed for a session first, then the history, which only grows, and the
+# current state last, so that consecutive prompts share the longest prefix
+# and hit the prompt cache of the provider.
+PROMPT_LAYOUTS = ("classic", "prefix")
+
+def check_layout(layout: str) -> str:
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unsupported prompt layout - {layout}. Use one of: {', '.join(PROMPT_LAYOUTS)}")
+    return layout
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, about four bytes per token."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+def render_round(sender: str, content: str) -> str:
+    """Render a single round of the role play history."""
+    return f"### {sender}'s Round\n{content}\n"
+
+def render_message(message: Message) -> str:
+    """Render a message of the role play history in full."""
+    return render_round(message.sender, message.content)
+
+class _HistoryBuffer:
+    """Rendered history of a single session."""
+
+    __slots__ = ("first", "last", "count", "text")
+
+    def __init__(self, first: Any):
+        self.first = first
+        self.last = None
+        self.count = 0
+        self.text = ""
+
+class PromptBuilder:
+    """Caches the static sections and the rendered history of the prompts.
+
+    Static sections are rendered once per session (keyed by the identity of the
+    object they are rendered from), and the role play history is kept in a
+    buffer per session to which only the newest rounds are appended. The
+    result is byte-identical to rendering everything from scratch.
+    """
+
+    def __init__(self,
+                 render_message: Callable[[Message], str] = render_message,
+                 max_sessions: int = 64):
+        self.render_message = render_message
+        self.max_sessions = max_sessions
+        self._static: "OrderedDict[Tuple[int, Tuple[Hashable, ...]], Tuple[Any, str]]" = OrderedDict()
+        self._buffers: "OrderedDict[int, _HistoryBuffer]" = OrderedDict()
+
+    def static(self, source: Any, render: Callable[..., str], *context: Hashable) -> str:
+        """Return render(source, *context), rendered only once for the same source
+        object and equal context values."""
+        key = (id(source), context)
+        cached = self._static.get(key)
+        if cached is not None and cached[0] is source:
+            self._static.move_to_end(key)
+            return cached[1]
+        text = render(source, *context)
+        self._static[key] = (source, text)
+        if len(self._static) > self.max_sessions:
+            self._static.popitem(last=False)
+        return text
+
+    def history(self, messages: Sequence[Message]) -> str:
+        """Return the rendered history, equivalent to joining all rendered rounds with newlines."""
+        if not messages:
+            return ""
+        first = messages[0]
+        key = id(first)
+        buffer = self._buffers.get(key)
+        if (buffer is None or buffer.first is not first
+                or buffer.count > len(messages)
+                or messages[buffer.count - 1] is not buffer.last):
+            # Unknown session or diverged history, start over
+            buffer = _HistoryBuffer(first)
+            self._buffers[key] = buffer
+            if len(self._buffers) > self.max_sessions:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(key)
+
+        if buffer.count < len(messages):
+            rendered: List[str] = [self.render_message(message)
+                                   for message in messages[buffer.count:]]
+            new_text = "\n".join(rendered)
+            buffer.text = f"{buffer.text}\n{new_text}" if buffer.count else new_text
+            buffer.count = len(messages)
+            buffer.last = messages[-1]
+        return buffer.text
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local scheduling policies, which pick the next actor without an LLM call.
+"""
+
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List
+from .agent import AgentState
+
+class SchedulePolicy(ABC):
+    """Picks the actor to authorize next."""
+
+    @abstractmethod
+    def choose(self, state: AgentState) -> str:
+        pass
+
+    def choose_many(self, state: AgentState, k: int) -> List[str]:
+        """Up to `k` actors to act at the same time, a single one unless overridden."""
+        return [self.choose(state)]
+
+    @staticmethod
+    def _last_spoken(state: AgentState) -> Dict[str, int]:
+        """Index of the last round of every actor that has spoken, by actor ID."""
+        ids = {actor_info.name: actor_id for actor_id, actor_info in state["actors"].items()}
+        last = {}
+        for i, msg in enumerate(state["messages"]):
+            if msg.sender in ids:
+                last[ids[msg.sender]] = i
+        return last
+
+class RoundRobinPolicy(SchedulePolicy):
+    """Every actor in turn, in the order of the cast."""
+
+    def choose(self, state: AgentState) -> str:
+        actor_ids = list(state["actors"])
+        if state["current_actor"] not in state["actors"]:
+            return actor_ids[0]
+        return actor_ids[(actor_ids.index(state["current_actor"]) + 1) % len(actor_ids)]
+
+    def choose_many(self, state: AgentState, k: int) -> List[str]:
+        actor_ids = list(state["actors"])
+        last = (state.get("current_actors") or [state["current_actor"]])[-1]
+        start = actor_ids.index(last) + 1 if last in state["actors"] else 0
+        return [actor_ids[(start + i) % len(actor_ids)] for i in range(min(k, len(actor_ids)))]
+
+class LeastRecentPolicy(SchedulePolicy):
+    """The actor who has not spoken for the longest time, actors who never spoke first."""
+
+    def choose(self, state: AgentState) -> str:
+        last = self._last_spoken(state)
+        return min(state["actors"], key=lambda actor_id: last.get(actor_id, -1))
+
+    def choose_many(self, state: AgentState, k: int) -> List[str]:
+        last = self._last_spoken(state)
+        return sorted(state["actors"], key=lambda actor_id: last.get(actor_id, -1))[:k]
+
+class MentionPolicy(SchedulePolicy):
+    """The actor mentioned most in the words and actions of the last round,
+    falling back to the least recent speaker."""
+
+    def __init__(self):
+        self._fallback = LeastRecentPolicy()
+
+    def choose(self, state: AgentState) -> str:
+        if not state["messages"]:
+            return self._fallback.choose(state)
+        last = state["messages"][-1]
+        text = last.public
+        counts: Dict[str, int] = {}
+        for actor_id, actor_info in state["actors"].items():
+            if actor_info.name == last.sender:
+                continue
+            names = {actor_info.name, actor_info.name.split()[0]}
+            count = sum(len(re.findall(rf"\b{re.escape(name)}\b", text)) for name in names)
+            if count:
+                counts[actor_id] = count
+        if not counts:
+            return self._fallback.choose(state)
+        return max(counts, key=counts.get)
+
+policies = {
+    "round_robin": RoundRobinPolicy,
+    "least_recent": LeastRecentPolicy,
+    "mention": MentionPolicy
+}
+
+def get_policy(name: str) -> SchedulePolicy:
+    if name not in policies:
+        raise ValueError(f"Unsupported schedule - {name}. Use one of: llm, {', '.join(policies)}")
+    return policies[name]()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Sinks receiving the tokens of the streamed LLM responses as they arrive.
+"""
+
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Set, TextIO
+
+class StreamSink(ABC):
+    """Receives the tokens of the responses of an agent as they are streamed."""
+
+    def start(self, agent: str):
+        """Called before the first token of a response."""
+        pass
+
+    @abstractmethod
+    def write(self, agent: str, token: str):
+        pass
+
+    def end(self, agent: str):
+        """Called after the last token of a response."""
+        pass
+
+    def close(self):
+        """Called once no more responses are streamed."""
+        pass
+
+class _OneAtATimeSink(StreamSink):
+    """Writes one response at a time. When several agents stream at the same
+    time, the first one is written live and the others are buffered, then
+    written in the order they started, each when the previous one ends."""
+
+    def __init__(self):
+        self._live: Optional[str] = None
+        self._buffers: Dict[str, List[str]] = {}
+        self._ended: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _emit(self, text: str):
+        pass
+
+    def _flush(self):
+        pass
+
+    def start(self, agent: str):
+        with self._lock:
+            if self._live is None:
+                self._live = agent
+                self._emit(f"\n===== {agent} =====\n")
+            else:
+                self._buffers[agent] = []
+
+    def write(self, agent: str, token: str):
+        with self._lock:
+            if agent == self._live:
+                self._emit(token)
+                self._flush()
+            else:
+                self._buffers[agent].append(token)
+
+    def end(self, agent: str):
+        with self._lock:
+            if agent != self._live:
+                self._ended.add(agent)
+                return
+            self._emit("\n")
+            self._live = None
+            while self._buffers:
+                waiting = next(iter(self._buffers))
+                self._emit(f"\n===== {waiting} =====\n" + "".join(self._buffers.pop(waiting)))
+                if waiting not in self._ended:
+                    self._live = waiting
+                    break
+                self._ended.discard(waiting)
+                self._emit("\n")
+            self._flush()
+
+class ConsoleSink(_OneAtATimeSink):
+    """Prints the tokens to the console."""
+
+    def __init__(self, stream: TextIO = sys.stdout):
+        super().__init__()
+        self.stream = stream
+
+    def _emit(self, text: str):
+        self.stream.write(text)
+
+    def _flush(self):
+        self.stream.flush()
+
+class FileSink(_OneAtATimeSink):
+    """Appends the tokens to a file."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _emit(self, text: str):
+        self._file.write(text)
+
+    def end(self, agent: str):
+        super().end(agent)
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class CallbackSink(StreamSink):
+    """Passes the tokens to a callback taking the agent name and the token."""
+
+    def __init__(self, callback: Callable[[str, str], None]):
+        self.callback = callback
+
+    def write(self, agent: str, token: str):
+        self.callback(agent, token)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tracing of the workflow nodes: wall time, prompt-build time, LLM time, tokens,
+prompt size and retries of every node run, written to structured sinks.
+"""
+
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+@dataclass
+class TraceRecord:
+    """Measurements of one run of a node. Times are in seconds."""
+    node: str
+    round: int
+    started: float = field(default_factory=time.time)
+    wall: float = 0.0
+    prompt_build: float = 0.0
+    llm: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0  # Prompt tokens served from the prompt cache of the provider
+    completion_tokens: int = 0
+    prompt_bytes: int = 0
+    retries: int = 0
+    tokens_estimated: bool = False  # True if the model reported no usage for some call
+    error: Optional[str] = None
+
+_current: ContextVar[Optional[TraceRecord]] = ContextVar("trace_record", default=None)
+
+def current_record() -> Optional[TraceRecord]:
+    """The record of the node running in this context, None if not traced."""
+    return _current.get()
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Add the time spent in the block to the given field of the current record."""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(record, name, getattr(record, name) + time.perf_counter() - start)
+
+def response_usage(response: Any) -> Optional[Dict[str, Any]]:
+    """Token usage of a chat model response, None if not reported. Prompt tokens
+    read from the prompt cache are in ["input_token_details"]["cache_read"], also
+    when the provider only reports them as DeepSeek's "prompt_cache_hit_tokens"."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None
+    details = usage.get("input_token_details") or {}
+    if "cache_read" not in details:
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        if "prompt_cache_hit_tokens" in token_usage:
+            usage = {**usage, "input_token_details": {**details,
+                                                      "cache_read": token_usage["prompt_cache_hit_tokens"]}}
+    return usage
+
+def record_llm_call(prompt: str, completion: str, seconds: float,
+                    usage: Optional[Mapping[str, Any]] = None):
+    """Add an LLM call to the current record. Tokens are estimated from the texts
+    if the model did not report its usage."""
+    record = _current.get()
+    if record is None:
+        return
+    from .prompt import estimate_tokens
+    record.llm += seconds
+    record.llm_calls += 1
+    record.prompt_bytes += len(prompt.encode("utf-8"))
+    if usage:
+        record.prompt_tokens += usage.get("input_tokens", 0)
+        record.cached_tokens += (usage.get("input_token_details") or {}).get("cache_read") or 0
+        record.completion_tokens += usage.get("output_tokens", 0)
+    else:
+        record.prompt_tokens += estimate_tokens(prompt)
+        record.completion_tokens += estimate_tokens(completion)
+        record.tokens_estimated = True
+
+def record_retry():
+    """Count a retry of an LLM call in the current record."""
+    record = _current.get()
+    if record is not None:
+        record.retries += 1
+
+class TraceSink(ABC):
+    """Receives the record of every traced node run."""
+
+    @abstractmethod
+    def write(self, record: TraceRecord):
+        pass
+
+    def close(self):
+        pass
+
+class MemoryTraceSink(TraceSink):
+    """Collects the records in memory."""
+
+    def __init__(self):
+        self.records: List[TraceRecord] = []
+        self._lock = threading.Lock()
+
+    def write(self, record: TraceRecord):
+        with self._lock:
+            self.records.append(record)
+
+class JsonlTraceSink(TraceSink):
+    """Appends the records to a JSONL file, one line per node run."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: TraceRecord):
+        line = json.dumps(asdict(record), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class Tracer:
+    """Opens a record around every node run and writes it to the sinks when the node returns."""
+
+    def __init__(self, sinks: Sequence[TraceSink]):
+        self.sinks = list(sinks)
+
+    def _open(self, node: str, state: Mapping[str, Any]) -> Tuple[TraceRecord, Any, float]:
+        record = TraceRecord(node=node, round=len(state.get("messages", ())) + 1)
+        return record, _current.set(record), time.perf_counter()
+
+    def _close(self, record: TraceRecord, token: Any, start: float, error: Optional[BaseException]):
+        record.wall = time.perf_counter() - start
+        if error is not None:
+            record.error = f"{type(error).__name__}: {error}"
+        _current.reset(token)
+        for sink in self.sinks:
+            sink.write(record)
+
+    @contextmanager
+    def span(self, node: str, state: Mapping[str, Any]) -> Iterator[TraceRecord]:
+        record, token, start = self._open(node, state)
+        error = None
+        try:
+            yield record
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._close(record, token, start, error)
+
+    @asynccontextmanager
+    async def aspan(self, node: str, state: Mapping[str, Any]) -> AsyncIterator[TraceRecord]:
+        record, token, start = self._open(node, state)
+        error = None
+        try:
+            yield record
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._close(record, token, start, error)
+
+    def wrap(self, func: Callable, afunc: Callable) -> Tuple[Callable, Callable]:
+        """Wrap the sync and async functions of a graph node in spans, named after
+        the node the graph runs them as."""
+        def node_name(config: Optional[Mapping[str, Any]]) -> str:
+            return ((config or {}).get("metadata") or {}).get("langgraph_node", "unknown")
+
+        def run(state: Mapping[str, Any], config: Optional[Mapping[str, Any]] = None) -> Any:
+            with self.span(node_name(config), state):
+                return func(state, config)
+
+        async def arun(state: Mapping[str, Any], config: Optional[Mapping[str, Any]] = None) -> Any:
+            async with self.aspan(node_name(config), state):
+                return await afunc(state, config)
+
+        return run, arun
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def summarize(records: Sequence[TraceRecord],
+              prices: Optional[Sequence[float]] = None) -> str:
+    """Per-node report of the records. `prices` are the input and output prices
+    per million tokens, and optionally the price of cached input tokens, to add
+    the cost of every node."""
+    nodes: Dict[str, List[TraceRecord]] = {}
+    for record in records:
+        nodes.setdefault(record.node, []).append(record)
+    total_wall = sum(record.wall for record in records) or 1.0
+
+    header = (f"{'node':<20} {'runs':>5} {'wall (s)':>9} {'share':>6} {'mean (s)':>9} {'build (s)':>10} "
+              f"{'LLM (s)':>8} {'calls':>6} {'in tok':>8} {'cached':>7} {'out tok':>8} {'prompt KB':>10} "
+              f"{'retries':>8}")
+    if prices:
+        header += f" {'cost':>9}"
+    lines = [header]
+
+    def row(name: str, group: Sequence[TraceRecord]) -> str:
+        wall = sum(r.wall for r in group)
+        prompt_tokens = sum(r.prompt_tokens for r in group)
+        completion_tokens = sum(r.completion_tokens for r in group)
+        cached_tokens = sum(r.cached_tokens for r in group)
+        cached = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        line = (f"{name:<20} {len(group):>5} {wall:>9.2f} {wall / total_wall:>6.1%} {wall / len(group):>9.3f} "
+                f"{sum(r.prompt_build for r in group):>10.3f} {sum(r.llm for r in group):>8.2f} "
+                f"{sum(r.llm_calls for r in group):>6} {prompt_tokens:>8} {cached:>7.1%} {completion_tokens:>8} "
+                f"{sum(r.prompt_bytes for r in group) / 1024:>10.1f} {sum(r.retries for r in group):>8}")
+        if prices:
+            cached_price = prices[2] if len(prices) > 2 else prices[0]
+            cost = ((prompt_tokens - cached_tokens) * prices[0] + cached_tokens * cached_price
+                    + completion_tokens * prices[1])
+            line += f" {cost / 1e6:>9.4f}"
+        return line
+
+    for node, group in sorted(nodes.items(), key=lambda item: -sum(r.wall for r in item[1])):
+        lines.append(row(node, group))
+    if records:
+        lines.append(row("total", records))
+    notes = []
+    if any(record.tokens_estimated for record in records):
+        notes.append("token counts partly estimated, the model did not report usage for every call")
+    errors = sum(record.error is not None for record in records)
+    if errors:
+        notes.append(f"{errors} node runs failed")
+    return "\n".join(lines + [f"({note})" for note in notes])
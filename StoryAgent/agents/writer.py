@@ -1,35 +1,61 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
 import logging
-import openai
+from typing import Dict, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END
-from .agent import BaseAgent, AgentState
+from .agent import BaseAgent, AgentState, llm_options
+from .chapters import ChapterPlan, ChapterWriter
 from .llm import get_llm
+from .message import Message
+from .prompt import PromptBuilder
+from .stream import StreamSink
+from .trace import timed
+from ..config import ActorInfo
+
+WRITER_ID = "__STORY_WRITER__"
 
 class WriterAgent(BaseAgent):
-    def __init__(self, lang: str = "中文", model: str = "deepseek-chat"):
+    """Writes the story from the whole transcript in a single call, or, with a
+    chapter plan, chapter by chapter once the transcript is longer than a chapter.
+    `max_parallel` is the most characters the controller authorizes in a round."""
+
+    def __init__(self, lang: str = "中文", model: str = "deepseek-chat", sinks: Sequence[StreamSink] = (),
+                 chapters: Optional[ChapterPlan] = None, max_parallel: int = 1):
         super().__init__()
         self.logger = logging.getLogger(f"Story.Writer")
         self.lang = lang
-        self.writer_id = "__STORY_WRITER__"
+        self.max_parallel = max_parallel
+        self.writer_id = WRITER_ID
         self.llm = get_llm(model=model)
+        self.sinks = sinks
+        self.prompt = PromptBuilder()
+        self.chapters = None if chapters is None else ChapterWriter(chapters, self.llm, model, lang)
         self.logger.info(f"Story.Writer initialized with {model} in {lang}")
 
-    def _gen_prompt(self, state: AgentState) -> str:
-        prompt = f"""You are a story writer. You will write a novel story based on the transcript of a role-playing game. In the role-playing game, there are several characters interacting with each other in a fictional world. In each round, only one character is allowed to speak or act. You are supposed to read the script of this whole game, and write a complete story based on the script. Your input includes the detailed description of the world, the detailed descriptions of the characters, the world state, and the role-playing history. The input texts are listed below.
+    def _render_static(self, actors: Dict[str, ActorInfo]) -> str:
+        if self.max_parallel == 1:
+            rounds = "In each round, only one character is allowed to speak or act."
+        else:
+            rounds = "In each round, one character or several characters at the same time are allowed to speak or act. The responses of the characters acting at the same time are listed one after another."
+        return f"""You are a story writer. You will write a novel story based on the transcript of a role-playing game. In the role-playing game, there are several characters interacting with each other in a fictional world. {rounds} You are supposed to read the script of this whole game, and write a complete story based on the script. Your input includes the detailed description of the world, the detailed descriptions of the characters, the world state, and the role-playing history. The input texts are listed below.
 
 ## Characters
 
-{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in state["actors"].items())}
+{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in actors.items())}
 
 ## World State
 
-{state["world_state"]}
+"""
+
+    def _gen_prompt(self, state: AgentState) -> str:
+        prompt = f"""{self.prompt.static(state["actors"], self._render_static)}{state["world_state"]}
 
 ## Role Play History
 
-{"\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in state["messages"])}
+{self.prompt.history(state["messages"])}
 
 Please write a complete story based on the above script. You should maintain the characters' personalities. You should make the story not only interesting and vivid, but also conforming to the script.
 
@@ -39,15 +65,40 @@ There are some IMPORTANT NOTES for you:
 
         return prompt
     
-    def __call__(self, state: AgentState) -> AgentState:
-        self.logger.info("Story.Writer is acting...")
-        prompt = self._gen_prompt(state)
-        response = self.llm.invoke([{"role": "user", "content": prompt}])
-        summary = response.content
-        self.logger.info(summary)
+    def _next_state(self, state: AgentState, summary: str) -> AgentState:
+        if not self.sinks:
+            self.logger.info(summary)
         return AgentState(
-            messages=state["messages"] + [(self.writer_id, summary)],
-            actors=state["actors"],
-            current_actor=END,
-            world_state=state["world_state"]
-        )
\ No newline at end of file
+            messages=[Message(self.writer_id, summary)],
+            current_actor=END
+        )
+
+    def _emit(self, story: str):
+        """Send a story written chapter by chapter to the sinks, in one piece."""
+        if self.sinks:
+            name = self._stream_start()
+            for sink in self.sinks:
+                sink.write(name, story)
+            self._stream_end(name, [story], time.perf_counter(), None)
+
+    def __call__(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+        self.logger.info("Story.Writer is acting...")
+        chapters = self.chapters.split(state) if self.chapters else []
+        if len(chapters) > 1:
+            story = self.chapters.write(state, chapters, llm_options(config))
+            self._emit(story)
+            return self._next_state(state, story)
+        with timed("prompt_build"):
+            prompt = self._gen_prompt(state)
+        return self._next_state(state, self._complete(prompt, config))
+
+    async def acall(self, state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+        self.logger.info("Story.Writer is acting...")
+        chapters = self.chapters.split(state) if self.chapters else []
+        if len(chapters) > 1:
+            story = await self.chapters.awrite(state, chapters, llm_options(config))
+            self._emit(story)
+            return self._next_state(state, story)
+        with timed("prompt_build"):
+            prompt = self._gen_prompt(state)
+        return self._next_state(state, await self._acomplete(prompt, config))
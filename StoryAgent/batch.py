@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Batch story runner: generates the stories of a manifest concurrently.
+"""
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Dict, List, Optional, Tuple
+from .agents.writer import WRITER_ID
+from .workflow import create_workflow, create_initial_state
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StoryJob:
+    """A story to generate, i.e. a line of the manifest."""
+    world_config: str
+    actors_dir: str
+    language: str = "English"
+    max_iterations: int = 20
+    seed: Optional[int] = None
+    model: Optional[str] = None  # Defaults to the model of the batch
+    job_id: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'StoryJob':
+        known = {field.name for field in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def content_id(self) -> str:
+        """ID derived from everything but the job ID, the same for equal jobs of any manifest."""
+        spec = {key: value for key, value in asdict(self).items() if key != "job_id"}
+        digest = hashlib.sha256(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return f"job-{digest.hexdigest()[:16]}"
+
+def load_manifest(manifest_path: str, default_ids: bool = True) -> List[StoryJob]:
+    """Load the jobs of a JSONL manifest, one JSON object per line. Jobs without
+    an ID are numbered by line, or keep None if not `default_ids`."""
+    jobs = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = StoryJob.from_dict(json.loads(line))
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"{manifest_path}:{line_no}: invalid job - {e}") from e
+            if job.job_id is None and default_ids:
+                job.job_id = f"job-{line_no}"
+            jobs.append(job)
+    return jobs
+
+class WorkflowCache:
+    """Compiled workflows, built once per distinct cast and settings.
+
+    `options` are passed on to create_workflow and are the same for all workflows.
+    """
+
+    def __init__(self, **options: Any):
+        self.options = options
+        self._apps: Dict[Tuple[str, int, str, str], Any] = {}
+
+    def get(self, actors_dir: str, max_iter: int, lang: str, model: str):
+        key = (os.path.realpath(actors_dir), max_iter, lang, model)
+        app = self._apps.get(key)
+        if app is None:
+            app = create_workflow(actors_dir, max_iter, lang, model, **self.options).compile()
+            self._apps[key] = app
+            logger.info(f"Compiled workflow #{len(self._apps)} for {actors_dir} ({lang}, {model})")
+        return app
+
+    def __len__(self) -> int:
+        return len(self._apps)
+
+def story_record(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert the final state of a story into an output record."""
+    messages = result["messages"]
+    story = next((msg.content for msg in reversed(messages) if msg.sender == WRITER_ID), None)
+    return {
+        "status": "ok",
+        "rounds": sum(msg.sender != WRITER_ID for msg in messages),
+        "story": story,
+        "transcript": [[msg.sender, msg.content] for msg in messages if msg.sender != WRITER_ID],
+    }
+
+async def run_job(job: StoryJob, workflows: WorkflowCache, model: str,
+                  job_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Run a single job. Failures are reported in the record and never raised."""
+    job_model = job.model or model
+    record = {**asdict(job), "model": job_model}
+    start = time.perf_counter()
+    try:
+        app = workflows.get(job.actors_dir, job.max_iterations, job.language, job_model)
+        config = {"recursion_limit": job.max_iterations * 10,
+                  "configurable": {"seed": job.seed}}
+        result = await asyncio.wait_for(
+            app.ainvoke(create_initial_state(job.actors_dir, job.world_config), config=config),
+            timeout=job_timeout
+        )
+        record.update(story_record(result))
+    except Exception as e:
+        logger.error(f"Job {job.job_id} failed: {type(e).__name__}: {e}")
+        record.update(status="failed", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+async def run_batch(manifest_path: str, output_path: str, model: str = "deepseek-chat",
+                    concurrency: int = 8, job_timeout: Optional[float] = None,
+                    **workflow_options: Any) -> Dict[str, int]:
+    """Run all jobs of a manifest, at most `concurrency` at a time.
+
+    `workflow_options` are passed on to create_workflow for every job.
+
+    Finished stories are appended to the JSONL output as soon as they are done,
+    so the output may not follow the order of the manifest.
+    """
+    jobs = load_manifest(manifest_path)
+    logger.info(f"Loaded {len(jobs)} jobs from {manifest_path}")
+    workflows = WorkflowCache(**workflow_options)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(job: StoryJob) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_job(job, workflows, model, job_timeout)
+
+    counts = {"ok": 0, "failed": 0}
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out:
+        for finished in asyncio.as_completed([bounded(job) for job in jobs]):
+            record = await finished
+            counts[record["status"]] += 1
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            logger.info(f"Job {record['job_id']} {record['status']} in {record['seconds']}s "
+                        f"({counts['ok'] + counts['failed']}/{len(jobs)})")
+    logger.info(f"Batch done in {time.perf_counter() - start:.1f}s: {counts['ok']} ok, "
+                f"{counts['failed']} failed, {len(workflows)} compiled workflows")
+    return counts
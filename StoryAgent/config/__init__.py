@@ -4,9 +4,13 @@
 Configuration package for the story generation system.
 """
 
-from .config import WorldInfo, ActorInfo
+from .config import WorldInfo, ActorInfo, ConfigError
+from .loader import load_cast, load_world
 
 __all__ = [
     'WorldInfo',
-    'ActorInfo'
+    'ActorInfo',
+    'ConfigError',
+    'load_cast',
+    'load_world'
 ] 
\ No newline at end of file
@@ -4,55 +4,138 @@
 Configurations for the story generation system.
 """
 
-from typing import List
-from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+from dataclasses import dataclass, fields, replace
+from functools import cached_property
 import json
 
-@dataclass
+class ConfigError(ValueError):
+    """An actor or world configuration that cannot be used."""
+
+def _check(cls: type, data: Any, source: str) -> Dict[str, Any]:
+    """Validate the fields of a configuration against the fields of the class,
+    return them with list fields as tuples and ages as integers."""
+    if not isinstance(data, dict):
+        raise ConfigError(f"{source}: expected a JSON object, got {type(data).__name__}")
+    names = [field.name for field in fields(cls)]
+    missing = [name for name in names if name not in data]
+    if missing:
+        raise ConfigError(f"{source}: missing fields: {', '.join(missing)}")
+    unknown = sorted(set(data) - set(names))
+    if unknown:
+        raise ConfigError(f"{source}: unknown fields: {', '.join(unknown)}")
+    values = {}
+    for field in fields(cls):
+        value = data[field.name]
+        if field.type is int:
+            if isinstance(value, str) and value.strip().isdigit():
+                value = int(value)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ConfigError(f"{source}: field {field.name!r} must be an integer, got {value!r}")
+        elif field.type is str:
+            if not isinstance(value, str) or not value.strip():
+                raise ConfigError(f"{source}: field {field.name!r} must be a non-empty string, got {value!r}")
+        else:
+            if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+                raise ConfigError(f"{source}: field {field.name!r} must be a list of strings, got {value!r}")
+            value = tuple(value)
+        values[field.name] = value
+    return values
+
+def _read_json(path: str) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"{path}: invalid JSON - {e}") from e
+
+@dataclass(frozen=True)
 class ActorInfo:
+    """Configuration of an actor. Immutable, and its renderings are computed once."""
     name: str
     gender: str
     age: int
     race_or_faction: str
     appearance: str
-    backstories: List[str]
+    backstories: Tuple[str, ...]
     persona: str
     goal: str
 
+    def __post_init__(self):
+        if not isinstance(self.backstories, tuple):
+            object.__setattr__(self, "backstories", tuple(self.backstories))
+
+    @classmethod
+    def from_dict(cls, data: Any, source: str = "actor config") -> 'ActorInfo':
+        return cls(**_check(cls, data, source))
+
     @classmethod
     def from_file(cls, actor_config_path: str) -> 'ActorInfo':
-        with open(actor_config_path, "r", encoding="utf-8") as f:
-            actor_config = json.load(f)
-        return cls(**actor_config)
+        return cls.from_dict(_read_json(actor_config_path), actor_config_path)
 
-    def brief(self) -> str:
+    @cached_property
+    def _brief(self) -> str:
         return f"""Name: {self.name}
 Gender: {self.gender}
 Age: {self.age}
 Race or faction: {self.race_or_faction}
 Appearance: {self.appearance}"""
 
-    def __str__(self) -> str:
+    @cached_property
+    def _full(self) -> str:
         return self.brief() + f"""
 Personality: {self.persona}
 Goal: {self.goal}
 Backstories:
 {"\n".join(f"  - {story}" for story in self.backstories)}"""
 
-@dataclass
+    def brief(self) -> str:
+        return self._brief
+
+    def __str__(self) -> str:
+        return self._full
+
+@dataclass(frozen=True)
 class WorldInfo:
+    """Configuration and current state of the world. Immutable, a new state is a
+    new object (see with_state), and its renderings are computed once."""
     description: str
     state: str
-    rules: List[str]
+    rules: Tuple[str, ...]
+
+    def __post_init__(self):
+        if not isinstance(self.rules, tuple):
+            object.__setattr__(self, "rules", tuple(self.rules))
+
+    @classmethod
+    def from_dict(cls, data: Any, source: str = "world config") -> 'WorldInfo':
+        return cls(**_check(cls, data, source))
 
     @classmethod
     def from_file(cls, world_config_path: str) -> 'WorldInfo':
-        with open(world_config_path, "r", encoding="utf-8") as f:
-            world_config = json.load(f)
-        return cls(**world_config)
+        return cls.from_dict(_read_json(world_config_path), world_config_path)
 
-    def __str__(self) -> str:
+    def with_state(self, state: str) -> 'WorldInfo':
+        """The world with another current state, sharing the rendered setting."""
+        world = replace(self, state=state)
+        if "_setting" in self.__dict__:
+            world.__dict__["_setting"] = self._setting
+        return world
+
+    @cached_property
+    def _setting(self) -> str:
         return f"""Description: {self.description}
 Rules:
-{"\n".join(f"  - {rule}" for rule in self.rules)}
-Current state: {self.state}"""
\ No newline at end of file
+{"\n".join(f"  - {rule}" for rule in self.rules)}"""
+
+    @cached_property
+    def _full(self) -> str:
+        return f"""{self.setting()}
+Current state: {self.state}"""
+
+    def setting(self) -> str:
+        """The description and the rules, which stay the same for a whole story."""
+        return self._setting
+
+    def __str__(self) -> str:
+        return self._full
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Loading of casts and worlds, validated once and cached by file modification
+time, so that the configurations shared by many stories are parsed only once.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+from .config import ActorInfo, ConfigError, WorldInfo
+
+# Node names of the workflow that actor IDs cannot take
+RESERVED_IDS = ("controller", "writer")
+
+_lock = threading.Lock()
+_files: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+def _load(path: str, parse: Callable[[str], Any]) -> Any:
+    """parse(path), cached until the modification time or the size of the file changes."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise ConfigError(f"{path}: no such file") from None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = os.path.realpath(path)
+    with _lock:
+        cached = _files.get(key)
+    if cached is None or cached[0] != signature:
+        cached = (signature, parse(path))
+        with _lock:
+            _files[key] = cached
+    return cached[1]
+
+def load_cast(actors_dir: str) -> Dict[str, ActorInfo]:
+    """Load and validate the actors of a directory, by actor ID (file name).
+
+    Every file is parsed again only when it changes, and the ActorInfo objects
+    are shared by all callers. The returned dict is new on every call.
+    """
+    if not os.path.isdir(actors_dir):
+        raise ConfigError(f"{actors_dir}: not a directory")
+    files = [f for f in os.listdir(actors_dir) if f.endswith(".json")]
+    if not files:
+        raise ConfigError(f"{actors_dir}: no actor configs (*.json)")
+    actors, names = {}, {}
+    for file in files:
+        actor_id, path = file[:-5], os.path.join(actors_dir, file)
+        if actor_id in RESERVED_IDS:
+            raise ConfigError(f"{path}: actor ID {actor_id!r} is reserved, rename the file")
+        actor_info = _load(path, ActorInfo.from_file)
+        if actor_info.name in names:
+            raise ConfigError(f"{path}: name {actor_info.name!r} is already used by {names[actor_info.name]}")
+        names[actor_info.name] = actor_id
+        actors[actor_id] = actor_info
+    return actors
+
+def load_world(world_config: str) -> WorldInfo:
+    """Load and validate a world configuration, cached until the file changes."""
+    return _load(world_config, WorldInfo.from_file)
+
+def clear_config_cache():
+    with _lock:
+        _files.clear()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Story farm: a queue of story jobs in a SQLite file, worked off by a pool of
+processes that each run several stories at once and reuse their compiled
+workflows, with the finished stories kept in a compact SQLite result store.
+"""
+
+import os
+import json
+import time
+import zlib
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .agents.llm import ClientOptions
+from .batch import StoryJob, WorkflowCache, load_manifest, run_job
+
+logger = logging.getLogger(__name__)
+
+ABANDONED = "abandoned by its worker"
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Connection in autocommit mode, transactions are opened explicitly."""
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+class JobQueue:
+    """Story jobs in a SQLite file, shared by the workers of any number of processes.
+
+    A worker claims a job by marking it running and keeps it alive with
+    heartbeats. A running job without a heartbeat for `lease` seconds was
+    abandoned, e.g. its worker crashed, and is claimed again. Failed jobs are
+    queued again `retry_delay` seconds times the attempts later, until they
+    have been tried `max_attempts` times.
+    """
+
+    def __init__(self, path: str, lease: float = 60.0, max_attempts: int = 3, retry_delay: float = 5.0):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, spec TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, available REAL NOT NULL, "
+            "worker TEXT, heartbeat REAL, error TEXT);"
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available);"
+            "CREATE TABLE IF NOT EXISTS workers ("
+            "worker TEXT PRIMARY KEY, heartbeat REAL NOT NULL, stats TEXT NOT NULL);"
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction, taking the lock of the database at once so that
+        two workers never claim the same job."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, jobs: Iterable[StoryJob]) -> int:
+        """Add the jobs, return how many were added. Jobs whose ID is already in the queue are skipped."""
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.executemany(
+                "INSERT OR IGNORE INTO jobs (job_id, spec, status, available) VALUES (?, ?, 'queued', ?)",
+                [(job.job_id, json.dumps(asdict(job), ensure_ascii=False), now) for job in jobs]).rowcount
+
+    def claim(self, worker: str) -> Optional[Tuple[StoryJob, int]]:
+        """Claim the next job for the worker, return it with its attempt number,
+        None if no job can be run now."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT job_id, spec, status, attempts FROM jobs "
+                "WHERE (status = 'queued' AND available <= ?) "
+                "OR (status = 'running' AND heartbeat < ? AND attempts < ?) "
+                "ORDER BY available LIMIT 1", (now, now - self.lease, self.max_attempts)).fetchone()
+            if row is None:
+                return None
+            job_id, spec, status, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, heartbeat = ? "
+                "WHERE job_id = ?", (worker, now, job_id))
+        if status == "running":
+            logger.warning(f"Job {job_id} was {ABANDONED} after {attempts} attempts, running it again")
+        return StoryJob.from_dict(json.loads(spec)), attempts + 1
+
+    def reap(self) -> List[Tuple[StoryJob, int]]:
+        """Mark as failed the abandoned jobs without attempts left, return them
+        with their number of attempts."""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT job_id, spec, attempts FROM jobs WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                (time.time() - self.lease, self.max_attempts)).fetchall()
+            conn.executemany("UPDATE jobs SET status = 'failed', error = ? WHERE job_id = ?",
+                             [(ABANDONED, job_id) for job_id, _, _ in rows])
+        for job_id, _, attempts in rows:
+            logger.warning(f"Job {job_id} was {ABANDONED} after {attempts} attempts, giving up")
+        return [(StoryJob.from_dict(json.loads(spec)), attempts) for _, spec, attempts in rows]
+
+    def heartbeat(self, worker: str, stats: Dict[str, Any]):
+        """Keep the running jobs of the worker alive, and record its stats."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE worker = ? AND status = 'running'", (now, worker))
+            conn.execute("INSERT OR REPLACE INTO workers (worker, heartbeat, stats) VALUES (?, ?, ?)",
+                         (worker, now, json.dumps(stats)))
+
+    def done(self, job_id: str, worker: str):
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET status = 'done', error = NULL "
+                         "WHERE job_id = ? AND worker = ? AND status = 'running'", (job_id, worker))
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        """Record a failed attempt, return True if the job is queued again for a retry."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE job_id = ? AND worker = ? AND status = 'running'",
+                               (job_id, worker)).fetchone()
+            if row is None:  # Claimed by another worker meanwhile
+                return False
+            retry = row[0] < self.max_attempts
+            conn.execute("UPDATE jobs SET status = ?, available = ?, error = ? WHERE job_id = ?",
+                         ("queued" if retry else "failed", time.time() + self.retry_delay * row[0], error, job_id))
+            return retry
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs by status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"queued": 0, "running": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def unfinished(self) -> int:
+        """Jobs queued, also for a later retry, or running in any worker."""
+        counts = self.counts()
+        return counts["queued"] + counts["running"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResultStore:
+    """Records of the finished jobs in a SQLite file, the story and the
+    transcript of every record compressed with zlib."""
+
+    def __init__(self, path: str, level: int = 6):
+        self.path = path
+        self.level = level
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, worker TEXT NOT NULL, attempts INTEGER NOT NULL, "
+            "rounds INTEGER, seconds REAL NOT NULL, finished REAL NOT NULL, record BLOB NOT NULL)"
+        )
+
+    def put(self, record: Dict[str, Any], worker: str, attempts: int):
+        data = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"), self.level)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (job_id, status, worker, attempts, rounds, seconds, finished, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["job_id"], record["status"], worker, attempts, record.get("rounds"),
+                 record["seconds"], time.time(), data))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM results WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else json.loads(zlib.decompress(row[0]))
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """All records, in the order the jobs finished."""
+        with self._lock:
+            rows = self._conn.execute("SELECT record FROM results ORDER BY finished").fetchall()
+        for (data,) in rows:
+            yield json.loads(zlib.decompress(data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def enqueue_manifest(queue: JobQueue, manifest_path: str) -> int:
+    """Add the jobs of a JSONL manifest to the queue, return how many were added.
+    Jobs whose cast or world is invalid are reported and left out.
+
+    Jobs without an ID get one derived from their content, numbered if the
+    manifest repeats them, so that enqueuing a manifest again adds nothing and
+    the jobs of different manifests never take each other's place.
+    """
+    from .config import ConfigError, load_cast, load_world
+    jobs, seen = [], {}
+    for job in load_manifest(manifest_path, default_ids=False):
+        if job.job_id is None:
+            job_id = job.content_id()
+            seen[job_id] = seen.get(job_id, 0) + 1
+            job.job_id = job_id if seen[job_id] == 1 else f"{job_id}-{seen[job_id]}"
+        try:
+            load_cast(job.actors_dir)
+            load_world(job.world_config)
+        except ConfigError as e:
+            logger.error(f"Job {job.job_id} not queued, invalid configuration - {e}")
+            continue
+        jobs.append(job)
+    added = queue.enqueue(jobs)
+    logger.info(f"Queued {added} jobs of {manifest_path} in {queue.path}"
+                + (f", {len(jobs) - added} already queued" if added < len(jobs) else ""))
+    return added
+
+@dataclass
+class FarmSettings:
+    """Settings of the workers of a farm, passed to every worker process.
+
+    `concurrency` is the number of stories a worker runs at once. `cache` holds
+    the arguments of create_cache for the response cache of every worker, and
+    `workflow_options` are passed on to create_workflow.
+    """
+    queue_path: str
+    results_path: str
+    model: str = "deepseek-chat"
+    concurrency: int = 4
+    job_timeout: Optional[float] = None
+    heartbeat: float = 10.0
+    lease: float = 60.0
+    max_attempts: int = 3
+    retry_delay: float = 5.0
+    poll: float = 1.0
+    client_options: ClientOptions = field(default_factory=ClientOptions)
+    cache: Optional[Tuple[str, str, int, Optional[float]]] = None
+    workflow_options: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class WorkerStats:
+    """Throughput of a worker. `busy` sums the seconds of all its stories,
+    which overlap when it runs several at once."""
+    worker: str
+    jobs: int = 0
+    ok: int = 0
+    failed: int = 0
+    retried: int = 0
+    rounds: int = 0
+    busy: float = 0.0
+    started: float = field(default_factory=time.time)
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {**asdict(self), "elapsed": round(elapsed, 3),
+                "stories_per_min": round(self.ok / elapsed * 60, 3),
+                "rounds_per_s": round(self.rounds / elapsed, 3)}
+
+async def work(settings: FarmSettings, worker: str) -> WorkerStats:
+    """Run the jobs of the queue, `settings.concurrency` at a time, until no job
+    is queued or running in any worker."""
+    queue = JobQueue(settings.queue_path, settings.lease, settings.max_attempts, settings.retry_delay)
+    results = ResultStore(settings.results_path)
+    workflows = WorkflowCache(**settings.workflow_options)
+    stats = WorkerStats(worker)
+
+    async def beat():
+        while True:
+            await asyncio.sleep(settings.heartbeat)
+            queue.heartbeat(worker, stats.as_dict())
+
+    async def run(job: StoryJob, attempt: int):
+        record = await run_job(job, workflows, settings.model, settings.job_timeout)
+        record["attempts"] = attempt
+        stats.jobs += 1
+        stats.busy += record["seconds"]
+        if record["status"] == "ok":
+            stats.ok += 1
+            stats.rounds += record["rounds"]
+            results.put(record, worker, attempt)
+            queue.done(job.job_id, worker)
+        elif queue.fail(job.job_id, worker, record["error"]):
+            stats.retried += 1
+            logger.info(f"Job {job.job_id} queued again after attempt {attempt}")
+        else:
+            stats.failed += 1
+            results.put(record, worker, attempt)
+
+    def record_abandoned():
+        for job, attempts in queue.reap():
+            results.put({**asdict(job), "model": job.model or settings.model, "status": "failed",
+                         "error": ABANDONED, "seconds": 0.0, "attempts": attempts}, worker, attempts)
+
+    running: Set[asyncio.Task] = set()
+    heartbeat = asyncio.create_task(beat())
+    queue.heartbeat(worker, stats.as_dict())
+    try:
+        while True:
+            record_abandoned()
+            while len(running) < settings.concurrency:
+                claim = queue.claim(worker)
+                if claim is None:
+                    break
+                running.add(asyncio.create_task(run(*claim)))
+            if not running:
+                if not queue.unfinished():
+                    break
+                # Retries not due yet, or jobs of other workers that may be abandoned
+                await asyncio.sleep(settings.poll)
+                continue
+            finished, running = await asyncio.wait(running, timeout=settings.poll,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                task.result()
+    finally:
+        heartbeat.cancel()
+        for task in running:
+            task.cancel()
+        queue.heartbeat(worker, stats.as_dict())
+        queue.close()
+        results.close()
+    logger.info(f"Worker {worker} done: {stats.ok} ok, {stats.failed} failed, {stats.retried} retried, "
+                f"{len(workflows)} compiled workflows")
+    return stats
+
+def run_worker(settings: FarmSettings) -> Dict[str, Any]:
+    """Entry point of a worker process, returns its stats."""
+    from .agents.cache import create_cache
+    from .agents.chapters import close_chapter_caches
+    from .agents.llm import set_client_options, set_response_cache
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+    set_client_options(settings.client_options)
+    cache = None if settings.cache is None else create_cache(*settings.cache)
+    set_response_cache(cache)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        return asyncio.run(work(settings, worker)).as_dict()
+    finally:
+        close_chapter_caches()
+        if cache is not None:
+            cache.close()
+
+def run_farm(settings: FarmSettings, workers: int) -> List[Dict[str, Any]]:
+    """Work off the queue with a pool of `workers` processes, return their stats.
+
+    The workers are started with spawn, so that none inherits the threads or
+    the open connections of this process. More workers on other machines can
+    share the queue file, if their file system supports the locks of SQLite.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        stats = list(pool.map(run_worker, [settings] * workers))
+    queue = JobQueue(settings.queue_path)
+    counts = queue.counts()
+    queue.close()
+    logger.info(f"Farm done in {time.perf_counter() - start:.1f}s with {workers} workers: {counts}")
+    return stats
+
+def summarize_workers(stats: List[Dict[str, Any]]) -> str:
+    """Per-worker throughput report."""
+    lines = [f"{'worker':<28} {'jobs':>5} {'ok':>5} {'failed':>7} {'retried':>8} {'rounds':>7} "
+             f"{'elapsed (s)':>12} {'stories/min':>12} {'rounds/s':>9}"]
+    for worker in stats:
+        lines.append(f"{worker['worker']:<28} {worker['jobs']:>5} {worker['ok']:>5} {worker['failed']:>7} "
+                     f"{worker['retried']:>8} {worker['rounds']:>7} {worker['elapsed']:>12.1f} "
+                     f"{worker['stories_per_min']:>12.2f} {worker['rounds_per_s']:>9.2f}")
+    if len(stats) > 1:
+        elapsed = max(worker["elapsed"] for worker in stats)
+        ok, rounds = sum(worker["ok"] for worker in stats), sum(worker["rounds"] for worker in stats)
+        lines.append(f"{'total':<28} {sum(w['jobs'] for w in stats):>5} {ok:>5} "
+                     f"{sum(w['failed'] for w in stats):>7} {sum(w['retried'] for w in stats):>8} {rounds:>7} "
+                     f"{elapsed:>12.1f} {ok / elapsed * 60:>12.2f} {rounds / elapsed:>9.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Response caches and the cached chat model.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from StoryAgent.agents.cache import CachedChatModel, MemoryCache, SQLiteCache, TieredCache
+from StoryAgent.agents.fake_llm import FakeChatModel
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT key, accessed FROM responses").fetchall())
+    finally:
+        conn.close()
+
+def test_hits_do_not_write_until_flushed(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteCache(path, flush_every=3)
+    monkeypatch.setattr(time, "time", lambda: 100.0)
+    for key in "abc":
+        cache.put(key, key)
+    monkeypatch.setattr(time, "time", lambda: 200.0)
+    assert cache.get("a") == "a" and cache.get("b") == "b"
+    assert set(rows(path).values()) == {100.0}
+    cache.get("c")  # Hits on a third entry flush the access times
+    assert set(rows(path).values()) == {200.0}
+    assert cache.stats() == {"hits": 3, "misses": 0, "hit_rate": 1.0}
+
+def test_least_recently_used_entries_are_evicted_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteCache(path, max_entries=3, evict_every=4)
+    for key in "abc":
+        cache.put(key, key)
+    cache.get("a")
+    cache.put("d", "d")  # Fourth put evicts b, the least recently used
+    assert sorted(rows(path)) == ["a", "c", "d"]
+    cache.put("e", "e")
+    assert len(rows(path)) == 4  # Over the limit until the next eviction
+    cache.close()
+    assert len(rows(path)) == 3
+
+def test_async_calls_run_off_the_event_loop(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    threads = []
+    get = cache._get
+
+    def recording_get(key):
+        threads.append(threading.current_thread())
+        return get(key)
+    cache._get = recording_get
+
+    async def run():
+        await cache.aput("a", "1")
+        return await cache.aget("a"), await cache.aget("b")
+    assert asyncio.run(run()) == ("1", None)
+    assert threads and threading.main_thread() not in threads
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteCache(path).put("a", "1")
+    cache = TieredCache(MemoryCache(), SQLiteCache(path))
+    assert asyncio.run(cache.aget("a")) == "1"
+    assert cache.memory.get("a") == "1"
+    cache.close()
+
+def test_counters_are_consistent_across_threads():
+    cache = MemoryCache()
+    cache.put("a", "1")
+
+    def hit():
+        for _ in range(1000):
+            cache.get("a")
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.hits == 8000
+
+def test_cached_model_answers_repeated_async_calls(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    model = CachedChatModel(FakeChatModel(), cache, "fake", 0.0)
+    messages = [{"role": "user", "content": "You are a story writer."}]
+    first = asyncio.run(model.ainvoke(messages))
+    second = asyncio.run(model.ainvoke(messages))
+    assert second.content == first.content
+    assert second.response_metadata["cache_hit"]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The chapter writer: its shared cache and the synopses of the chapters.
+"""
+
+import os
+from StoryAgent.agents import chapters
+from StoryAgent.agents.chapters import ChapterPlan, ChapterWriter, chapter_cache, close_chapter_caches
+from StoryAgent.agents.fake_llm import FakeChatModel
+from StoryAgent.agents.prompt import estimate_tokens
+
+def writer(plan):
+    return ChapterWriter(plan, FakeChatModel(), "fake", "English")
+
+def test_cache_is_opened_on_first_use_and_shared(tmp_path):
+    path = str(tmp_path / "chapters.sqlite")
+    first, second = writer(ChapterPlan(cache_path=path)), writer(ChapterPlan(cache_path=path))
+    assert not os.path.exists(path)
+    assert first.cache is second.cache is chapter_cache(path)
+    assert os.path.exists(path)
+    close_chapter_caches()
+    assert not chapters._caches
+    assert writer(ChapterPlan(cache_path=path)).cache is not first.cache
+    close_chapter_caches()
+
+def test_synopses_keep_the_latest_summaries_within_the_budget():
+    summaries = [f"Summary of chapter {number:02d}." for number in range(1, 11)]
+    budget = estimate_tokens(summaries[0]) * 3
+    synopses = writer(ChapterPlan(synopsis_tokens=budget))._synopses(summaries)
+    assert len(synopses) == 11 and synopses[0] == ""
+    assert synopses[2] == "\n\n".join(summaries[:2])
+    assert synopses[10] == "\n\n".join(summaries[7:])
+    assert all(estimate_tokens(synopsis) <= budget + 2 for synopsis in synopses)
+
+def test_synopsis_keeps_the_previous_summary_over_the_budget():
+    synopses = writer(ChapterPlan(synopsis_tokens=1))._synopses(["First.", "Second."])
+    assert synopses == ["", "First.", "Second."]
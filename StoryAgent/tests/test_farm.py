@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Job queue and result store of the story farm, and a worker running with the fake model.
+"""
+
+import json
+import time
+import sqlite3
+import asyncio
+from StoryAgent.farm import ABANDONED, FarmSettings, JobQueue, ResultStore, enqueue_manifest, work
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+def write_manifest(path, jobs):
+    with open(path, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps({"world_config": WORLD_CONFIG, "actors_dir": ACTORS_DIR, **job}) + "\n")
+    return str(path)
+
+def test_manifests_without_ids_do_not_collide(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    first = write_manifest(tmp_path / "m1.jsonl", [{"seed": 1}, {"seed": 2}, {"seed": 3}])
+    second = write_manifest(tmp_path / "m2.jsonl", [{"seed": 4}, {"seed": 5}])
+    assert enqueue_manifest(queue, first) == 3
+    assert enqueue_manifest(queue, second) == 2
+    assert queue.counts()["queued"] == 5
+    # Enqueuing a manifest again adds nothing
+    assert enqueue_manifest(queue, first) == 0
+    assert queue.counts()["queued"] == 5
+
+def test_repeated_lines_are_separate_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    manifest = write_manifest(tmp_path / "m.jsonl", [{"seed": 1}, {"seed": 1}, {"seed": 1, "job_id": "mine"}])
+    assert enqueue_manifest(queue, manifest) == 3
+    assert enqueue_manifest(queue, manifest) == 0
+
+def test_invalid_jobs_are_not_queued(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    manifest = write_manifest(tmp_path / "m.jsonl", [{"seed": 1}, {"world_config": str(tmp_path / "missing.json")}])
+    assert enqueue_manifest(queue, manifest) == 1
+
+def test_worker_runs_the_jobs_of_two_manifests(tmp_path):
+    queue_path, results_path = str(tmp_path / "queue.sqlite"), str(tmp_path / "results.sqlite")
+    queue = JobQueue(queue_path)
+    enqueue_manifest(queue, write_manifest(tmp_path / "m1.jsonl", [{"seed": 1, "max_iterations": 2},
+                                                                  {"seed": 2, "max_iterations": 3}]))
+    enqueue_manifest(queue, write_manifest(tmp_path / "m2.jsonl", [{"seed": 3, "max_iterations": 2}]))
+    settings = FarmSettings(queue_path=queue_path, results_path=results_path, model="fake", concurrency=2)
+    stats = asyncio.run(work(settings, "worker-1"))
+    assert (stats.ok, stats.failed, stats.rounds) == (3, 0, 7)
+    assert queue.counts() == {"queued": 0, "running": 0, "done": 3, "failed": 0}
+    records = list(ResultStore(results_path).records())
+    assert sorted(record["seed"] for record in records) == [1, 2, 3]
+    assert all(record["status"] == "ok" and record["story"] for record in records)
+
+def test_abandoned_job_without_attempts_left_is_recorded(tmp_path):
+    queue_path, results_path = str(tmp_path / "queue.sqlite"), str(tmp_path / "results.sqlite")
+    queue = JobQueue(queue_path, max_attempts=2)
+    enqueue_manifest(queue, write_manifest(tmp_path / "m.jsonl", [{"seed": 1, "job_id": "lost"}]))
+    conn = sqlite3.connect(queue_path)
+    conn.execute("UPDATE jobs SET status = 'running', attempts = 2, worker = 'dead', heartbeat = ?",
+                 (time.time() - 3600,))
+    conn.commit()
+    settings = FarmSettings(queue_path=queue_path, results_path=results_path, model="fake", max_attempts=2)
+    stats = asyncio.run(work(settings, "worker-1"))
+    assert stats.jobs == 0
+    assert queue.counts()["failed"] == 1
+    record = ResultStore(results_path).get("lost")
+    assert (record["status"], record["error"], record["attempts"]) == ("failed", ABANDONED, 2)
+
+def test_abandoned_job_is_run_again(tmp_path):
+    queue_path, results_path = str(tmp_path / "queue.sqlite"), str(tmp_path / "results.sqlite")
+    queue = JobQueue(queue_path)
+    enqueue_manifest(queue, write_manifest(tmp_path / "m.jsonl", [{"seed": 1, "max_iterations": 2, "job_id": "lost"}]))
+    conn = sqlite3.connect(queue_path)
+    conn.execute("UPDATE jobs SET status = 'running', attempts = 1, worker = 'dead', heartbeat = ?",
+                 (time.time() - 3600,))
+    conn.commit()
+    settings = FarmSettings(queue_path=queue_path, results_path=results_path, model="fake")
+    assert asyncio.run(work(settings, "worker-1")).ok == 1
+    assert ResultStore(results_path).get("lost")["attempts"] == 2
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Folding of older rounds into the rolling summary.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from StoryAgent.agents.history import HistoryCompactor, HistoryWindow
+from StoryAgent.agents.message import Message, MessageLog
+from StoryAgent.agents.prompt import estimate_tokens, render_round
+
+class SummaryModel:
+    """Records the options of the calls and answers with a fixed summary."""
+
+    def __init__(self):
+        self.options = []
+
+    def invoke(self, messages, **options):
+        self.options.append(options)
+        return SimpleNamespace(content="The summary.", usage_metadata=None, response_metadata={})
+
+    async def ainvoke(self, messages, **options):
+        return self.invoke(messages, **options)
+
+def rounds(n):
+    return MessageLog(Message("Thorn", f"<speak> Round {i:02d} of the story. </speak>") for i in range(n))
+
+ROUND = estimate_tokens(render_round("Thorn", rounds(1)[0].public))
+
+def play(compactor, count):
+    """Fold after every round, as the controller does, and return the folded ranges."""
+    state, folds = {"messages": rounds(count), "summary": "", "summarized": 0}, []
+    for length in range(1, count + 1):
+        update = compactor.fold({**state, "messages": state["messages"][:length]})
+        if update:
+            folds.append((state["summarized"], update["summarized"]))
+            state.update(update)
+    return folds
+
+def test_folds_down_to_half_the_budget():
+    compactor = HistoryCompactor(HistoryWindow(keep_rounds=2, token_budget=ROUND * 8), SummaryModel())
+    assert play(compactor, 30) == [(0, 5), (5, 10), (10, 15), (15, 20), (20, 25)]
+
+def test_no_folding_when_the_kept_rounds_exceed_the_budget(caplog):
+    compactor = HistoryCompactor(HistoryWindow(keep_rounds=6, token_budget=ROUND * 4), SummaryModel())
+    assert play(compactor, 12) == []
+    assert sum("exceed the history budget" in record.message for record in caplog.records) == 1
+
+def test_folds_never_reach_the_kept_rounds():
+    compactor = HistoryCompactor(HistoryWindow(keep_rounds=5, token_budget=ROUND * 6), SummaryModel())
+    assert play(compactor, 12) == [(0, 2), (2, 4), (4, 6)]
+
+def test_summary_call_gets_the_run_options():
+    model = SummaryModel()
+    compactor = HistoryCompactor(HistoryWindow(keep_rounds=1, token_budget=ROUND), model)
+    state = {"messages": rounds(3), "summary": "", "summarized": 0}
+    config = {"configurable": {"seed": 7}}
+    assert compactor.fold(state, config)["summarized"] == 2
+    assert asyncio.run(compactor.afold(state, config))["summary"] == "The summary."
+    assert model.options == [{"seed": 7}, {"seed": 7}]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parsed messages and the append-only message log.
+"""
+
+import pytest
+from StoryAgent.agents.message import Message, MessageLog, append_messages
+
+def messages(n, prefix="m"):
+    return [Message(f"{prefix}{i}", f"<speak> {prefix}{i} </speak>") for i in range(n)]
+
+def test_message_hides_thoughts_from_the_others():
+    msg = Message("Thorn", "<think> secret </think><speak> hi </speak>")
+    assert msg.segments == (("think", "secret"), ("speak", "hi"))
+    assert msg.texts("speak") == ["hi"]
+    assert msg.view("Thorn") == msg.content
+    assert "secret" not in msg.view("Grimrock")
+
+def test_message_hides_an_unclosed_thought():
+    msg = Message("Thorn", "<think> secret <speak> hi </speak>")
+    assert "secret" not in msg.public
+    assert msg.texts("speak") == ["hi"]
+
+def test_message_is_rebuilt_from_sender_and_content():
+    msg = Message("Thorn", "<think> secret </think><speak> hi </speak>")
+    assert Message(**msg._asdict()) == msg
+
+def test_append_to_the_newest_view_shares_the_storage():
+    first = MessageLog(messages(2))
+    second = first + messages(1, "n")
+    third = second + messages(1, "o")
+    assert second._items is first._items is third._items
+    assert [msg.sender for msg in third] == ["m0", "m1", "n0", "o0"]
+    assert len(first) == 2 and len(second) == 3
+    assert list(first) == messages(2)
+
+def test_append_to_an_old_view_branches():
+    base = MessageLog(messages(2))
+    main = base + messages(2, "a")
+    branch = base + messages(1, "b")
+    assert [msg.sender for msg in main] == ["m0", "m1", "a0", "a1"]
+    assert [msg.sender for msg in branch] == ["m0", "m1", "b0"]
+    assert branch._items is not main._items
+    # The branch grows on its own storage, the main history is unaffected
+    longer = branch + messages(1, "c")
+    assert longer._items is branch._items
+    assert [msg.sender for msg in main] == ["m0", "m1", "a0", "a1"]
+
+def test_reappending_the_same_messages_shares_the_storage():
+    base = MessageLog(messages(2))
+    new = messages(2, "a")
+    first = base + new
+    again = base + new
+    assert again._items is first._items
+    assert again == first
+
+def test_reappending_equal_but_other_messages_branches():
+    base = MessageLog(messages(2))
+    first = base + messages(2, "a")
+    again = base + messages(2, "a")
+    assert again._items is not first._items
+    assert again == first
+
+def test_reappending_a_prefix_of_the_messages():
+    base = MessageLog(messages(1))
+    new = messages(3, "a")
+    full = base + new
+    partial = base + new[:2]
+    assert partial._items is full._items
+    assert len(partial) == 3 and partial[-1] is new[1]
+
+def test_extend_with_nothing_returns_the_log():
+    log = MessageLog(messages(2))
+    assert log.extend([]) is log
+
+def test_indexing_and_slicing_stay_within_the_view():
+    base = MessageLog(messages(2))
+    base + messages(3, "a")  # Storage beyond the view
+    assert base[-1].sender == "m1"
+    assert [msg.sender for msg in base[0:10]] == ["m0", "m1"]
+    assert [msg.sender for msg in base[::-1]] == ["m1", "m0"]
+    with pytest.raises(IndexError):
+        base[2]
+    with pytest.raises(IndexError):
+        base[-3]
+
+def test_append_messages_reducer():
+    log = append_messages([], messages(1))
+    assert isinstance(log, MessageLog)
+    log = append_messages(log, Message("n", "<speak> n </speak>"))
+    assert [msg.sender for msg in log] == ["m0", "n"]
+    assert MessageLog(**log._asdict()) == log
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tolerant tag parsing of agent outputs and matching of actor IDs.
+"""
+
+import pytest
+from types import SimpleNamespace
+from StoryAgent.agents.parser import TagParser, match_actor_id, parse_tags
+
+OUTPUT = "<think> I doubt him. </think>\n\n<speak> Hello there. </speak>\n\n<action> Thorn waves. </action>"
+
+def feed(chunks):
+    parser = TagParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+def pairs(parsed):
+    return [(segment.tag, segment.text, segment.closed) for segment in parsed.segments]
+
+def test_well_formed_output():
+    parsed = parse_tags(OUTPUT)
+    assert pairs(parsed) == [("think", "I doubt him.", True), ("speak", "Hello there.", True),
+                             ("action", "Thorn waves.", True)]
+    assert not parsed.recovered
+    assert parsed.without("think") == OUTPUT[len("<think> I doubt him. </think>"):]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16])
+def test_chunks_split_anywhere_parse_like_the_whole_output(size):
+    chunks = [OUTPUT[i:i + size] for i in range(0, len(OUTPUT), size)]
+    assert pairs(feed(chunks)) == pairs(parse_tags(OUTPUT))
+    assert feed(chunks).text == OUTPUT
+
+def test_tag_split_across_chunks():
+    parsed = feed(["<sp", "eak> hi </spe", "ak", ">"])
+    assert pairs(parsed) == [("speak", "hi", True)]
+
+def test_whitespace_and_case_in_tags():
+    parsed = parse_tags("< SPEAK > hi </ Speak >\n<Actor>forest_shaman</ACTOR>")
+    assert pairs(parsed) == [("speak", "hi", True), ("actor", "forest_shaman", True)]
+
+def test_unclosed_tag_is_closed_by_the_next_opening_tag():
+    parsed = parse_tags("<think> secret <speak> hi </speak>")
+    assert pairs(parsed) == [("think", "secret", False), ("speak", "hi", True)]
+    assert parsed.recovered
+    assert "secret" not in parsed.without("think")
+
+def test_unclosed_tag_runs_to_the_end():
+    assert pairs(parse_tags("<state> the world changes")) == [("state", "the world changes", False)]
+
+def test_closing_tag_cut_off_at_the_end_is_dropped():
+    assert pairs(parse_tags("<actor> forest_shaman </actor")) == [("actor", "forest_shaman", False)]
+    assert pairs(feed(["<actor> forest_shaman <", "/act"])) == [("actor", "forest_shaman", False)]
+
+def test_orphan_closing_tag_takes_the_text_before_it():
+    parsed = parse_tags("<state> calm </state>\nforest_shaman </actor>")
+    assert pairs(parsed) == [("state", "calm", True), ("actor", "forest_shaman", False)]
+
+def test_untagged_output():
+    parsed = parse_tags("Just some prose, no tags < at all.")
+    assert parsed.segments == []
+    assert parsed.first("speak") is None
+    assert parsed.without("think") == parsed.text
+
+def test_first_skips_empty_segments():
+    assert parse_tags("<actor></actor><actor> b </actor>").first("actor") == "b"
+
+CAST = {"forest_shaman": SimpleNamespace(name="Thorn"),
+        "kingdom_knight": SimpleNamespace(name="Sir Aldric"),
+        "tribe_chief": SimpleNamespace(name="Grimrock")}
+
+@pytest.mark.parametrize("text, expected", [
+    ("forest_shaman", "forest_shaman"),
+    ("  Forest_Shaman. ", "forest_shaman"),
+    ("ID: kingdom_knight", "kingdom_knight"),
+    ("actor: tribe chief", "tribe_chief"),
+    ("forest-shaman", "forest_shaman"),
+    ("\"Thorn\"", "forest_shaman"),
+    ("sir aldric", "kingdom_knight"),
+    ("forest_shamn", "forest_shaman"),
+    ("kingdom_knigth", "kingdom_knight"),
+    ("forest_sha", "forest_shaman"),
+])
+def test_match_actor_id(text, expected):
+    assert match_actor_id(text, CAST) == expected
+
+@pytest.mark.parametrize("text", [None, "", "forest", "fo", "dragon", "controller"])
+def test_match_actor_id_rejects_distant_names(text):
+    assert match_actor_id(text, CAST) is None
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end runs of the workflow with the fake chat model.
+"""
+
+import asyncio
+import pytest
+from StoryAgent.agents.controller import ControllerAgent
+from StoryAgent.agents.trace import MemoryTraceSink, Tracer
+from StoryAgent.agents.writer import WRITER_ID, WriterAgent
+from StoryAgent.workflow import create_workflow, create_initial_state
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+def run(max_iter: int, use_async: bool = False, **options):
+    app = create_workflow(ACTORS_DIR, max_iter, "English", options.pop("model", "fake"), **options).compile()
+    state = create_initial_state(ACTORS_DIR, WORLD_CONFIG)
+    config = {"recursion_limit": max_iter * 10}
+    return asyncio.run(app.ainvoke(state, config)) if use_async else app.invoke(state, config)
+
+def assert_story(result, max_iter: int):
+    senders = [msg.sender for msg in result["messages"]]
+    assert senders[-1] == WRITER_ID
+    assert len(senders) - 1 == max_iter
+    assert WRITER_ID not in senders[:-1]
+
+@pytest.mark.parametrize("max_iter", [1, 3, 5])
+def test_serial_rounds(max_iter):
+    assert_story(run(max_iter), max_iter)
+
+@pytest.mark.parametrize("max_parallel", [2, 3])
+@pytest.mark.parametrize("max_iter", [3, 4, 5, 7, 10])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_parallel_rounds_stop_at_max_iterations(max_parallel, max_iter, seed):
+    assert_story(run(max_iter, model=f"fake:seed={seed}", max_parallel=max_parallel), max_iter)
+
+def test_parallel_rounds_async():
+    for seed in range(3):
+        assert_story(run(5, use_async=True, model=f"fake:seed={seed}", max_parallel=3), 5)
+
+def test_local_schedule_with_groups():
+    assert_story(run(6, schedule="round_robin", max_parallel=2), 6)
+
+@pytest.mark.parametrize("max_parallel", [1, 2])
+def test_state_updates_count_rounds(max_parallel):
+    sink = MemoryTraceSink()
+    result = run(12, schedule="round_robin", state_update_every=2, max_parallel=max_parallel,
+                 tracer=Tracer([sink]))
+    assert_story(result, 12)
+    rounds = [record for record in sink.records if record.node == "controller"]
+    assert len(rounds) == 12 // max_parallel
+    # The world state is updated at every second round, but not before the first one
+    assert sum(record.llm_calls for record in rounds) == len(range(2, len(rounds), 2))
+
+def test_prompts_describe_group_rounds():
+    single = "only this authorized character is allowed"
+    assert single in ControllerAgent(model="fake")._render_cast({})
+    group = ControllerAgent(model="fake", max_parallel=3)._render_cast({})
+    assert single not in group and "authorize up to 3 characters" in group
+    assert "only one character" in WriterAgent(model="fake")._render_static({})
+    assert "only one character" not in WriterAgent(model="fake", max_parallel=3)._render_static({})
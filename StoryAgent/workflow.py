@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Story generation workflow: the graph of the controller, the actors and the writer.
+"""
+
+import logging
+from typing import List, Optional, Sequence, Union
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+from .agents import ActorAgent, ControllerAgent, WriterAgent, AgentState, MessageLog
+from .agents.chapters import ChapterPlan
+from .agents.history import HistoryWindow
+from .agents.stream import StreamSink
+from .agents.trace import Tracer
+from .config import load_cast, load_world
+
+logger = logging.getLogger(__name__)
+
+def should_continue(state: AgentState, writer_id: str, max_iter: int = 3) -> bool:
+    """Determine if the conversation should continue."""
+    # Count only the messages from acting agents (excluding the writer's message)
+    acting_messages = [msg for msg in state["messages"] if writer_id != msg.sender]
+    
+    # If we've already written the story, end the workflow
+    if any(writer_id == msg.sender for msg in state["messages"]):
+        logger.info("Story has been written, ending workflow")
+        return False
+
+    # An actor of a group sees the state before the round plus its own message,
+    # the messages of the other actors of the group are merged after the step.
+    # Count them too, every actor of the group then takes the same decision.
+    acting = len(acting_messages)
+    group = state.get("current_actors") or []
+    if len(group) > 1:
+        before = acting - 1
+        acting = before + min(len(group), max_iter - before)
+    
+    # If we've reached max iterations, go to writer
+    if acting >= max_iter:
+        logger.info(f"Reached max iterations ({max_iter}), proceeding to writer")
+        return False
+    
+    # Otherwise, continue with acting agents
+    logger.info(f"Continuing with acting agents. Current iteration: {acting}/{max_iter}")
+    return True
+
+def route_actors(state: AgentState, writer_id: str, max_iter: int) -> Union[str, List[Send]]:
+    """Route the controller to the authorized actor, or to every actor of a group
+    acting at the same time, without going past the maximum number of rounds.
+    Goes to the writer if no round is left.
+
+    The actors of a group all run on the state left by the controller, and the
+    graph applies their messages in the order of the sends, i.e. in the order
+    the controller chose them, whichever finishes first.
+    """
+    remaining = max_iter - sum(writer_id != msg.sender for msg in state["messages"])
+    if remaining <= 0:
+        logger.info(f"Reached max iterations ({max_iter}), proceeding to writer")
+        return "writer"
+    group = state.get("current_actors") or []
+    if len(group) <= 1:
+        return state["current_actor"]
+    group = group[:remaining]
+    logger.info(f"Actors acting at the same time: {', '.join(group)}")
+    return [Send(actor_id, state) for actor_id in group]
+
+def as_node(agent, tracer: Optional[Tracer] = None) -> RunnableLambda:
+    """Wrap an agent so that the graph runs it with both invoke and ainvoke,
+    traced if a tracer is given."""
+    if tracer is None:
+        return RunnableLambda(agent, afunc=agent.acall)
+    func, afunc = tracer.wrap(agent, agent.acall)
+    return RunnableLambda(func, afunc=afunc)
+
+def create_workflow(actors_dir: str, max_iter: int, lang: str, model: str,
+                    history_window: Optional[HistoryWindow] = None,
+                    schedule: str = "llm", state_update_every: int = 1, parse_retries: int = 2,
+                    prompt_layout: str = "classic", max_parallel: int = 1,
+                    chapters: Optional[ChapterPlan] = None,
+                    sinks: Sequence[StreamSink] = (), tracer: Optional[Tracer] = None) -> StateGraph:
+    """Create the story generation workflow. With `max_parallel` > 1 the controller
+    may authorize up to that many actors to act at the same time in a round.
+    With `chapters` the writer writes long transcripts chapter by chapter."""
+    logger.info("Starting story generation workflow")
+    
+    # Get actor configurations
+    actors = load_cast(actors_dir)
+    actor_ids = list(actors)
+    logger.info(f"Found {len(actor_ids)} actors: {', '.join(actor_ids)}")
+    
+    # Create the graph
+    workflow = StateGraph(AgentState)
+    logger.info("Created state graph")
+    
+    # Add nodes for each agent
+    for actor_id in actor_ids:
+        actor = ActorAgent(actor_id, actors[actor_id], model=model, sinks=sinks, layout=prompt_layout)
+        workflow.add_node(actor_id, as_node(actor, tracer))
+        logger.debug(f"Added node for actor: {actor_id}")
+    
+    # Add controller and writer nodes
+    controller = ControllerAgent(model=model, history_window=history_window,
+                                 schedule=schedule, state_update_every=state_update_every,
+                                 parse_retries=parse_retries, layout=prompt_layout,
+                                 max_parallel=max_parallel)
+    workflow.add_node("controller", as_node(controller, tracer))
+    writer = WriterAgent(lang=lang, model=model, sinks=sinks, chapters=chapters,
+                         max_parallel=max_parallel)
+    writer_id = writer.writer_id
+    workflow.add_node("writer", as_node(writer, tracer))
+    logger.info(f"Added all nodes to workflow with model: {model}")
+    
+    # Set the entry point
+    workflow.set_entry_point("controller")
+    logger.debug("Set controller as entry point")
+    
+    # Add conditional edges for each actor
+    for actor_id in actor_ids:
+        workflow.add_conditional_edges(
+            actor_id,
+            lambda state, writer_id=writer_id, max_iter=max_iter: should_continue(state, writer_id, max_iter),
+            {
+                True: "controller",  # Continue with acting agents
+                False: "writer"      # Go to writer when max iterations reached
+            }
+        )
+        logger.debug(f"Added conditional edges for actor: {actor_id}")
+    
+    # Add edge from controller to actors
+    workflow.add_conditional_edges(
+        "controller",
+        lambda state, writer_id=writer_id, max_iter=max_iter: route_actors(state, writer_id, max_iter),
+        {**{actor_id: actor_id for actor_id in actor_ids}, "writer": "writer"}
+    )
+    logger.debug("Added edges from controller to actors")
+    
+    # Add edge from writer to end
+    workflow.add_edge("writer", END)
+    logger.debug("Added edge from writer to end")
+    
+    return workflow
+
+def create_initial_state(actors_dir: str, world_config: str) -> AgentState:
+    """Create the initial state of a story."""
+    return AgentState(
+        messages=MessageLog(),
+        actors=load_cast(actors_dir),
+        current_actor="controller",
+        current_actors=[],
+        world_state=load_world(world_config),
+        summary="",
+        summarized=0,
+        rounds=0
+    )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Concurrency scaling of the asynchronous workflow, using the fake chat model
+with a fixed latency per call. All stories share one compiled graph and one
+event loop.
+
+Usage: python -m benchmarks.bench_async [--stories 1 4 16 64] [--latency 0.2]
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+
+from StoryAgent.workflow import create_workflow, create_initial_state
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+async def run_stories(app, n: int, max_iter: int):
+    config = {"recursion_limit": max_iter * 10}
+    return await asyncio.gather(*(
+        app.ainvoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG), config=config)
+        for _ in range(n)
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Async workflow concurrency benchmark")
+    parser.add_argument("--stories", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per LLM call")
+    parser.add_argument("--max-iterations", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    model = f"fake:latency={args.latency}"
+    app = create_workflow(ACTORS_DIR, args.max_iterations, "English", model).compile()
+    calls = 2 * args.max_iterations + 1  # controller + actor per round, then the writer
+
+    start = time.perf_counter()
+    app.invoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG),
+               config={"recursion_limit": args.max_iterations * 10})
+    serial = time.perf_counter() - start
+    print(f"{calls} LLM calls per story at {args.latency}s each, sync single story: {serial:.2f}s")
+
+    print(f"{'stories':>8} {'wall (s)':>10} {'stories/s':>10} {'vs serial':>10}")
+    for n in args.stories:
+        start = time.perf_counter()
+        results = asyncio.run(run_stories(app, n, args.max_iterations))
+        wall = time.perf_counter() - start
+        assert all(len(result["messages"]) == args.max_iterations + 1 for result in results)
+        print(f"{n:>8} {wall:>10.2f} {n / wall:>10.2f} {n * serial / wall:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
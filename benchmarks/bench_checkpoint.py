@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checkpoint storage cost per round of a story, with the plain and the compressed
+serializer of the SQLite checkpointer, and the fake chat model.
+
+Usage: python -m benchmarks.bench_checkpoint [--rounds 10 50 100]
+"""
+
+import os
+import time
+import logging
+import sqlite3
+import argparse
+import tempfile
+from contextlib import closing
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from StoryAgent.checkpoint import CompressedSerializer, thread_config
+from StoryAgent.workflow import create_workflow, create_initial_state
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+def stored_bytes(conn: sqlite3.Connection) -> int:
+    """Bytes of the serialized checkpoints and pending writes."""
+    checkpoints, = conn.execute("SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) "
+                                "FROM checkpoints").fetchone()
+    writes, = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()
+    return checkpoints + writes
+
+def measure(rounds: int, serde: JsonPlusSerializer, path: str):
+    app = create_workflow(ACTORS_DIR, rounds, "English", "fake").compile(
+        checkpointer=SqliteSaver(sqlite3.connect(path, check_same_thread=False), serde=serde))
+    start = time.perf_counter()
+    app.invoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG), config=thread_config("bench", rounds * 10))
+    wall = time.perf_counter() - start
+    with closing(sqlite3.connect(path)) as conn:
+        total = stored_bytes(conn)
+        count, = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()
+    return total, count, wall
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint storage benchmark")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 50, 100])
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'rounds':>6} {'serializer':>11} {'checkpoints':>12} {'stored (KB)':>12} "
+          f"{'per round (KB)':>15} {'wall (s)':>9}")
+    for rounds in args.rounds:
+        for name, serde in [("plain", JsonPlusSerializer()), ("compressed", CompressedSerializer())]:
+            with tempfile.TemporaryDirectory() as tmp:
+                total, count, wall = measure(rounds, serde, os.path.join(tmp, "checkpoints.sqlite"))
+            print(f"{rounds:>6} {name:>11} {count:>12} {total / 1024:>12.1f} "
+                  f"{total / 1024 / rounds:>15.2f} {wall:>9.2f}")
+
+if __name__ == "__main__":
+    main()
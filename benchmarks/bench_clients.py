@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Connection reuse and concurrency limits of the chat-model clients, against the
+local stub server: concurrent stories with a client per agent (as before the
+shared registry), with the shared registry, and with a small shared pool.
+
+Usage: python -m benchmarks.bench_clients [--stories 8] [--max-iterations 6] [--latency 0.05]
+"""
+
+import os
+import time
+import asyncio
+import logging
+import argparse
+
+from StoryAgent.agents.llm import ClientOptions, set_client_options
+from StoryAgent.workflow import create_workflow, create_initial_state
+from benchmarks.stub_server import start_stub_server
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+async def run_stories(stories: int, max_iterations: int):
+    apps = [create_workflow(ACTORS_DIR, max_iterations, "English", "deepseek-chat").compile()
+            for _ in range(stories)]
+    await asyncio.gather(*(app.ainvoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG),
+                                       config={"recursion_limit": max_iterations * 10})
+                           for app in apps))
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat-model client benchmark")
+    parser.add_argument("--stories", type=int, default=8, help="Stories generated at once")
+    parser.add_argument("--max-iterations", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per response of the stub")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("DEEPSEEK_API_KEY", "stub")
+
+    modes = [
+        ("client per agent", {"shared": False}),
+        ("shared registry", {}),
+        ("shared, 4 connections", {"max_connections": 4, "max_keepalive_connections": 4}),
+    ]
+    print(f"{'clients':>22} {'requests':>9} {'connections':>12} {'peak in flight':>15} {'wall (s)':>9}")
+    for label, options in modes:
+        server = start_stub_server(latency=args.latency)
+        set_client_options(ClientOptions(base_url=server.base_url, **options))
+        start = time.perf_counter()
+        asyncio.run(run_stories(args.stories, args.max_iterations))
+        wall = time.perf_counter() - start
+        server.shutdown()
+        stats = server.stats
+        print(f"{label:>22} {stats.requests:>9} {stats.connections:>12} {stats.peak_in_flight:>15} {wall:>9.2f}")
+    set_client_options(ClientOptions())
+
+if __name__ == "__main__":
+    main()
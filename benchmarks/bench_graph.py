@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark of the full graph with the deterministic fake chat model,
+over cast sizes and iteration counts. Every case runs in its own process and
+reports throughput, CPU time (which excludes the simulated latency), peak RSS
+and prompt bytes per LLM call. Results are appended to a JSONL file, and every
+case is compared with the same case of the previous run in that file.
+
+Casts larger than the bundled one are made of copies of the bundled actors
+with numbered names.
+
+Usage: python -m benchmarks.bench_graph [--casts 3 20 200] [--iterations 10 100 1000]
+                                        [--latency 0] [--length 60] [--results FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+RESULTS = "benchmarks/results/graph.jsonl"
+
+def make_cast(size: int, directory: str) -> str:
+    """Write a cast of `size` actors to the directory and return it."""
+    templates = sorted(f for f in os.listdir(ACTORS_DIR) if f.endswith(".json"))
+    for i in range(size):
+        template = templates[i % len(templates)]
+        with open(os.path.join(ACTORS_DIR, template), "r", encoding="utf-8") as f:
+            actor = json.load(f)
+        copy = i // len(templates)
+        if copy:
+            actor["name"] = f"{actor['name']} {copy + 1}"
+        actor_id = template[:-5] if not copy else f"{template[:-5]}_{copy + 1}"
+        with open(os.path.join(directory, f"{actor_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(actor, f, ensure_ascii=False)
+    return directory
+
+def run_case(cast: int, iterations: int, latency: float, length: int) -> Dict[str, Any]:
+    """Generate one story and return its measurements."""
+    from StoryAgent.agents.trace import MemoryTraceSink, Tracer
+    from StoryAgent.workflow import create_workflow, create_initial_state
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        actors_dir = make_cast(cast, tmp)
+        sink = MemoryTraceSink()
+        app = create_workflow(actors_dir, iterations, "English", f"fake:latency={latency},length={length}",
+                              tracer=Tracer([sink])).compile()
+        state = create_initial_state(actors_dir, WORLD_CONFIG)
+        cpu, wall = time.process_time(), time.perf_counter()
+        result = app.invoke(state, config={"recursion_limit": iterations * 10})
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    assert len(result["messages"]) == iterations + 1
+    calls = sum(record.llm_calls for record in sink.records)
+    return {
+        "cast": cast,
+        "iterations": iterations,
+        "wall": wall,
+        "cpu": cpu,
+        "rounds_per_second": iterations / wall,
+        "cpu_per_round_ms": cpu / iterations * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "prompt_bytes_per_call": sum(record.prompt_bytes for record in sink.records) / max(calls, 1),
+        "llm_calls": calls
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def previous_run(path: str) -> Dict[tuple, Dict[str, Any]]:
+    """Cases of the last run stored in the results file, by (cast, iterations, latency, length)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return {}
+    run = json.loads(lines[-1])
+    return {(case["cast"], case["iterations"], run["latency"], run["length"]): case for case in run["cases"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Full graph benchmark with the fake chat model")
+    parser.add_argument("--casts", type=int, nargs="+", default=[3, 20, 200], help="Numbers of actors")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[10, 100, 1000], help="Rounds per story")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--length", type=int, default=60, help="Words per fake response")
+    parser.add_argument("--results", default=RESULTS, help=f"JSONL file the runs are appended to (default: {RESULTS})")
+    parser.add_argument("--case", type=int, nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(*args.case, args.latency, args.length)))
+        return
+
+    previous = previous_run(args.results)
+    cases: List[Dict[str, Any]] = []
+    print(f"{'actors':>6} {'rounds':>6} {'wall (s)':>9} {'rounds/s':>9} {'CPU ms/round':>13} "
+          f"{'peak RSS (MB)':>14} {'prompt KB/call':>15} {'vs previous':>12}")
+    for cast in args.casts:
+        for iterations in args.iterations:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_graph", "--case", str(cast), str(iterations),
+                 "--latency", str(args.latency), "--length", str(args.length)],
+                capture_output=True, text=True, check=True).stdout
+            case = json.loads(output.strip().splitlines()[-1])
+            cases.append(case)
+            before = previous.get((cast, iterations, args.latency, args.length))
+            change = (f"{case['rounds_per_second'] / before['rounds_per_second'] - 1:>+12.1%}"
+                      if before else f"{'-':>12}")
+            print(f"{cast:>6} {iterations:>6} {case['wall']:>9.2f} {case['rounds_per_second']:>9.1f} "
+                  f"{case['cpu_per_round_ms']:>13.2f} {case['peak_rss_mb']:>14.1f} "
+                  f"{case['prompt_bytes_per_call'] / 1024:>15.1f} {change}", flush=True)
+
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(),
+                            "latency": args.latency, "length": args.length, "cases": cases}) + "\n")
+    print(f"Results appended to {args.results}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Prompt tokens per turn with the full history against the rolling-summary
+history window, on a long story with the fake chat model.
+
+Usage: python -m benchmarks.bench_history [--max-iterations 200] [--keep-rounds 10] [--token-budget 4000]
+"""
+
+import time
+import logging
+import argparse
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+from StoryAgent.agents.history import HistoryWindow, estimate_tokens
+from StoryAgent.workflow import create_workflow, create_initial_state
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+class PromptTokenRecorder(BaseCallbackHandler):
+    """Records the estimated prompt tokens of every LLM call, per graph node."""
+
+    def __init__(self):
+        self.tokens: Dict[str, List[int]] = defaultdict(list)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        node = (metadata or {}).get("langgraph_node", "?")
+        node = node if node in ("controller", "writer") else "actor"
+        self.tokens[node].append(sum(estimate_tokens(str(m.content)) for batch in messages for m in batch))
+
+def run(max_iter: int, window: Optional[HistoryWindow]) -> PromptTokenRecorder:
+    recorder = PromptTokenRecorder()
+    app = create_workflow(ACTORS_DIR, max_iter, "English", "fake", history_window=window).compile()
+    app.invoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG),
+               config={"recursion_limit": max_iter * 10, "callbacks": [recorder]})
+    return recorder
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens per turn with and without history compaction")
+    parser.add_argument("--max-iterations", type=int, default=200)
+    parser.add_argument("--keep-rounds", type=int, default=10)
+    parser.add_argument("--token-budget", type=int, default=4000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    modes = {"full history": None,
+             "window": HistoryWindow(keep_rounds=args.keep_rounds, token_budget=args.token_budget)}
+    results = {}
+    for name, window in modes.items():
+        start = time.perf_counter()
+        results[name] = run(args.max_iterations, window)
+        print(f"{name}: {time.perf_counter() - start:.2f}s")
+
+    rounds = sorted({r for r in (1, 10, 50, 100, 200, 500, 1000) if r <= args.max_iterations} | {args.max_iterations})
+    print(f"\nEstimated actor prompt tokens per turn")
+    print(f"{'round':>8}" + "".join(f"{name:>16}" for name in modes))
+    for r in rounds:
+        print(f"{r:>8}" + "".join(f"{results[name].tokens['actor'][r - 1]:>16}" for name in modes))
+    print(f"\n{'':>24}" + "".join(f"{name:>16}" for name in modes))
+    for node in ("controller", "actor", "writer"):
+        for stat, fn in (("max", max), ("total", sum)):
+            print(f"{node + ' ' + stat:>24}" + "".join(f"{fn(results[name].tokens[node]):>16}" for name in modes))
+    print(f"{'LLM calls':>24}" + "".join(
+        f"{sum(len(v) for v in results[name].tokens.values()):>16}" for name in modes))
+
+if __name__ == "__main__":
+    main()
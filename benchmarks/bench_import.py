@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cold-start cost of the package and the command line, from `python -X importtime`:
+total import time, wall time of the process, and the slowest top-level imports.
+
+Usage: python -m benchmarks.bench_import [--repeat 5] [--top 5]
+"""
+
+import re
+import sys
+import time
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+TARGETS = [
+    ("import StoryAgent", ["-c", "import StoryAgent"]),
+    ("import main", ["-c", "import main"]),
+    ("main.py --help", ["main.py", "--help"]),
+    ("import StoryAgent.workflow", ["-c", "import StoryAgent.workflow"]),
+]
+
+HEAVY = ("openai", "langchain", "langgraph", "dotenv")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def importtime(argv: List[str]) -> Tuple[float, Dict[str, int]]:
+    """Run a fresh interpreter, return its wall time and the cumulative import
+    time in microseconds of every import, nested imports prefixed by spaces."""
+    start = time.perf_counter()
+    stderr = subprocess.run([sys.executable, "-X", "importtime", *argv],
+                            capture_output=True, text=True, check=True).stderr
+    wall = time.perf_counter() - start
+    imports = {}
+    for match in _LINE.finditer(stderr):
+        _, cumulative, indent, name = match.groups()
+        imports[indent[1:] + name] = int(cumulative)
+    return wall, imports
+
+def total(imports: Dict[str, int]) -> int:
+    return sum(cumulative for name, cumulative in imports.items() if not name.startswith(" "))
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per target, the best is kept")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest top-level imports to list")
+    args = parser.parse_args()
+
+    for label, argv in TARGETS:
+        runs = [importtime(argv) for _ in range(args.repeat)]
+        wall, imports = min(runs, key=lambda run: total(run[1]))
+        modules = {name.strip().split(".")[0] for name in imports}
+        heavy = sorted(modules.intersection(HEAVY))
+        top = {name: cumulative for name, cumulative in imports.items() if not name.startswith(" ")}
+        print(f"{label}: imports {total(imports) / 1000:.1f} ms, process {wall * 1000:.0f} ms, "
+              f"heavy dependencies: {', '.join(heavy) or 'none'}")
+        for name, cumulative in sorted(top.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {cumulative / 1000:>8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Memory and time of the history over long sessions: the append-only MessageLog
+reducer against copying the history list with `state["messages"] + [msg]` in
+every node, as the agents did before. Each variant runs in its own process so
+that the peak RSS is its own.
+
+Usage: python -m benchmarks.bench_messages [--rounds 1000 5000] [--length 2000]
+"""
+
+import sys
+import time
+import resource
+import argparse
+import subprocess
+import tracemalloc
+from typing import Annotated, List, TypedDict
+from langgraph.graph import StateGraph, END
+
+from StoryAgent.agents.message import Message, MessageLog, append_messages
+
+class ListState(TypedDict):
+    messages: List[Message]
+
+class LogState(TypedDict):
+    messages: Annotated[MessageLog, append_messages]
+
+def build(variant: str, rounds: int, length: int, copied: List[int]):
+    """Graph of a single actor speaking `rounds` times. The bytes of the history
+    lists allocated by the list variant are added up in `copied`."""
+    text = "<think>" + "t" * (length // 4) + "</think><speak>" + "s" * (length // 2) + "</speak>"
+
+    def speak_list(state: ListState) -> ListState:
+        messages = state["messages"] + [Message("actor", text)]
+        copied[0] += sys.getsizeof(messages)
+        return ListState(messages=messages)
+
+    def speak_log(state: LogState) -> LogState:
+        return LogState(messages=[Message("actor", text)])
+
+    workflow = StateGraph(ListState if variant == "list" else LogState)
+    workflow.add_node("actor", speak_list if variant == "list" else speak_log)
+    workflow.set_entry_point("actor")
+    workflow.add_conditional_edges("actor", lambda state: len(state["messages"]) < rounds,
+                                   {True: "actor", False: END})
+    return workflow.compile()
+
+def run(variant: str, rounds: int, length: int):
+    """Run one variant and print its measurements on a single line."""
+    copied = [0]
+    app = build(variant, rounds, length, copied)
+    initial = {"messages": [] if variant == "list" else MessageLog()}
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = app.invoke(initial, config={"recursion_limit": rounds + 10})
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result["messages"]) == rounds
+    if variant == "log":
+        # The storage list grows in place and is never copied
+        copied[0] = sys.getsizeof(result["messages"]._items)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{wall} {peak / 2**20} {rss} {copied[0] / 2**20}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Message history memory benchmark")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--length", type=int, default=2000, help="Characters per message")
+    parser.add_argument("--variant", choices=["list", "log"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.variant:
+        run(args.variant, args.rounds[0], args.length)
+        return
+
+    print(f"{'rounds':>6} {'history':>8} {'wall (s)':>9} {'traced peak (MB)':>17} {'peak RSS (MB)':>14} "
+          f"{'lists allocated (MB)':>21}")
+    for rounds in args.rounds:
+        for variant in ["list", "log"]:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_messages", "--variant", variant,
+                 "--rounds", str(rounds), "--length", str(args.length)],
+                capture_output=True, text=True, check=True).stdout
+            wall, peak, rss, copied = map(float, output.split())
+            print(f"{rounds:>6} {variant:>8} {wall:>9.2f} {peak:>17.1f} {rss:>14.1f} {copied:>21.2f}")
+
+if __name__ == "__main__":
+    main()
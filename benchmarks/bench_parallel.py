@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Serial rounds against rounds where several actors act at the same time, with
+the fake chat model and a simulated latency per LLM call. Reports the wall time
+and the LLM calls per story for every fan-out limit; the story length is the
+same, in actor turns, for all of them.
+
+Usage: python -m benchmarks.bench_parallel [--cast 6] [--iterations 30] [--latency 0.2]
+                                           [--parallel 1 2 4] [--sync]
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from StoryAgent.agents.trace import MemoryTraceSink, Tracer
+from StoryAgent.workflow import create_workflow, create_initial_state
+from benchmarks.bench_graph import WORLD_CONFIG, make_cast
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial against parallel rounds")
+    parser.add_argument("--cast", type=int, default=6, help="Number of actors")
+    parser.add_argument("--iterations", type=int, default=30, help="Actor turns per story")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per LLM call")
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 2, 4], help="Fan-out limits")
+    parser.add_argument("--sync", action="store_true", help="Run with invoke instead of ainvoke")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        actors_dir = make_cast(args.cast, tmp)
+        print(f"{'parallel':>8} {'wall (s)':>9} {'speedup':>8} {'controller calls':>17} {'actor calls':>12}")
+        serial = None
+        for k in args.parallel:
+            sink = MemoryTraceSink()
+            app = create_workflow(actors_dir, args.iterations, "English", f"fake:latency={args.latency}",
+                                  max_parallel=k, tracer=Tracer([sink])).compile()
+            state = create_initial_state(actors_dir, WORLD_CONFIG)
+            config = {"recursion_limit": args.iterations * 10}
+            start = time.perf_counter()
+            result = app.invoke(state, config) if args.sync else asyncio.run(app.ainvoke(state, config))
+            wall = time.perf_counter() - start
+            assert len(result["messages"]) == args.iterations + 1
+            serial = serial or wall
+            controller = sum(record.llm_calls for record in sink.records if record.node == "controller")
+            actors = sum(record.llm_calls for record in sink.records if record.node not in ("controller", "writer"))
+            print(f"{k:>8} {wall:>9.2f} {serial / wall:>7.2f}x {controller:>17} {actors:>12}")
+
+if __name__ == "__main__":
+    main()
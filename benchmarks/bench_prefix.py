@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Prompt cache hits of the classic and the prefix-stable prompt layouts, with the
+fake chat model, which emulates the prompt cache of the provider in blocks of
+64 tokens. Every layout runs in its own process, so that it starts with an
+empty cache. The cost uses the given prices per million tokens.
+
+Usage: python -m benchmarks.bench_prefix [--iterations 50] [--keep-rounds N]
+                                         [--prices 0.27 1.1 0.07]
+"""
+
+import sys
+import json
+import logging
+import argparse
+import subprocess
+from typing import Any, Dict, Optional
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+def run_case(layout: str, iterations: int, keep_rounds: Optional[int]) -> Dict[str, Any]:
+    """Generate one story and return its token counts."""
+    from StoryAgent.agents.history import HistoryWindow
+    from StoryAgent.agents.trace import MemoryTraceSink, Tracer
+    from StoryAgent.workflow import create_workflow, create_initial_state
+
+    logging.getLogger().setLevel(logging.WARNING)
+    sink = MemoryTraceSink()
+    window = HistoryWindow(keep_rounds=keep_rounds, token_budget=0) if keep_rounds else None
+    app = create_workflow(ACTORS_DIR, iterations, "English", "fake", history_window=window,
+                          prompt_layout=layout, tracer=Tracer([sink])).compile()
+    app.invoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG), config={"recursion_limit": iterations * 10})
+    return {
+        "layout": layout,
+        "prompt_tokens": sum(record.prompt_tokens for record in sink.records),
+        "cached_tokens": sum(record.cached_tokens for record in sink.records),
+        "completion_tokens": sum(record.completion_tokens for record in sink.records)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt cache hits of the prompt layouts")
+    parser.add_argument("--iterations", type=int, default=50, help="Rounds per story")
+    parser.add_argument("--keep-rounds", type=int, default=None,
+                        help="Fold the history into a summary, keeping this many rounds (default: never fold)")
+    parser.add_argument("--prices", type=float, nargs=3, default=[0.27, 1.1, 0.07],
+                        metavar=("INPUT", "OUTPUT", "CACHED"), help="Prices per million tokens")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(args.case, args.iterations, args.keep_rounds)))
+        return
+
+    price_in, price_out, price_cached = args.prices
+    print(f"{'layout':>8} {'prompt tok':>11} {'cached tok':>11} {'hit rate':>9} {'cost':>8}")
+    for layout in ("classic", "prefix"):
+        command = [sys.executable, "-m", "benchmarks.bench_prefix", "--case", layout,
+                   "--iterations", str(args.iterations)]
+        if args.keep_rounds:
+            command += ["--keep-rounds", str(args.keep_rounds)]
+        case = json.loads(subprocess.run(command, capture_output=True, text=True,
+                                         check=True).stdout.strip().splitlines()[-1])
+        prompt, cached = case["prompt_tokens"], case["cached_tokens"]
+        cost = ((prompt - cached) * price_in + cached * price_cached + case["completion_tokens"] * price_out) / 1e6
+        print(f"{layout:>8} {prompt:>11} {cached:>11} {cached / max(prompt, 1):>9.1%} {cost:>8.4f}")
+
+if __name__ == "__main__":
+    main()
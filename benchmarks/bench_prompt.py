@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of prompt assembly: full re-rendering of the history on every
+turn (legacy) against the incremental prompt builder.
+
+Usage: python -m benchmarks.bench_prompt [--rounds 10 100 1000]
+"""
+
+import os
+import time
+import argparse
+from typing import Callable, Dict, List
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")  # No request is ever sent
+
+from StoryAgent.agents import ActorAgent, ControllerAgent, WriterAgent, AgentState, Message
+from StoryAgent.config import ActorInfo, WorldInfo
+from benchmarks.legacy_prompts import LegacyActor, LegacyController, LegacyWriter
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+def fake_round(name: str, i: int) -> str:
+    """A typical actor response of roughly 600 characters."""
+    return (f"<think> Round {i}: {name} weighs the situation. " + "The balance is fragile. " * 6 + "</think>\n\n"
+            f"<speak> I am {name}, and this is what I have to say in round {i}. " + "We must act wisely. " * 5 + "</speak>\n\n"
+            f"<action> {name} " + "gestures slowly, " * 5 + "and waits. </action>")
+
+def load_state() -> AgentState:
+    actor_ids = sorted(f[:-5] for f in os.listdir(ACTORS_DIR) if f.endswith('.json'))
+    return AgentState(
+        messages=[],
+        actors={actor_id: ActorInfo.from_file(os.path.join(ACTORS_DIR, f"{actor_id}.json"))
+                for actor_id in actor_ids},
+        current_actor="controller",
+        world_state=WorldInfo.from_file(WORLD_CONFIG)
+    )
+
+def simulate(rounds: int, controller, actors: Dict[str, object], writer,
+             make_message: Callable[[str, str], object] = Message) -> List[str]:
+    """Render every prompt of a session with the given prompt generators."""
+    state = load_state()
+    actor_ids = list(state["actors"])
+    prompts = []
+    for i in range(rounds):
+        prompts.append(controller._gen_prompt(state))
+        actor_id = actor_ids[i % len(actor_ids)]
+        prompts.append(actors[actor_id]._gen_prompt(state))
+        name = state["actors"][actor_id].name
+        state = AgentState(
+            messages=state["messages"] + [make_message(name, fake_round(name, i))],
+            actors=state["actors"],
+            current_actor=actor_id,
+            world_state=state["world_state"]
+        )
+    prompts.append(writer._gen_prompt(state))
+    return prompts
+
+def timed(make_agents: Callable[[], tuple], rounds: int, repeat: int = 3) -> float:
+    """Best wall time of a session over several runs, each with fresh agents."""
+    best = float("inf")
+    for _ in range(repeat):
+        agents = make_agents()
+        start = time.perf_counter()
+        simulate(rounds, *agents)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt assembly micro-benchmark")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    state = load_state()
+    # The legacy renderers work on plain (sender, content) tuples
+    make_legacy = lambda: (LegacyController(),
+                           {actor_id: LegacyActor(actor_id, info) for actor_id, info in state["actors"].items()},
+                           LegacyWriter(),
+                           lambda sender, content: (sender, content))
+    make_builder = lambda: (ControllerAgent(),
+                            {actor_id: ActorAgent(actor_id, info) for actor_id, info in state["actors"].items()},
+                            WriterAgent())
+    print(f"{'rounds':>8} {'legacy (s)':>12} {'builder (s)':>12} {'speedup':>8}")
+    for rounds in args.rounds:
+        assert simulate(rounds, *make_legacy()) == simulate(rounds, *make_builder()), "prompts differ"
+        legacy_time = timed(make_legacy, rounds)
+        builder_time = timed(make_builder, rounds)
+        print(f"{rounds:>8} {legacy_time:>12.4f} {builder_time:>12.4f} {legacy_time / builder_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM calls and wall time per story for the scheduling modes of the controller,
+with the fake chat model at a fixed latency per call.
+
+Usage: python -m benchmarks.bench_schedule [--max-iterations 20] [--latency 0.1]
+"""
+
+import time
+import logging
+import argparse
+from typing import Any
+from langchain_core.callbacks import BaseCallbackHandler
+
+from StoryAgent.workflow import create_workflow, create_initial_state
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+MODES = [
+    ("llm", 1),
+    ("round_robin", 1),
+    ("round_robin", 5),
+    ("least_recent", 5),
+    ("mention", 5),
+    ("least_recent", 0),
+]
+
+class CallCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+
+    def on_chat_model_start(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduling mode benchmark")
+    parser.add_argument("--max-iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated seconds per LLM call")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'schedule':>14} {'update every':>13} {'LLM calls':>10} {'wall (s)':>9}")
+    for schedule, every in MODES:
+        app = create_workflow(ACTORS_DIR, args.max_iterations, "English", f"fake:latency={args.latency}",
+                              schedule=schedule, state_update_every=every).compile()
+        counter = CallCounter()
+        start = time.perf_counter()
+        app.invoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG),
+                   config={"recursion_limit": args.max_iterations * 10, "callbacks": [counter]})
+        wall = time.perf_counter() - start
+        print(f"{schedule:>14} {every if schedule != 'llm' else '-':>13} {counter.calls:>10} {wall:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end latency of the writer on a long transcript, writing the story in a
+single call against chapter by chapter, with the fake chat model and a
+simulated latency per call and per generated token. The chunked writer is run
+again on the same transcript, answered from its chapter cache, and on the
+transcript with a few more rounds, where only the last chapters are rewritten.
+
+Usage: python -m benchmarks.bench_writer [--rounds 200] [--extra 10] [--latency 0.5]
+                                         [--token-latency 0.005] [--chapter-tokens 3000]
+                                         [--concurrency 8] [--sync]
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List
+
+from StoryAgent.agents import AgentState, Message, WriterAgent
+from StoryAgent.agents.chapters import ChapterPlan
+from StoryAgent.agents.trace import MemoryTraceSink, Tracer
+from StoryAgent.workflow import create_workflow, create_initial_state
+
+ACTORS_DIR = "StoryAgent/config/actor_cfg"
+WORLD_CONFIG = "StoryAgent/config/world_cfg.json"
+
+def transcript(rounds: int) -> AgentState:
+    """Final state of a story of the given length, before the writer runs."""
+    app = create_workflow(ACTORS_DIR, rounds, "English", "fake").compile()
+    state = app.invoke(create_initial_state(ACTORS_DIR, WORLD_CONFIG), config={"recursion_limit": rounds * 10})
+    return {**state, "messages": state["messages"][:-1]}
+
+def write(writer: WriterAgent, state: AgentState, messages: List[Message], sync: bool) -> Dict[str, Any]:
+    sink = MemoryTraceSink()
+    tracer = Tracer([sink])
+    state = {**state, "messages": messages}
+    start = time.perf_counter()
+    if sync:
+        with tracer.span("writer", state):
+            writer(state)
+    else:
+        async def run():
+            async with tracer.aspan("writer", state):
+                await writer.acall(state)
+        asyncio.run(run())
+    record = sink.records[0]
+    return {"wall": time.perf_counter() - start, "calls": record.llm_calls,
+            "prompt": record.prompt_tokens, "output": record.completion_tokens}
+
+def main():
+    parser = argparse.ArgumentParser(description="Writer latency, single call against chapter by chapter")
+    parser.add_argument("--rounds", type=int, default=200, help="Rounds of the transcript")
+    parser.add_argument("--extra", type=int, default=10, help="Rounds added for the incremental rerun")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Simulated seconds per generated token")
+    parser.add_argument("--chapter-tokens", type=int, default=3000, help="Token budget of a chapter")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM calls of the chapter writer")
+    parser.add_argument("--sync", action="store_true", help="Run with __call__ instead of acall")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    state = transcript(args.rounds + args.extra)
+    messages = list(state["messages"])
+    model = f"fake:latency={args.latency},token_latency={args.token_latency}"
+    single = WriterAgent(lang="English", model=model)
+    chunked = WriterAgent(lang="English", model=model,
+                          chapters=ChapterPlan(token_budget=args.chapter_tokens, concurrency=args.concurrency))
+    chapters = len(chunked.chapters.split({**state, "messages": messages[:args.rounds]}))
+
+    cases = [
+        ("single call", single, args.rounds),
+        (f"{chapters} chapters", chunked, args.rounds),
+        ("chapters, rerun", chunked, args.rounds),
+        (f"chapters, +{args.extra} rounds", chunked, args.rounds + args.extra),
+    ]
+    print(f"{'writer':<24} {'rounds':>7} {'wall (s)':>9} {'speedup':>8} {'calls':>6} {'in tok':>8} {'out tok':>8}")
+    baseline = None
+    for name, writer, rounds in cases:
+        result = write(writer, state, messages[:rounds], args.sync)
+        baseline = baseline or result["wall"]
+        print(f"{name:<24} {rounds:>7} {result['wall']:>9.2f} {baseline / result['wall']:>7.2f}x "
+              f"{result['calls']:>6} {result['prompt']:>8} {result['output']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reference prompt renderers, as the agents rendered them before the
+incremental prompt builder. Used to check that the agents still produce
+byte-identical prompts.
+"""
+
+import re
+from typing import List, Tuple
+from StoryAgent.agents import AgentState
+from StoryAgent.config import ActorInfo
+
+class LegacyActor:
+    def __init__(self, actor_id: str, actor_info: ActorInfo):
+        self.actor_id = actor_id
+        self.actor_info = actor_info
+
+    def _filter_thoughts(self, messages: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Filter out the thoughts from the messages."""
+        filtered_messages = []
+        for sender, content in messages:
+            if sender == self.actor_info.name:
+                filtered_messages.append((sender, content))
+            else:
+                filtered_content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
+                filtered_messages.append((sender, filtered_content))
+        return filtered_messages
+
+    def _gen_prompt(self, state: AgentState) -> str:
+        """Generate prompt for the actor agent."""
+        prompt = f"""You are participating a role-playing game. You will be playing a character in a fictional world. You should act according to your character settings and respond to the world and other characters. Your input contains the detailed description of your character, the brief descriptions of other characters, the world state, and the conversation history. The input texts are listed below.
+        
+## Character Description
+
+{self.actor_info}
+
+## Other Characters
+
+{"\n".join(f"### {actor_info.name}\n{actor_info.brief()}\n" for actor_id, actor_info in state["actors"].items() if actor_id != self.actor_id)}
+
+## World State
+
+{state["world_state"]}
+
+## Role Play History
+
+{"\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in self._filter_thoughts(state["messages"]))}
+
+Please respond as your character, maintaining your personality traits and staying in character. Your response should be natural and engaging, reflecting your character's unique personality. Your response should also advance the overall story. In your response, you are allowed to do the following:
+
+1. Thinking. You can simulate the development of the event in your mind, or conjecture other characters' internal activities, etc. You must place your thoughts (i.e., what is going on in your own mind) in between <think> and </think> tags.
+2. Speaking. You need to speak in first person. The words you speak must be placed between <speak> and </speak> tags.
+3. Action. Besides physical actions, you can also take actions such as gestures, expressions, etc. The action you take must be placed between <action> and </action> tags.
+
+There are some IMPORTANT NOTES for you:
+1. Your thoughts are only visible to yourself, and so do other characters. Specifically, in the role-playing history, you are the only one who can see your own thoughts, and for other characters, they can only see your words and actions.
+2. Your words and actions must be consistent with your character's personality and your thoughts.
+"""
+        return prompt
+
+class LegacyController:
+    def _gen_prompt(self, state: AgentState) -> str:
+        """Generate prompt for the controller agent."""
+        prompt = f"""You are the host of a role-playing game, and you are responsible for managing the flow of the story. In this game you have a set of characters, and they are interacting with each other in a fictional world round by round. In each round, you will authorize one character depending on the situation of the story, and only this authorized character is allowed to speak or act at this round. Additionally, you also need to update the world state based on the conversation history. Your input includes the detailed description of the world, the detailed descriptions of the characters, the world state, and the role-playing history. The input texts are listed below.
+
+## Characters
+
+{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in state["actors"].items())}
+
+## World State
+
+{state["world_state"]}
+
+## Role Play History
+
+{"\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in state["messages"])}
+
+Please update the world state and select the character ID to authorize next. You can only update the \"current state\" field in the world state. You should place the updated current state in between <state> and </state> tags. You can only select the character ID from the list of characters. You should place the selected character ID in between <actor> and </actor> tags. Your output should be in the following format:
+
+<state> UPDATED_CURRENT_WORLD_STATE </state>
+<actor> CHARACTER_ID_TO_AUTHORIZE_NEXT </actor>
+
+There are some IMPORTANT NOTES for you:
+1. The \"description\" and the \"rules\" fields in the world state cannot be violated or changed. Your should only output the updated current state in the <state> tags. The state should be a complete and brief description of the current situation.
+2. You should choose the most appropriate character to respond according to the current situation. You need to ensure the coherence and interactivity of the role-playing game. You should also promote multi-party dialogue."""
+        return prompt
+
+class LegacyWriter:
+    def __init__(self, lang: str = "中文"):
+        self.lang = lang
+
+    def _gen_prompt(self, state: AgentState) -> str:
+        prompt = f"""You are a story writer. You will write a novel story based on the transcript of a role-playing game. In the role-playing game, there are several characters interacting with each other in a fictional world. In each round, only one character is allowed to speak or act. You are supposed to read the script of this whole game, and write a complete story based on the script. Your input includes the detailed description of the world, the detailed descriptions of the characters, the world state, and the role-playing history. The input texts are listed below.
+
+## Characters
+
+{"\n".join(f"### ID: {actor_id}\n{actor_info}\n" for actor_id, actor_info in state["actors"].items())}
+
+## World State
+
+{state["world_state"]}
+
+## Role Play History
+
+{"\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in state["messages"])}
+
+Please write a complete story based on the above script. You should maintain the characters' personalities. You should make the story not only interesting and vivid, but also conforming to the script.
+
+There are some IMPORTANT NOTES for you:
+1. You need to write the story in {self.lang}.
+2. You must follow the script strictly. You are not supposed to add or remove any plots into or out of the script. If you find the script not smooth enough, you can slightly modify the script to make the story smoother."""
+
+        return prompt
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local stub of an OpenAI-compatible chat completions API, answering with the fake
+chat model after a fixed latency, plain or streamed, and reporting the tokens
+of its emulated prompt cache like DeepSeek does. It counts the requests, the
+TCP connections and the peak of concurrent requests, so that connection reuse
+and concurrency limits of the clients can be checked without a provider.
+
+Usage: python -m benchmarks.stub_server [--port 8765] [--latency 0.1]
+Then e.g.: DEEPSEEK_API_KEY=stub python main.py --base-url http://127.0.0.1:8765
+"""
+
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+from StoryAgent.agents.fake_llm import FakeChatModel
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"requests": self.requests, "connections": self.connections,
+                "peak_in_flight": self.peak_in_flight}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so that reused connections show in the stats
+    server: "StubServer"
+
+    def setup(self):
+        super().setup()
+        with self.server.stats._lock:
+            self.server.stats.connections += 1
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_POST(self):
+        stats = self.server.stats
+        with stats._lock:
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = "\n".join(str(message["content"]) for message in body["messages"])
+            content = self.server.model.respond(prompt, body.get("seed"))
+            time.sleep(self.server.latency)
+            if body.get("stream"):
+                payload, content_type = self._stream_body(body["model"], content), "text/event-stream"
+            else:
+                payload, content_type = self._body(body["model"], prompt, content), "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with stats._lock:
+                stats.in_flight -= 1
+
+    def _body(self, model: str, prompt: str, content: str) -> bytes:
+        cached = self.server.model.cached_tokens(prompt)
+        return json.dumps({
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": len(prompt) // 4 + len(content) // 4,
+                      "prompt_cache_hit_tokens": cached, "prompt_cache_miss_tokens": len(prompt) // 4 - cached,
+                      "prompt_tokens_details": {"cached_tokens": cached}}
+        }).encode("utf-8")
+
+    def _stream_body(self, model: str, content: str) -> bytes:
+        def event(delta: Dict[str, str], finish_reason: Any = None) -> str:
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(chunk)}\n\n"
+        events = [event({"role": "assistant", "content": ""})]
+        events += [event({"content": token}) for token in re.findall(r"\S+\s*|\s+", content)]
+        events += [event({}, "stop"), "data: [DONE]\n\n"]
+        return "".join(events).encode("utf-8")
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, response_length: int = 60):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.model = FakeChatModel(response_length=response_length)
+        self.stats = StubStats()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start_stub_server(port: int = 0, latency: float = 0.0) -> StubServer:
+    """Start a stub server in a background thread, port 0 picks a free port."""
+    server = StubServer(("127.0.0.1", port), latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds before every response")
+    args = parser.parse_args()
+    server = StubServer(("127.0.0.1", args.port), args.latency)
+    print(f"Serving on {server.base_url}, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats.as_dict())
+
+if __name__ == "__main__":
+    main()
@@ -8,28 +8,33 @@ Main entry point for the story generation workflow.
 import os
 import logging
 import argparse
-from typing import Dict, Any
-import openai
-from langgraph.graph import StateGraph, END
-from StoryAgent.agents import ActorAgent, ControllerAgent, WriterAgent, AgentState
-from StoryAgent.config import WorldInfo, ActorInfo
-from dotenv import load_dotenv
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from typing import Any, Dict, Optional
+
+# The StoryAgent modules are imported where they are used, so that importing
+# this module or running it with --help does not load LangChain and LangGraph
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
-logger.info("Environment variables loaded")
+def init_environment(model: str):
+    """Configure logging, load the environment variables and, for the DeepSeek
+    models, the OpenAI client. Importing this module has none of these effects."""
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+    logger.info("Environment variables loaded")
 
-# Configure OpenAI client
-openai.api_key = os.getenv("DEEPSEEK_API_KEY")
-openai.base_url = "https://api.deepseek.com/"
-logger.info("OpenAI client configured with DeepSeek API")
+    # Configure OpenAI client, the offline fake model does not need it
+    if model == "fake" or model.startswith("fake:"):
+        return
+    import openai
+    openai.api_key = os.getenv("DEEPSEEK_API_KEY")
+    openai.base_url = "https://api.deepseek.com/"
+    logger.info("OpenAI client configured with DeepSeek API")
 
 def parse_args():
     """Parse command line arguments."""
@@ -50,100 +55,233 @@ def parse_args():
     parser.add_argument('--model',
                       default="deepseek-chat",
                       help='LLM model to use for all agents (default: deepseek-chat)')
-    return parser.parse_args()
+    parser.add_argument('--base-url',
+                      default=None,
+                      help='Base URL of the OpenAI-compatible API of the model (default: the provider API)')
+    parser.add_argument('--max-connections',
+                      type=int,
+                      default=64,
+                      help='Connections of the HTTP pool shared by all agents and stories, bounds the concurrent LLM requests (default: 64)')
+    parser.add_argument('--requests-per-second',
+                      type=float,
+                      default=None,
+                      help='Limit the LLM requests of the whole process to this rate (default: no limit)')
+    parser.add_argument('--async',
+                      dest='use_async',
+                      action='store_true',
+                      help='Run the workflow on an event loop with asynchronous LLM calls')
+    parser.add_argument('--batch',
+                      metavar='MANIFEST',
+                      help='Generate the stories of a JSONL manifest (world_config, actors_dir, language, max_iterations, seed per line)')
+    parser.add_argument('--output',
+                      default="stories.jsonl",
+                      help='JSONL file the batch stories are appended to (default: stories.jsonl)')
+    parser.add_argument('--concurrency',
+                      type=int,
+                      default=8,
+                      help='Maximum number of stories generated at once in batch mode (default: 8)')
+    parser.add_argument('--job-timeout',
+                      type=float,
+                      default=None,
+                      help='Timeout in seconds of a single story in batch mode')
+    parser.add_argument('--enqueue',
+                      metavar='MANIFEST',
+                      help='Add the jobs of a JSONL manifest (like --batch) to the job queue of --queue')
+    parser.add_argument('--worker',
+                      action='store_true',
+                      help='Work off the job queue of --queue with a pool of --workers processes, each running up to --concurrency stories at once')
+    parser.add_argument('--queue',
+                      default=".story_queue.sqlite",
+                      help='SQLite file of the job queue (default: .story_queue.sqlite)')
+    parser.add_argument('--results',
+                      default=".story_results.sqlite",
+                      help='SQLite file the stories of the worker mode are stored in, compressed (default: .story_results.sqlite)')
+    parser.add_argument('--workers',
+                      type=int,
+                      default=os.cpu_count() or 1,
+                      help='Number of worker processes (default: the number of CPUs)')
+    parser.add_argument('--max-attempts',
+                      type=int,
+                      default=3,
+                      help='Times a queued job is tried before it is recorded as failed (default: 3)')
+    parser.add_argument('--heartbeat',
+                      type=float,
+                      default=10.0,
+                      help='Seconds between the heartbeats of the workers; a job without a heartbeat for six times as long is run again by another worker (default: 10)')
+    parser.add_argument('--cache',
+                      choices=["none", "memory", "sqlite", "tiered"],
+                      default="none",
+                      help='Cache LLM responses by model, temperature and prompt (default: none)')
+    parser.add_argument('--cache-path',
+                      default=".story_cache.sqlite",
+                      help='SQLite file of the sqlite and tiered caches (default: .story_cache.sqlite)')
+    parser.add_argument('--cache-size',
+                      type=int,
+                      default=10000,
+                      help='Maximum number of cached responses per tier (default: 10000)')
+    parser.add_argument('--cache-max-age',
+                      type=float,
+                      default=None,
+                      help='Maximum age of cached responses in seconds (default: no limit)')
+    parser.add_argument('--history-keep-rounds',
+                      type=int,
+                      default=None,
+                      help='Fold the role play history into a rolling summary, keeping this many recent rounds verbatim (default: never fold)')
+    parser.add_argument('--history-token-budget',
+                      type=int,
+                      default=4000,
+                      help='Estimated tokens of verbatim history above which older rounds are folded (default: 4000)')
+    parser.add_argument('--schedule',
+                      choices=["llm", "round_robin", "least_recent", "mention"],
+                      default="llm",
+                      help='How the next actor is picked: by the controller LLM, or by a local policy without an LLM call (default: llm)')
+    parser.add_argument('--state-update-every',
+                      type=int,
+                      default=1,
+                      help='With a local schedule, update the world state with the LLM every M rounds, 0 for never (default: 1)')
+    parser.add_argument('--parallel-actors',
+                      type=int,
+                      default=1,
+                      help='Let the controller authorize up to K actors to act at the same time in a round, their LLM calls running concurrently (default: 1)')
+    parser.add_argument('--prompt-layout',
+                      choices=["classic", "prefix"],
+                      default="classic",
+                      help='Order of the prompt sections: "prefix" puts the sections fixed for a story first and the current state last, so that the prompts share a long prefix for the prompt cache of the provider (default: classic)')
+    parser.add_argument('--parse-retries',
+                      type=int,
+                      default=2,
+                      help='Times a malformed controller output is retried with a short repair prompt before falling back (default: 2)')
+    parser.add_argument('--chapter-tokens',
+                      type=int,
+                      default=None,
+                      help='Write transcripts longer than this many estimated tokens chapter by chapter, the chapters drafted concurrently (default: write the whole story in one call)')
+    parser.add_argument('--chapter-concurrency',
+                      type=int,
+                      default=4,
+                      help='Maximum number of concurrent LLM calls of the chapter writer (default: 4)')
+    parser.add_argument('--chapter-cache',
+                      default=".story_chapters.sqlite",
+                      help='SQLite file caching the chapters, so that a rerun only rewrites the chapters that changed, "none" to keep them in memory (default: .story_chapters.sqlite)')
+    parser.add_argument('--stream',
+                      action='store_true',
+                      help='Stream the responses of the actors and the writer to the console as they are generated')
+    parser.add_argument('--stream-file',
+                      default=None,
+                      help='Append the streamed responses of the actors and the writer to this file')
+    parser.add_argument('--trace',
+                      action='store_true',
+                      help='Trace the time, tokens and prompt size of every node, and print a report per node at the end')
+    parser.add_argument('--trace-file',
+                      default=None,
+                      help='Append the trace records to this JSONL file, one line per node run (implies --trace)')
+    parser.add_argument('--token-prices',
+                      type=float,
+                      nargs='+',
+                      metavar='PRICE',
+                      default=None,
+                      help='Prices per million input and output tokens, and optionally cached input tokens, to add the cost to the trace report')
+    parser.add_argument('--thread-id',
+                      default=None,
+                      help='Checkpoint the story under this thread ID after every node, so that it can be resumed')
+    parser.add_argument('--resume',
+                      action='store_true',
+                      help='Continue the story of --thread-id from its last checkpoint instead of starting it')
+    parser.add_argument('--checkpoint-db',
+                      default=".story_checkpoints.sqlite",
+                      help='SQLite file of the checkpoints (default: .story_checkpoints.sqlite)')
+    args = parser.parse_args()
+    if args.resume and args.thread_id is None:
+        parser.error("--resume requires --thread-id")
+    if args.worker and (args.stream or args.stream_file or args.trace or args.trace_file):
+        parser.error("--worker does not support streaming or tracing")
+    if args.batch and (args.stream or args.stream_file):
+        # The responses of concurrent stories would be interleaved under the same agent names
+        parser.error("--batch does not support streaming")
+    if args.workers < 1 or args.max_attempts < 1:
+        parser.error("--workers and --max-attempts must be at least 1")
+    if args.parallel_actors < 1:
+        parser.error("--parallel-actors must be at least 1")
+    if args.chapter_tokens is not None and args.chapter_tokens < 1:
+        parser.error("--chapter-tokens must be at least 1")
+    if args.chapter_concurrency < 1:
+        parser.error("--chapter-concurrency must be at least 1")
+    if args.token_prices is not None and len(args.token_prices) not in (2, 3):
+        parser.error("--token-prices takes the INPUT and OUTPUT prices, and optionally the CACHED price")
+    return args
 
-def should_continue(state: AgentState, writer_id: str, max_iter: int = 3) -> bool:
-    """Determine if the conversation should continue."""
-    # Count only the messages from acting agents (excluding the writer's message)
-    acting_messages = [msg for msg in state["messages"] if writer_id != msg[0]]
-    
-    # If we've already written the story, end the workflow
-    if any(writer_id == msg[0] for msg in state["messages"]):
-        logger.info("Story has been written, ending workflow")
-        return False
-    
-    # If we've reached max iterations, go to writer
-    if len(acting_messages) >= max_iter:
-        logger.info(f"Reached max iterations ({max_iter}), proceeding to writer")
-        return False
-    
-    # Otherwise, continue with acting agents
-    logger.info(f"Continuing with acting agents. Current iteration: {len(acting_messages)}/{max_iter}")
-    return True
+def workflow_options(args: argparse.Namespace, tracer: Any = None) -> Dict[str, Any]:
+    """Options of create_workflow taken from the command line."""
+    from StoryAgent.agents.chapters import ChapterPlan
+    from StoryAgent.agents.history import HistoryWindow
+    from StoryAgent.agents.stream import ConsoleSink, FileSink
 
-def create_workflow(actors_dir: str, max_iter: int, lang: str, model: str) -> StateGraph:
-    """Create the story generation workflow."""
-    logger.info("Starting story generation workflow")
-    
-    # Get actor configurations
-    actor_files = [f for f in os.listdir(actors_dir) if f.endswith('.json')]
-    actor_ids = [f[:-5] for f in actor_files]  # Remove .json extension
-    logger.info(f"Found {len(actor_ids)} actors: {', '.join(actor_ids)}")
-    
-    # Create the graph
-    workflow = StateGraph(AgentState)
-    logger.info("Created state graph")
-    
-    # Add nodes for each agent
-    for actor_id in actor_ids:
-        actor_info = ActorInfo.from_file(os.path.join(actors_dir, f"{actor_id}.json"))
-        workflow.add_node(actor_id, ActorAgent(actor_id, actor_info, model=model))
-        logger.debug(f"Added node for actor: {actor_id}")
-    
-    # Add controller and writer nodes
-    workflow.add_node("controller", ControllerAgent(model=model))
-    writer = WriterAgent(lang=lang, model=model)
-    writer_id = writer.writer_id
-    workflow.add_node("writer", writer)
-    logger.info(f"Added all nodes to workflow with model: {model}")
-    
-    # Set the entry point
-    workflow.set_entry_point("controller")
-    logger.debug("Set controller as entry point")
-    
-    # Add conditional edges for each actor
-    for actor_id in actor_ids:
-        workflow.add_conditional_edges(
-            actor_id,
-            lambda state, writer_id=writer_id, max_iter=max_iter: should_continue(state, writer_id, max_iter),
-            {
-                True: "controller",  # Continue with acting agents
-                False: "writer"      # Go to writer when max iterations reached
-            }
-        )
-        logger.debug(f"Added conditional edges for actor: {actor_id}")
-    
-    # Add edge from controller to actors
-    workflow.add_conditional_edges(
-        "controller",
-        lambda x: x["current_actor"],
-        {actor_id: actor_id for actor_id in actor_ids}
-    )
-    logger.debug("Added edges from controller to actors")
-    
-    # Add edge from writer to end
-    workflow.add_edge("writer", END)
-    logger.debug("Added edge from writer to end")
-    
-    return workflow
+    history_window = None
+    if args.history_keep_rounds is not None:
+        history_window = HistoryWindow(keep_rounds=args.history_keep_rounds,
+                                       token_budget=args.history_token_budget)
+    chapters = None
+    if args.chapter_tokens is not None:
+        chapters = ChapterPlan(token_budget=args.chapter_tokens,
+                               concurrency=args.chapter_concurrency,
+                               cache_path=None if args.chapter_cache == "none" else args.chapter_cache)
+    sinks = []
+    if args.stream:
+        sinks.append(ConsoleSink())
+    if args.stream_file:
+        sinks.append(FileSink(args.stream_file))
+    return {
+        "history_window": history_window,
+        "schedule": args.schedule,
+        "state_update_every": args.state_update_every,
+        "parse_retries": args.parse_retries,
+        "prompt_layout": args.prompt_layout,
+        "max_parallel": args.parallel_actors,
+        "chapters": chapters,
+        "sinks": sinks,
+        "tracer": tracer
+    }
+
+def story_input(args: argparse.Namespace, snapshot: Any) -> Optional[Dict[str, Any]]:
+    """Input of a checkpointed run: the initial state of a new story, or None to
+    continue the story from the last checkpoint of its thread."""
+    if args.resume:
+        if not snapshot.values:
+            logger.error(f"No checkpoint of thread {args.thread_id} in {args.checkpoint_db}")
+            raise SystemExit(2)
+        if not snapshot.next:
+            logger.info(f"Story of thread {args.thread_id} is already complete")
+        else:
+            logger.info(f"Resuming thread {args.thread_id} at {', '.join(snapshot.next)} "
+                        f"after {len(snapshot.values['messages'])} rounds")
+        return None
+    if snapshot.values:
+        logger.error(f"Thread {args.thread_id} already has checkpoints, "
+                     f"use --resume or a new thread ID")
+        raise SystemExit(2)
+    from StoryAgent.workflow import create_initial_state
+    return create_initial_state(args.actors_dir, args.world_config)
+
+def run(args: argparse.Namespace, options: Dict[str, Any]):
+    """Synchronous entry point, runs the workflow with invoke and the options of workflow_options."""
+    from StoryAgent.workflow import create_workflow, create_initial_state
+    from StoryAgent.checkpoint import sqlite_checkpointer, thread_config
 
-def main():
-    """Main entry point for the story generation system."""
-    # Parse command line arguments
-    args = parse_args()
-    
     # Create workflow
-    workflow = create_workflow(args.actors_dir, args.max_iterations, args.language, args.model)
+    workflow = create_workflow(args.actors_dir, args.max_iterations, args.language, args.model,
+                               **options)
+    recursion_limit = args.max_iterations * 10
+
+    if args.thread_id is not None:
+        with sqlite_checkpointer(args.checkpoint_db) as checkpointer:
+            app = workflow.compile(checkpointer=checkpointer)
+            config = thread_config(args.thread_id, recursion_limit)
+            logger.info(f"Starting workflow execution, checkpointed as thread {args.thread_id}")
+            result = app.invoke(story_input(args, app.get_state(config)), config=config)
+            logger.info("Workflow execution completed")
+            return result
     
     # Initialize state
-    actor_ids = [f[:-5] for f in os.listdir(args.actors_dir) if f.endswith('.json')]
-    initial_state = AgentState(
-        messages=[],
-        actors={actor_id: ActorInfo.from_file(os.path.join(args.actors_dir, f"{actor_id}.json")) 
-               for actor_id in actor_ids},
-        current_actor="controller",
-        world_state=WorldInfo.from_file(args.world_config)
-    )
+    initial_state = create_initial_state(args.actors_dir, args.world_config)
     
     # Compile and run the workflow
     app = workflow.compile()
@@ -153,11 +291,126 @@ def main():
     logger.info("Starting workflow execution")
     result = app.invoke(
         initial_state,
-        config={"recursion_limit": args.max_iterations * 10}
+        config={"recursion_limit": recursion_limit}
     )
     logger.info("Workflow execution completed")
 
-    # logger.info("All messages:\n\n" + "\n".join(f"### {sender}'s Round\n{content}\n" for sender, content in result["messages"]))
+    # logger.info("All messages:\n\n" + "\n".join(f"### {msg.sender}'s Round\n{msg.content}\n" for msg in result["messages"]))
+    return result
+
+async def amain(args: argparse.Namespace, options: Dict[str, Any]):
+    """Asynchronous entry point, runs the workflow with ainvoke and the options of workflow_options."""
+    from StoryAgent.workflow import create_workflow, create_initial_state
+    from StoryAgent.checkpoint import async_sqlite_checkpointer, thread_config
+
+    workflow = create_workflow(args.actors_dir, args.max_iterations, args.language, args.model,
+                               **options)
+    recursion_limit = args.max_iterations * 10
+
+    if args.thread_id is not None:
+        async with async_sqlite_checkpointer(args.checkpoint_db) as checkpointer:
+            app = workflow.compile(checkpointer=checkpointer)
+            config = thread_config(args.thread_id, recursion_limit)
+            logger.info(f"Starting asynchronous workflow execution, checkpointed as thread {args.thread_id}")
+            result = await app.ainvoke(story_input(args, await app.aget_state(config)), config=config)
+            logger.info("Workflow execution completed")
+            return result
+
+    initial_state = create_initial_state(args.actors_dir, args.world_config)
+
+    app = workflow.compile()
+    logger.info("Workflow compiled successfully")
+
+    logger.info("Starting asynchronous workflow execution")
+    result = await app.ainvoke(
+        initial_state,
+        config={"recursion_limit": recursion_limit}
+    )
+    logger.info("Workflow execution completed")
+    return result
+
+def farm(args: argparse.Namespace, options: Dict[str, Any]):
+    """Queue entry point: add the jobs of a manifest to the queue, and/or work
+    off the queue with a pool of worker processes."""
+    from StoryAgent.agents.llm import get_client_options
+    from StoryAgent.farm import FarmSettings, JobQueue, enqueue_manifest, run_farm, summarize_workers
+
+    if args.enqueue:
+        queue = JobQueue(args.queue)
+        enqueue_manifest(queue, args.enqueue)
+        queue.close()
+    if args.worker:
+        settings = FarmSettings(
+            queue_path=args.queue,
+            results_path=args.results,
+            model=args.model,
+            concurrency=args.concurrency,
+            job_timeout=args.job_timeout,
+            heartbeat=args.heartbeat,
+            lease=args.heartbeat * 6,
+            max_attempts=args.max_attempts,
+            client_options=get_client_options(),
+            cache=None if args.cache == "none" else (args.cache, args.cache_path, args.cache_size, args.cache_max_age),
+            workflow_options=options
+        )
+        print(summarize_workers(run_farm(settings, args.workers)))
+
+def main():
+    """Main entry point for the story generation system."""
+    # Parse command line arguments
+    args = parse_args()
+    init_environment(args.model)
+    if not (args.batch or args.enqueue or args.worker):
+        # Fail before any LLM call, the parsed configs are cached for the run
+        from StoryAgent.config import ConfigError, load_cast, load_world
+        try:
+            load_cast(args.actors_dir)
+            if not args.resume:
+                load_world(args.world_config)
+        except ConfigError as e:
+            logger.error(f"Invalid configuration - {e}")
+            raise SystemExit(2)
+
+    import asyncio
+    from StoryAgent.agents.cache import create_cache
+    from StoryAgent.agents.llm import ClientOptions, set_client_options, set_response_cache
+    set_client_options(ClientOptions(base_url=args.base_url,
+                                     max_connections=args.max_connections,
+                                     max_keepalive_connections=args.max_connections,
+                                     requests_per_second=args.requests_per_second))
+    cache = create_cache(args.cache, args.cache_path, args.cache_size, args.cache_max_age)
+    set_response_cache(cache)
+    tracer = None
+    if args.trace or args.trace_file:
+        from StoryAgent.agents.trace import Tracer, MemoryTraceSink, JsonlTraceSink, summarize
+        # The in-memory sink comes first, the report is made from it
+        tracer = Tracer([MemoryTraceSink()] + ([JsonlTraceSink(args.trace_file)] if args.trace_file else []))
+    options = workflow_options(args, tracer)
+    try:
+        if args.enqueue or args.worker:
+            farm(args, options)
+        elif args.batch:
+            from StoryAgent.batch import run_batch
+            asyncio.run(run_batch(args.batch, args.output, model=args.model,
+                                  concurrency=args.concurrency, job_timeout=args.job_timeout,
+                                  **options))
+        elif args.use_async:
+            asyncio.run(amain(args, options))
+        else:
+            run(args, options)
+    finally:
+        from StoryAgent.agents.chapters import close_chapter_caches
+        from StoryAgent.agents.parser import parse_metrics
+        close_chapter_caches()
+        for sink in options["sinks"]:
+            sink.close()
+        logger.info(f"Output parsing: {parse_metrics.snapshot()}")
+        if cache is not None:
+            logger.info(f"Response cache ({args.cache}): {cache.stats()}")
+            cache.close()
+        if tracer is not None:
+            tracer.close()
+            print(summarize(tracer.sinks[0].records, args.token_prices))
 
 if __name__ == "__main__":
     main()